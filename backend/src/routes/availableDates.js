@@ -7,6 +7,7 @@ import dayjs from 'dayjs';
 import utc from 'dayjs/plugin/utc.js';
 import customParse from 'dayjs/plugin/customParseFormat.js';
 import { DATA_DIR } from '../config.js';
+import { isCsvFile, openCsvStream, readFreshManifest } from '../utils/csvLoader.js';
 
 dayjs.extend(utc);
 dayjs.extend(customParse);
@@ -35,13 +36,27 @@ router.get('/', async (req, res) => {
         if (!fs.existsSync(DATA_DIR)) {
             return res.json({ min_date: null, max_date: null });
         }
-        const files = fs.readdirSync(DATA_DIR).filter(f => f.toLowerCase().endsWith('.csv'));
+        const files = fs.readdirSync(DATA_DIR).filter(isCsvFile);
         let min = null; let max = null;
 
         for (const file of files) {
             const filePath = path.join(DATA_DIR, file);
+
+            // 清单有效时直接使用预先统计的时间范围，不再逐行读取
+            const manifest = readFreshManifest(filePath);
+            if (manifest) {
+                const lo = manifest.min_created_at ? dayjs.utc(manifest.min_created_at) : null;
+                const hi = manifest.max_created_at ? dayjs.utc(manifest.max_created_at) : null;
+                if (lo && (!min || lo.isBefore(min))) min = lo;
+                if (hi && (!max || hi.isAfter(max))) max = hi;
+                continue;
+            }
+
+            const input = openCsvStream(filePath);
+            if (!input) continue;
             await new Promise((resolve, reject) => {
-                fs.createReadStream(filePath)
+                input
+                    .on('error', reject)
                     .pipe(csv())
                     .on('data', (row) => {
                         const raw = (row.created_at ?? row.timestamp ?? row.date ?? '').toString();
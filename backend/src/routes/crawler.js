@@ -1,41 +1,194 @@
 // backend/src/routes/crawler.js
 import express from "express";
 import { spawn } from "child_process";
+import { randomUUID } from "crypto";
 import path from "path";
 
 const router = express.Router();
 
+// 爬虫任务：由常驻的 Python worker（--worker）逐个执行，标准输入写入任务，
+// 标准输出每行一个带 job 字段的进度事件，标准错误为普通日志
+const jobs = new Map();
+const MAX_JOB_EVENTS = 200; // 每个任务保留的最近事件数（新连接的订阅者先收到这些事件）
+const MAX_FINISHED_JOBS = 20; // 保留的已结束任务数
+const WORKER_ACK_TIMEOUT_MS = 10000; // 等待 worker 确认接收任务的最长时间（含首次启动）
+
+// 你的爬虫脚本路径
+const scriptPath = path.join(process.cwd(), "src", "scripts", "extract_chat_from_forum.py");
+
+function isActive(job) {
+    return job.status === "queued" || job.status === "running";
+}
+
+function pruneJobs() {
+    const finished = [...jobs.values()].filter((job) => !isActive(job));
+    for (const job of finished.slice(0, Math.max(0, finished.length - MAX_FINISHED_JOBS))) {
+        jobs.delete(job.id);
+    }
+}
+
+function publish(job, event) {
+    job.events.push(event);
+    if (job.events.length > MAX_JOB_EVENTS) job.events.shift();
+    // 每个帖子只保留最新的进度，供 GET /jobs/:id 查询
+    if (event.topic) job.topics[event.topic] = { ...job.topics[event.topic], [event.type]: event };
+    if (event.type === "done") job.summary = event;
+    for (const res of job.listeners) res.write(`event: ${event.type}\ndata: ${JSON.stringify(event)}\n\n`);
+}
+
+function finish(job, status) {
+    job.status = status;
+    for (const res of job.listeners) res.end();
+    job.listeners.clear();
+    pruneJobs();
+}
+
+function snapshot(job) {
+    const { id, status, startedAt, topics, summary } = job;
+    return { id, status, startedAt, topics, summary };
+}
+
+// 常驻 worker：首次使用时启动，退出后下次提交任务时重新启动
+let worker = null;
+
+function handleWorkerEvent(event) {
+    const job = jobs.get(event.job);
+    if (!job) return;
+    if (event.type === "job_queued" || event.type === "job_rejected") {
+        job.ack?.(event);
+        job.ack = null;
+    }
+    if (event.type === "job_started") job.status = "running";
+    publish(job, event);
+    if (event.type === "job_rejected") finish(job, "rejected");
+    if (event.type === "job_finished") finish(job, event.status);
+}
+
+function getWorker() {
+    if (worker) return worker;
+    console.log("[Crawler] 启动常驻爬虫 worker");
+    const proc = spawn("python", [scriptPath, "--worker"]);
+    const current = { proc, send: (message) => proc.stdin.write(`${JSON.stringify(message)}\n`) };
+    worker = current;
+
+    // 标准输出：按行解析事件（一次 data 可能包含半行，剩余部分留到下一次）
+    let pending = "";
+    proc.stdout.on("data", (data) => {
+        pending += data.toString();
+        const lines = pending.split("\n");
+        pending = lines.pop();
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            try {
+                handleWorkerEvent(JSON.parse(line));
+            } catch {
+                console.log(`[Crawler] ${line.trim()}`);
+            }
+        }
+    });
+
+    proc.stderr.on("data", (data) => {
+        console.log(`[Crawler] ${data.toString().trim()}`);
+    });
+
+    proc.stdin.on("error", (err) => console.log(`[Crawler] 写入 worker 失败: ${err.message}`));
+    proc.on("error", (err) => console.log(`[Crawler] 无法启动 worker: ${err.message}`));
+    proc.on("close", (code) => {
+        console.log(`[Crawler] worker 退出，代码: ${code}`);
+        if (worker === current) worker = null;
+        // worker 意外退出：未结束的任务全部标记为失败
+        for (const job of jobs.values()) {
+            if (!isActive(job) || job.worker !== current) continue;
+            job.ack?.({ type: "job_rejected", reason: "worker 已退出" });
+            job.ack = null;
+            publish(job, { type: "job_finished", job: job.id, status: "failed", reason: `worker 退出（${code}）` });
+            finish(job, "failed");
+        }
+    });
+    return current;
+}
+
 // POST /api/crawl
 router.post("/", async (req, res) => {
-    const { url } = req.body;
-    if (!url) {
+    const { url, urls, resume, discover, transport } = req.body;
+    // 多个帖子作为同一个任务批量抓取，共用一份请求配额
+    const targets = Array.isArray(urls) && urls.length ? urls : url ? [url] : [];
+    if (!targets.length && !discover) {
         return res.status(400).json({ ok: false, error: "缺少 URL 参数" });
     }
 
-    // 你的爬虫脚本路径
-    const scriptPath = path.join(process.cwd(), "src", "scripts", "extract_chat_from_forum.py");
-
-    console.log(`[Crawler] 启动爬虫: ${url}`);
-    const pythonProcess = spawn("python", [scriptPath, url]);
+    console.log(`[Crawler] 提交任务: ${discover ? "自动发现新备份帖" : targets.join(", ")}`);
+    const current = getWorker();
+    const job = {
+        id: randomUUID(),
+        status: "queued",
+        startedAt: new Date().toISOString(),
+        topics: {},
+        summary: null,
+        events: [],
+        listeners: new Set(),
+        worker: current,
+        ack: null,
+    };
+    jobs.set(job.id, job);
 
-    let logs = [];
-    pythonProcess.stdout.on("data", (data) => {
-        const msg = data.toString();
-        logs.push(msg);
-        console.log(`[Crawler] ${msg.trim()}`);
+    const ack = await new Promise((resolve) => {
+        const timer = setTimeout(() => resolve({ type: "job_rejected", reason: "worker 未响应" }), WORKER_ACK_TIMEOUT_MS);
+        job.ack = (event) => {
+            clearTimeout(timer);
+            resolve(event);
+        };
+        // discover 为 true 时使用默认列表页，也可传入列表页 URL
+        current.send({
+            op: "crawl",
+            job: job.id,
+            urls: targets,
+            discover: discover || null,
+            resume: Boolean(resume),
+            transport: transport === "json" ? "json" : "html",
+        });
     });
 
-    pythonProcess.stderr.on("data", (data) => {
-        const msg = data.toString();
-        logs.push(msg);
-        console.error(`[Crawler ERR] ${msg.trim()}`);
+    if (ack.type !== "job_queued") {
+        if (isActive(job)) finish(job, "rejected");
+        return res.status(503).json({ ok: false, jobId: job.id, error: ack.reason || "爬虫繁忙，请稍后再试" });
+    }
+    res.json({
+        ok: true,
+        jobId: job.id,
+        position: ack.position,
+        message: "任务已提交，可通过 /jobs/:id/events 订阅进度",
+        logs: [],
     });
+});
 
-    pythonProcess.on("close", (code) => {
-        console.log(`[Crawler] 爬虫进程退出，代码: ${code}`);
-    });
+// POST /api/crawl/jobs/:id/cancel —— 取消排队中或进行中的任务（进行中的任务会保存断点，可用 resume 继续）
+router.post("/jobs/:id/cancel", (req, res) => {
+    const job = jobs.get(req.params.id);
+    if (!job) return res.status(404).json({ ok: false, error: "任务不存在" });
+    if (!isActive(job)) return res.json({ ok: true, status: job.status });
+    if (job.worker !== worker) return res.status(409).json({ ok: false, error: "任务所在的 worker 已退出" });
+    job.worker.send({ op: "cancel", job: job.id });
+    res.json({ ok: true, status: "cancelling" });
+});
+
+// GET /api/crawl/jobs/:id —— 任务状态与各帖子的最新进度
+router.get("/jobs/:id", (req, res) => {
+    const job = jobs.get(req.params.id);
+    if (!job) return res.status(404).json({ ok: false, error: "任务不存在" });
+    res.json({ ok: true, ...snapshot(job) });
+});
 
-    res.json({ ok: true, message: "爬虫已启动，日志将在控制台输出", logs });
+// GET /api/crawl/jobs/:id/events —— Server-Sent Events：先补发最近的事件，之后实时推送，任务结束时关闭
+router.get("/jobs/:id/events", (req, res) => {
+    const job = jobs.get(req.params.id);
+    if (!job) return res.status(404).json({ ok: false, error: "任务不存在" });
+    res.set({ "Content-Type": "text/event-stream", "Cache-Control": "no-cache", Connection: "keep-alive" });
+    res.flushHeaders();
+    for (const event of job.events) res.write(`event: ${event.type}\ndata: ${JSON.stringify(event)}\n\n`);
+    if (!isActive(job)) return res.end();
+    job.listeners.add(res);
+    req.on("close", () => job.listeners.delete(res));
 });
 
 export default router;
@@ -0,0 +1,125 @@
+# bench_extract.py
+# 解析后端一致性检查 + 解析吞吐基准（离线运行，不访问网络）
+#
+# 用法：
+#   python bench_extract.py                      # 合成页面：先做一致性检查，再测吞吐
+#   python bench_extract.py --html-dir ./pages   # 额外加入录制下来的楼层 HTML（*.html）
+#   python bench_extract.py --check-only         # 只做一致性检查（有差异时退出码为 1）
+#
+# 一致性检查以原始实现（bs4 后端：html.parser 整棵文档树）为基准，
+# 要求其他后端解析出的消息记录与标题逐字节相同。
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import extract_chat_from_forum as crawler
+import forum_fixtures
+
+
+def available_backends():
+    backends = ["bs4", "strainer"]
+    try:
+        import lxml  # noqa: F401
+
+        backends.append("lxml")
+    except ImportError:
+        print("未安装 lxml，跳过 lxml 后端（pip install lxml）")
+    return backends
+
+
+def load_pages(floors, html_dir):
+    pages = forum_fixtures.tricky_pages() + forum_fixtures.synthetic_pages(floors)
+    if html_dir:
+        for path in sorted(glob.glob(os.path.join(html_dir, "*.html"))):
+            with open(path, encoding="utf-8") as f:
+                pages.append(f.read())
+    return pages
+
+
+def reference_title(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.title.string if soup.title else None
+
+
+def check_conformance(pages, backends):
+    """逐页比较各后端与原始实现的输出，返回差异数"""
+    failures = 0
+    for i, html in enumerate(pages):
+        expected = crawler.parse_chat_transcripts(html, backend="bs4")
+        for backend in backends:
+            if backend == "bs4":
+                continue
+            actual = crawler.parse_chat_transcripts(html, backend=backend)
+            if actual != expected:
+                failures += 1
+                print(f"❌ [{backend}] 第 {i} 页解析结果不一致")
+                for a, e in zip(actual, expected):
+                    if a != e:
+                        print(f"   期望: {e}\n   实际: {a}")
+                        break
+                else:
+                    print(f"   记录数不同：期望 {len(expected)}，实际 {len(actual)}")
+        expected_title = reference_title(html)
+        if crawler.extract_title(html) != expected_title:
+            failures += 1
+            print(f"❌ [title] 第 {i} 页标题不一致：期望 {expected_title!r}，实际 {crawler.extract_title(html)!r}")
+    return failures
+
+
+def bench_backend(backend, pages, min_seconds):
+    """反复解析全部页面，直到累计耗时超过 min_seconds，返回（页/秒，MB/秒，消息/秒）"""
+    total_bytes = sum(len(p.encode("utf-8")) for p in pages)
+    rounds = 0
+    messages = 0
+    started = time.perf_counter()
+    while True:
+        for html in pages:
+            messages += len(crawler.parse_chat_transcripts(html, backend=backend))
+        rounds += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            break
+    return (
+        rounds * len(pages) / elapsed,
+        rounds * total_bytes / elapsed / 1024 / 1024,
+        messages / elapsed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析后端一致性检查与吞吐基准")
+    parser.add_argument("--floors", type=int, default=200, help="合成楼层页数量")
+    parser.add_argument("--html-dir", help="录制的楼层 HTML 目录（*.html）")
+    parser.add_argument("--seconds", type=float, default=3.0, help="每个后端的最短测量时间")
+    parser.add_argument("--check-only", action="store_true", help="只做一致性检查")
+    args = parser.parse_args()
+
+    backends = available_backends()
+    pages = load_pages(args.floors, args.html_dir)
+    print(f"共 {len(pages)} 页，解析后端: {', '.join(backends)}")
+
+    failures = check_conformance(pages, backends)
+    if failures:
+        print(f"一致性检查失败：{failures} 处差异")
+        sys.exit(1)
+    print("✅ 一致性检查通过：各后端输出与原始实现逐字节一致")
+    if args.check_only:
+        return
+
+    baseline = None
+    for backend in backends:
+        pages_per_sec, mb_per_sec, msgs_per_sec = bench_backend(backend, pages, args.seconds)
+        baseline = baseline or pages_per_sec
+        print(
+            f"{backend:>9}: {pages_per_sec:8.1f} 页/秒  {mb_per_sec:6.2f} MB/秒  "
+            f"{msgs_per_sec:9.0f} 条消息/秒  相对 bs4 {pages_per_sec / baseline:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# bench_suite.py
+# 解析与后处理热点的离线微基准（合成或录制的楼层 HTML，不访问网络）：
+# parse_chat_transcripts、extract_post_title_and_yyyymm、simplify_title_for_filename + sanitize_filename、
+# deduplicate_records 与 CSV 写出（CsvStreamWriter），各自按 10 ~ 5000 个楼层的规模测量
+# 吞吐（楼层/秒）、内存分配（tracemalloc 峰值与保留量）与进程峰值内存，结果写成 JSON，
+# 并与保存的基线比较，解析器或写出逻辑的性能退化直接体现为数字。
+#
+# 用法：
+#   python bench_suite.py                          # 全部用例，规模 10,100,1000,5000
+#   python bench_suite.py --scales 10,100 --cases parse,csv
+#   python bench_suite.py --html-dir ./pages       # 用录制的楼层 HTML（*.html）代替合成页面
+#   python bench_suite.py --save-baseline          # 本次结果另存为基线
+#   python bench_suite.py --tolerance 0.3          # 与基线比较时允许的退化比例（默认 0.2），超出时退出码为 1
+#
+# 结果默认写入 backend/data/.metrics/bench-results.json，基线为同目录下的 bench-baseline.json（存在时自动比较）。
+# 吞吐与机器相关，基线应在同一台机器上生成。
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import extract_chat_from_forum as crawler
+import forum_fixtures
+from crawl_metrics import peak_memory_mb
+
+METRICS_DIR = os.path.join(crawler.INPUT_DIR, ".metrics")
+RESULTS_PATH = os.path.join(METRICS_DIR, "bench-results.json")
+BASELINE_PATH = os.path.join(METRICS_DIR, "bench-baseline.json")
+RESULTS_VERSION = 1
+DEFAULT_SCALES = (10, 100, 1000, 5000)
+WINDOW = 20  # 每个楼层页渲染的楼层数（同一窗口内的楼层页内容相同）
+MIN_ALLOC_DELTA_KB = 64  # 分配量变化小于此值时不算退化（避免小规模用例的噪声）
+
+
+class Fixtures:
+    """按楼层数生成各用例的输入；同一窗口的楼层共用同一个页面与解析结果，5000 个楼层也只占几十 MB"""
+
+    def __init__(self, per_post=5, html_dir=None):
+        self.per_post = per_post
+        self.recorded = []
+        if html_dir:
+            for path in sorted(glob.glob(os.path.join(html_dir, "*.html"))):
+                with open(path, encoding="utf-8") as f:
+                    self.recorded.append(f.read())
+            if not self.recorded:
+                raise SystemExit(f"❌ {html_dir} 下没有 *.html 文件")
+        self._pages = {}
+        self._records = {}
+
+    @property
+    def source(self):
+        return f"recorded ({len(self.recorded)} 页)" if self.recorded else f"synthetic (每层 {self.per_post} 条消息)"
+
+    def _key(self, floor):
+        if self.recorded:
+            return (floor - 1) % len(self.recorded)
+        return (floor - 1) // WINDOW
+
+    def page(self, floor):
+        key = self._key(floor)
+        if key not in self._pages:
+            if self.recorded:
+                self._pages[key] = self.recorded[key]
+            else:
+                first = key * WINDOW + 1
+                self._pages[key] = forum_fixtures.floor_page_html(first, first + WINDOW - 1, self.per_post)
+        return self._pages[key]
+
+    def records(self, floor):
+        key = self._key(floor)
+        if key not in self._records:
+            self._records[key] = crawler.parse_chat_transcripts(self.page(floor))
+        return self._records[key]
+
+    def pages(self, floors):
+        return [self.page(f) for f in range(1, floors + 1)]
+
+    def title_pages(self, floors):
+        titles = forum_fixtures.topic_titles(floors)
+        return [forum_fixtures.PAGE_HEAD.format(title=t) + forum_fixtures.PAGE_TAIL for t in titles]
+
+    def floor_records(self, floors):
+        return [(f, self.records(f)) for f in range(1, floors + 1)]
+
+
+def _parse(pages):
+    for html in pages:
+        crawler.parse_chat_transcripts(html)
+
+
+def _titles(pages):
+    for html in pages:
+        crawler.extract_post_title_and_yyyymm(html)
+
+
+def _filenames(titles):
+    for title in titles:
+        crawler.sanitize_filename(crawler.simplify_title_for_filename(title))
+
+
+def _dedup(floor_records):
+    crawler.deduplicate_records([r for _, records in floor_records for r in records])
+
+
+def _csv(floor_records):
+    """完整的写出路径：重排缓冲、即时去重、清单统计、fsync 与原子改名"""
+    with tempfile.TemporaryDirectory(prefix="bench-csv-") as tmp:
+        writer = crawler.CsvStreamWriter(os.path.join(tmp, "bench"), compression="none")
+        for floor, records in floor_records:
+            writer.add(floor, records)
+        with redirect_stdout(io.StringIO()):
+            writer.close("bench", len(floor_records))
+
+
+# 用例名 -> (说明, 生成输入, 被测函数)
+CASES = {
+    "parse": ("parse_chat_transcripts", Fixtures.pages, _parse),
+    "title": ("extract_post_title_and_yyyymm", Fixtures.title_pages, _titles),
+    "filename": (
+        "simplify_title_for_filename + sanitize_filename",
+        lambda fixtures, floors: forum_fixtures.topic_titles(floors),
+        _filenames,
+    ),
+    "dedup": ("deduplicate_records", Fixtures.floor_records, _dedup),
+    "csv": ("CsvStreamWriter 写出", Fixtures.floor_records, _csv),
+}
+
+
+def measure(fn, data, floors, min_seconds, min_rounds):
+    """反复执行直到累计耗时超过 min_seconds（至少 min_rounds 轮），再单独跑一轮统计内存分配"""
+    fn(data[:1])  # 预热：导入、正则编译、lru_cache（只用一个楼层，大规模用例不必多跑一轮）
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_rounds or time.perf_counter() - started < min_seconds:
+        t = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(data)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        "rounds": len(timings),
+        "seconds_median": median,
+        "seconds_best": min(timings),
+        "ops_per_sec": floors / median if median > 0 else None,
+        "alloc_peak_kb": round((peak - before) / 1024, 1),
+        "alloc_retained_kb": round((current - before) / 1024, 1),
+        "rss_peak_mb": peak_memory_mb(),
+    }
+
+
+def run_suite(cases, scales, fixtures, min_seconds, min_rounds):
+    results = []
+    for case in cases:
+        label, make_input, fn = CASES[case]
+        for floors in scales:
+            data = make_input(fixtures, floors)
+            result = {"case": case, "floors": floors, **measure(fn, data, floors, min_seconds, min_rounds)}
+            results.append(result)
+            print(
+                f"{case:>8} {floors:>5} 层: {result['ops_per_sec']:10.1f} 层/秒  "
+                f"中位 {result['seconds_median'] * 1000:9.2f} ms（{result['rounds']} 轮）  "
+                f"分配峰值 {result['alloc_peak_kb']:9.1f} KB  保留 {result['alloc_retained_kb']:7.1f} KB  "
+                f"进程峰值 {result['rss_peak_mb'] or 0:.0f} MB"
+            )
+            del data
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """与基线逐项比较，返回退化的用例数；吞吐（各轮中位数）下降或分配峰值增长超过 tolerance 视为退化"""
+    base = {(r["case"], r["floors"]): r for r in baseline.get("results", [])}
+    regressions = 0
+    print(f"\n与基线比较（{baseline.get('created_at')}，允许退化 {tolerance:.0%}）：")
+    for r in results:
+        old = base.get((r["case"], r["floors"]))
+        if old is None or not old.get("ops_per_sec") or not r.get("ops_per_sec"):
+            continue
+        speed = r["ops_per_sec"] / old["ops_per_sec"] - 1
+        alloc_delta = r["alloc_peak_kb"] - old["alloc_peak_kb"]
+        alloc = alloc_delta / old["alloc_peak_kb"] if old["alloc_peak_kb"] > 0 else 0.0
+        slower = speed < -tolerance
+        heavier = alloc > tolerance and alloc_delta > MIN_ALLOC_DELTA_KB
+        mark = "❌" if slower or heavier else "✅"
+        regressions += slower or heavier
+        print(
+            f"{mark} {r['case']:>8} {r['floors']:>5} 层: 吞吐 {speed:+7.1%}  分配峰值 {alloc:+7.1%}"
+            f"（{old['alloc_peak_kb']:.0f} → {r['alloc_peak_kb']:.0f} KB）"
+        )
+    return regressions
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析与后处理热点的离线微基准")
+    parser.add_argument(
+        "--cases",
+        default=",".join(CASES),
+        help=f"要运行的用例（逗号分隔），默认全部：{', '.join(CASES)}",
+    )
+    parser.add_argument(
+        "--scales",
+        default=",".join(map(str, DEFAULT_SCALES)),
+        help="楼层数规模（逗号分隔），默认 10,100,1000,5000",
+    )
+    parser.add_argument("--html-dir", help="录制的楼层 HTML 目录（*.html），循环使用代替合成页面")
+    parser.add_argument("--per-post", type=int, default=5, help="合成页面每层的消息数，默认 5")
+    parser.add_argument(
+        "--parser",
+        choices=sorted(crawler.PARSER_BACKENDS),
+        default=crawler.PARSER_BACKEND,
+        help="parse 用例使用的解析后端，默认 auto",
+    )
+    parser.add_argument("--seconds", type=float, default=1.0, help="每个用例每个规模的最短测量时间（秒），默认 1")
+    parser.add_argument("--rounds", type=int, default=3, help="每个用例每个规模至少执行的轮数，默认 3")
+    parser.add_argument("--output", default=RESULTS_PATH, help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线 JSON 路径（存在时自动比较）")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果另存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例，默认 0.2（20%%）")
+    args = parser.parse_args()
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"未知用例: {', '.join(unknown)}（可选 {', '.join(CASES)}）")
+    try:
+        scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    except ValueError:
+        parser.error("--scales 只能是逗号分隔的正整数")
+    if not scales or min(scales) < 1:
+        parser.error("--scales 只能是逗号分隔的正整数")
+
+    crawler.PARSER_BACKEND = args.parser
+    fixtures = Fixtures(args.per_post, args.html_dir)
+    print(
+        f"输入：{fixtures.source}；解析后端 {args.parser}；"
+        f"用例 {', '.join(cases)}；规模 {', '.join(map(str, scales))} 层"
+    )
+    results = run_suite(cases, scales, fixtures, args.seconds, max(1, args.rounds))
+
+    data = {
+        "version": RESULTS_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parser": args.parser,
+        "fixtures": fixtures.source,
+        "results": results,
+    }
+    write_json(args.output, data)
+    print(f"\n结果已写入 {args.output}")
+
+    regressions = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if args.save_baseline:
+        write_json(args.baseline, data)
+        print(f"已保存为基线 {args.baseline}")
+    if regressions:
+        print(f"共 {regressions} 项超出允许的退化范围")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# chat_store.py
+# 聊天记录 SQLite 存储：按 message_id 插入或更新，按时间 / 用户 / 频道建索引，
+# 查询某一周、某个用户的消息时只读取命中的行，不必扫描全部 CSV。
+#
+# 用法：
+#   python extract_chat_from_forum.py <URL> --sqlite          # 抓取时同时写入 backend/data/chat.db
+#   python chat_store.py import backend/data/*.csv             # 把已有 CSV 导入数据库
+#   python chat_store.py query --from 2025-08-01 --to 2025-08-07 --user alice
+#
+# Python 中使用：
+#   with ChatStore() as store:
+#       rows = store.query(since="2025-08-01", until="2025-08-07", channel="聊天区")
+
+import csv
+import gzip
+import io
+import os
+import sqlite3
+import sys
+from collections import namedtuple
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.normpath(os.path.join(BASE_DIR, "..", "data", "chat.db"))
+
+FIELDS = ["message_id", "username", "channel_name", "content", "created_at"]
+_FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+MESSAGE_ID_INT_LIMIT = 1 << 63  # 纯数字 message_id 不小于此值时保留为 str（消息索引按 int64 存放）
+
+
+def compact_message_id(mid):
+    """纯数字（无前导零、小于 2**63）的 message_id 存为 int，写回 CSV 时文本不变；其他值原样保留"""
+    if isinstance(mid, str) and mid.isascii() and mid.isdigit() and (mid[0] != "0" or mid == "0"):
+        value = int(mid)
+        if value < MESSAGE_ID_INT_LIMIT:
+            return value
+    return mid
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class ChatRecord(namedtuple("ChatRecord", FIELDS)):
+    """
+    一条聊天消息的紧凑表示：按 FIELDS 顺序存放的元组（没有每条消息一份的键表），
+    用户名与频道名经 sys.intern 共享同一个字符串对象，纯数字的 message_id 存为 int。
+    仍可按字段名读取（record["username"] / record.get("username")），与 CSV 读出的 dict 通用。
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def make(cls, message_id, username, channel_name, content, created_at):
+        return cls(compact_message_id(message_id), _intern(username), _intern(channel_name), content, created_at)
+
+    @classmethod
+    def load(cls, value):
+        """从断点日志中的列表（或旧版日志 / CSV 行的 dict）恢复"""
+        if isinstance(value, dict):
+            return cls.make(*(value.get(name) for name in FIELDS))
+        return cls.make(*value)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, _FIELD_INDEX[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        i = _FIELD_INDEX.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id   TEXT PRIMARY KEY,
+    username     TEXT NOT NULL DEFAULT '',
+    channel_name TEXT NOT NULL DEFAULT '',
+    content      TEXT NOT NULL DEFAULT '',
+    created_at   TEXT NOT NULL DEFAULT '',
+    topic        TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_username ON messages(username, created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages(channel_name, created_at);
+"""
+
+UPSERT = """
+INSERT INTO messages (message_id, username, channel_name, content, created_at, topic)
+VALUES (:message_id, :username, :channel_name, :content, :created_at, :topic)
+ON CONFLICT(message_id) DO UPDATE SET
+    username = excluded.username,
+    channel_name = excluded.channel_name,
+    content = excluded.content,
+    created_at = excluded.created_at,
+    topic = COALESCE(excluded.topic, messages.topic)
+"""
+
+
+def normalize_created_at(raw):
+    """
+    统一为 UTC 的 "YYYY-MM-DD HH:MM:SS"（与 csvLoader.js 输出格式一致），字符串顺序即时间顺序；
+    无法解析的值原样保留
+    """
+    s = (raw or "").strip()
+    if not s:
+        return ""
+    if s.upper().endswith(" UTC"):
+        s = s[:-4]
+    try:
+        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError:
+        return s
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ChatStore:
+    """聊天记录数据库；同一个连接只在创建它的线程中使用"""
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_DB_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        # WAL：写入时后端仍可并发读取
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def upsert(self, records, topic=None):
+        """按 message_id 插入或更新一批消息（单个事务），返回处理的条数"""
+        rows = [
+            {
+                "message_id": str(r["message_id"]),
+                "username": r.get("username") or "",
+                "channel_name": r.get("channel_name") or "",
+                "content": r.get("content") or "",
+                "created_at": normalize_created_at(r.get("created_at")),
+                "topic": topic,
+            }
+            for r in records
+            if r.get("message_id") not in (None, "")
+        ]
+        if rows:
+            with self.conn:
+                self.conn.executemany(UPSERT, rows)
+        return len(rows)
+
+    def query(self, since=None, until=None, username=None, channel=None, limit=None):
+        """
+        按条件查询消息，按时间升序返回字典列表
+        since / until：UTC 日期 "YYYY-MM-DD"（含当天）；username：精确匹配；
+        channel：频道名包含该字符串（与 loadChatRecords 的过滤规则一致）
+        """
+        where, params = [], []
+        if since:
+            where.append("created_at >= ?")
+            params.append(f"{since} 00:00:00")
+        if until:
+            where.append("created_at <= ?")
+            params.append(f"{until} 23:59:59")
+        if username:
+            where.append("username = ?")
+            params.append(username)
+        if channel:
+            where.append("instr(channel_name, ?) > 0")
+            params.append(channel)
+        sql = "SELECT message_id, username, channel_name, content, created_at FROM messages"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at, message_id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def date_range(self):
+        """返回 (最早时间, 最晚时间)，数据库为空时为 (None, None)"""
+        row = self.conn.execute(
+            "SELECT MIN(created_at), MAX(created_at) FROM messages WHERE created_at != ''"
+        ).fetchone()
+        return row[0], row[1]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def read_csv_records(path):
+    """读取爬虫输出的 CSV（支持 .csv.gz / .csv.zst）"""
+    if path.endswith(".gz"):
+        raw = gzip.open(path, "rb")
+    elif path.endswith(".zst"):
+        import zstandard
+
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    else:
+        raw = open(path, "rb")
+    with io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="聊天记录 SQLite 存储：导入 CSV / 查询")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="数据库路径，默认 backend/data/chat.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="导入爬虫输出的 CSV")
+    p_import.add_argument("files", nargs="+")
+
+    p_query = sub.add_parser("query", help="按日期 / 用户 / 频道查询，输出 JSON Lines")
+    p_query.add_argument("--from", dest="since", help="起始日期 YYYY-MM-DD（UTC）")
+    p_query.add_argument("--to", dest="until", help="结束日期 YYYY-MM-DD（UTC）")
+    p_query.add_argument("--user", help="用户名（精确匹配）")
+    p_query.add_argument("--channel", help="频道名（包含匹配）")
+    p_query.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    with ChatStore(args.db) as store:
+        if args.command == "import":
+            for path in args.files:
+                n = store.upsert(read_csv_records(path), topic=os.path.basename(path))
+                print(f"{path}: 导入 {n} 条")
+            print(f"数据库共 {store.count()} 条消息：{store.path}")
+        else:
+            for row in store.query(args.since, args.until, args.user, args.channel, args.limit):
+                print(json.dumps(row, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
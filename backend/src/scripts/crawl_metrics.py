@@ -0,0 +1,324 @@
+# crawl_metrics.py
+# 抓取指标：每次请求的耗时直方图、状态码、字节数、重试次数，令牌桶等待 / 退避 / 等待并发槽位 / 解析
+# 各自花掉的时间，各阶段用时与进程峰值内存。抓取结束时写出 JSON 摘要（含分位数），
+# 可选写出 Prometheus 文本格式文件（node_exporter textfile collector 可直接采集）。
+#
+# 用法：
+#   python extract_chat_from_forum.py <URL> --metrics-prom backend/data/.metrics/crawl.prom
+#   python crawl_metrics.py                       # 查看最近一次抓取的摘要：时间主要花在哪里
+#   python crawl_metrics.py other-run.json
+#
+# 等待、网络与解析时间是所有并发请求累加的“线程秒”，可能超过总耗时；比较它们之间的比例即可判断
+# 一次慢抓取是受限流等待、网络还是解析拖累。
+
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# 直方图桶上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PARSE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUANTILES = (0.5, 0.9, 0.99)
+PROM_PREFIX = "chat_crawler"
+
+WAIT_KINDS = {
+    "rate_limit": "令牌桶等待（含 429 全局暂停）",
+    "backoff": "异常退避",
+    "slot": "等待并发槽位",
+    "circuit": "主机熔断等待",
+}
+
+
+def peak_memory_mb():
+    """进程峰值内存（MB）；不支持 resource 模块的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB，macOS 下为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class Histogram:
+    """固定分桶的直方图：内存占用与样本数无关，分位数按桶内线性插值估算（与 Prometheus histogram_quantile 相同）"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if n and cumulative + n >= rank:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                estimate = lower + (self.buckets[i] - lower) * (rank - cumulative) / n
+                return min(estimate, self.max)
+            cumulative += n
+        return self.max
+
+    def cumulative(self):
+        """[(桶上限, 累计样本数)]，最后一项为 ("+Inf", 总数)"""
+        result, total = [], 0
+        for le, n in zip(self.buckets + ("+Inf",), self.counts):
+            total += n
+            result.append((le, total))
+        return result
+
+    def summary(self):
+        s = {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "max": round(self.max, 6),
+        }
+        for q in QUANTILES:
+            value = self.quantile(q)
+            s[f"p{int(q * 100)}"] = None if value is None else round(value, 6)
+        s["buckets"] = {str(le): n for le, n in self.cumulative()}
+        return s
+
+
+class CrawlMetrics:
+    """进程内的抓取指标（线程安全）；抓取代码在请求、等待、解析和各阶段处调用 record_* / stage()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.latency = Histogram(LATENCY_BUCKETS)
+            self.parse = Histogram(PARSE_BUCKETS)
+            self.status = Counter()
+            self.errors = 0
+            self.retries = 0
+            self.wire_bytes = 0
+            self.body_bytes = 0
+            self.parsed_bytes = 0
+            self.waits = Counter()
+            self.stages = Counter()
+
+    def record_request(self, status, latency, wire_bytes, body_bytes):
+        """收到一个响应（任何状态码）"""
+        with self._lock:
+            self.latency.observe(latency)
+            self.status[str(status)] += 1
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+
+    def record_attempt(self, attempt):
+        """第 attempt 次尝试（从 1 开始），大于 1 时计为一次重试"""
+        if attempt > 1:
+            with self._lock:
+                self.retries += 1
+
+    def record_error(self):
+        """请求失败（网络异常或非 2xx / 304 状态码）"""
+        with self._lock:
+            self.errors += 1
+
+    def record_wait(self, kind, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.waits[kind] += seconds
+
+    def record_parse(self, seconds, size):
+        with self._lock:
+            self.parse.observe(seconds)
+            self.parsed_bytes += size
+
+    @contextmanager
+    def stage(self, name):
+        """累计某个阶段的墙钟时间（批量模式下各帖子的同名阶段相加）"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.stages[name] += time.monotonic() - started
+
+    def summary(self, topics=()):
+        """JSON 摘要；topics 为各帖子的抓取摘要（topic_summary）"""
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            throttled = self.status["429"] + self.status["503"]
+            return {
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "finished_at_unix": int(time.time()),
+                "seconds": round(elapsed, 3),
+                "peak_memory_mb": peak_memory_mb(),
+                "requests": {
+                    "total": self.latency.count,
+                    "status": dict(sorted(self.status.items())),
+                    "throttled": throttled,
+                    "errors": self.errors,
+                    "retries": self.retries,
+                    "wire_bytes": self.wire_bytes,
+                    "body_bytes": self.body_bytes,
+                    "latency_seconds": self.latency.summary(),
+                },
+                "parse": {"bytes": self.parsed_bytes, "seconds": self.parse.summary()},
+                "time_seconds": {
+                    "network": round(self.latency.sum, 3),
+                    "parse": round(self.parse.sum, 3),
+                    **{f"wait_{kind}": round(self.waits[kind], 3) for kind in WAIT_KINDS},
+                },
+                "stages_seconds": {name: round(s, 3) for name, s in self.stages.items()},
+                "topics": [t for t in topics if t],
+            }
+
+
+def write_json(path, summary):
+    """临时文件 + 原子改名，读取方不会看到写了一半的文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _prom_line(name, value, labels=None):
+    label_text = ""
+    if labels:
+        label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+    return f"{PROM_PREFIX}_{name}{label_text} {value}"
+
+
+def _prom_histogram(lines, name, help_text, summary):
+    lines.append(f"# HELP {PROM_PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {PROM_PREFIX}_{name} histogram")
+    for le, n in summary["buckets"].items():
+        lines.append(_prom_line(f"{name}_bucket", n, {"le": le}))
+    lines.append(_prom_line(f"{name}_sum", summary["sum"]))
+    lines.append(_prom_line(f"{name}_count", summary["count"]))
+
+
+def prometheus_text(summary):
+    """把 JSON 摘要转为 Prometheus 文本格式（指标名与标签只用 ASCII）"""
+    req = summary["requests"]
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {PROM_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROM_PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            lines.append(_prom_line(name, value, labels))
+
+    _prom_histogram(lines, "request_duration_seconds", "HTTP request latency.", req["latency_seconds"])
+    metric(
+        "responses_total",
+        "counter",
+        "HTTP responses by status code.",
+        [({"code": code}, n) for code, n in req["status"].items()],
+    )
+    metric("request_errors_total", "counter", "Failed request attempts.", [(None, req["errors"])])
+    metric("request_retries_total", "counter", "Request attempts after the first.", [(None, req["retries"])])
+    metric(
+        "response_bytes_total",
+        "counter",
+        "Response body bytes.",
+        [({"encoding": "wire"}, req["wire_bytes"]), ({"encoding": "decoded"}, req["body_bytes"])],
+    )
+    _prom_histogram(lines, "parse_duration_seconds", "Per-page parse time.", summary["parse"]["seconds"])
+    metric(
+        "time_seconds_total",
+        "counter",
+        "Summed thread-seconds by activity.",
+        [({"activity": k}, v) for k, v in summary["time_seconds"].items()],
+    )
+    metric(
+        "stage_seconds",
+        "gauge",
+        "Wall time per crawl stage.",
+        [({"stage": k}, v) for k, v in summary["stages_seconds"].items()],
+    )
+    metric("run_seconds", "gauge", "Wall time of the last run.", [(None, summary["seconds"])])
+    metric(
+        "messages",
+        "gauge",
+        "Messages written by the last run.",
+        [(None, sum(t["messages"] for t in summary["topics"]))],
+    )
+    if summary["peak_memory_mb"] is not None:
+        metric(
+            "peak_memory_bytes",
+            "gauge",
+            "Peak resident memory of the crawler process.",
+            [(None, int(summary["peak_memory_mb"] * 1024 * 1024))],
+        )
+    metric("last_run_timestamp_seconds", "gauge", "Unix time the last run finished.", [(None, summary["finished_at_unix"])])
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, summary):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8", newline="\n") as f:
+        f.write(prometheus_text(summary))
+    os.replace(path + ".tmp", path)
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f} ms"
+
+
+def print_summary(summary):
+    """中文摘要：请求分位数、状态码与时间分布"""
+    req = summary["requests"]
+    lat = req["latency_seconds"]
+    print(
+        f"请求 {req['total']} 次（重试 {req['retries']} 次，失败 {req['errors']} 次，限流 {req['throttled']} 次），"
+        f"状态码 {req['status']}，传输 {req['wire_bytes'] / 1024 / 1024:.2f} MB"
+    )
+    print(f"请求耗时：p50 {_fmt(lat['p50'])}，p90 {_fmt(lat['p90'])}，p99 {_fmt(lat['p99'])}，最大 {_fmt(lat['max'])}")
+    parse = summary["parse"]["seconds"]
+    print(f"解析耗时：{parse['count']} 页，p50 {_fmt(parse['p50'])}，p99 {_fmt(parse['p99'])}")
+    times = summary["time_seconds"]
+    names = {"network": "网络", "parse": "解析", **{f"wait_{k}": v for k, v in WAIT_KINDS.items()}}
+    total = sum(times.values()) or 1.0
+    parts = "，".join(f"{names.get(k, k)} {v:.1f} 秒（{v / total:.0%}）" for k, v in times.items())
+    print(f"时间分布（线程秒）：{parts}")
+    if summary["stages_seconds"]:
+        stages = "，".join(f"{k} {v:.1f} 秒" for k, v in summary["stages_seconds"].items())
+        print(f"各阶段用时：{stages}；总耗时 {summary['seconds']:.1f} 秒")
+
+
+def main():
+    import argparse
+
+    default = os.path.normpath(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", ".metrics", "crawl-metrics.json")
+    )
+    parser = argparse.ArgumentParser(description="查看抓取指标摘要")
+    parser.add_argument("path", nargs="?", default=default, help="JSON 摘要，默认最近一次抓取")
+    parser.add_argument("--prom", action="store_true", help="输出 Prometheus 文本格式")
+    args = parser.parse_args()
+    with open(args.path, encoding="utf-8") as f:
+        summary = json.load(f)
+    if args.prom:
+        sys.stdout.write(prometheus_text(summary))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# csv_manifest.py
+# 每个 CSV 旁边的清单文件（<文件名>.manifest.json）：时间范围、行数、按天 / 频道 / 用户的计数、
+# 来源 URL、楼层数与内容哈希。/api/available-dates 等统计只读清单，不必逐行读取 CSV。
+#
+# 用法：
+#   python csv_manifest.py rebuild-manifests            # 为 backend/data 下所有 CSV 重新生成清单
+#   python csv_manifest.py rebuild-manifests a.csv      # 只处理指定文件
+#   python csv_manifest.py check                        # 按内容哈希检查清单是否过期
+#
+# 后端用文件大小 + 修改时间快速判断清单是否仍然对应当前文件，不一致时退回逐行读取。
+
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+
+from chat_store import ChatRecord, normalize_created_at, read_csv_records
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.normpath(os.path.join(BASE_DIR, "..", "data"))
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+CSV_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+
+
+def manifest_path(csv_path):
+    return csv_path + MANIFEST_SUFFIX
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _iso(value):
+    """"YYYY-MM-DD HH:MM:SS"（UTC）转为 ISO 8601，便于前端直接解析"""
+    return value.replace(" ", "T") + "Z" if value else None
+
+
+class ManifestStats:
+    """写 CSV 时逐条累计的统计信息"""
+
+    def __init__(self):
+        self.rows = 0
+        self.min_created_at = None
+        self.max_created_at = None
+        self.per_day = Counter()
+        self.per_channel = Counter()
+        self.per_user = Counter()
+
+    def add(self, record):
+        """record：抓取时的 ChatRecord，或重建清单时从 CSV 读出的 dict"""
+        if type(record) is ChatRecord:
+            created_at, channel, user = record.created_at, record.channel_name, record.username
+        else:
+            created_at, channel, user = record.get("created_at"), record.get("channel_name"), record.get("username")
+        self.rows += 1
+        created_at = normalize_created_at(created_at)
+        # 只统计能解析为 UTC 时间的值（与 availableDates.js 一致，解析失败的行不参与时间范围）
+        if len(created_at) == 19 and created_at[4] == "-":
+            if self.min_created_at is None or created_at < self.min_created_at:
+                self.min_created_at = created_at
+            if self.max_created_at is None or created_at > self.max_created_at:
+                self.max_created_at = created_at
+            self.per_day[created_at[:10]] += 1
+        self.per_channel[channel or ""] += 1
+        self.per_user[user or ""] += 1
+
+    def add_all(self, records):
+        for r in records:
+            self.add(r)
+        return self
+
+
+def write_manifest(csv_path, stats, source_url=None, title=None, floors=None):
+    """为已发布的 CSV 写清单（临时文件 + 原子改名），返回清单内容"""
+    st = os.stat(csv_path)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "file": os.path.basename(csv_path),
+        "size": st.st_size,
+        "mtime_ms": st.st_mtime_ns // 1_000_000,
+        "sha256": file_sha256(csv_path),
+        "source_url": source_url,
+        "title": title,
+        "floors": floors,
+        "rows": stats.rows,
+        "min_created_at": _iso(stats.min_created_at),
+        "max_created_at": _iso(stats.max_created_at),
+        "per_day": dict(sorted(stats.per_day.items())),
+        "per_channel": dict(stats.per_channel.most_common()),
+        "per_user": dict(stats.per_user.most_common()),
+    }
+    path = manifest_path(csv_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+
+def load_manifest(csv_path):
+    try:
+        with open(manifest_path(csv_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(csv_path, manifest):
+    """按内容哈希判断清单是否已过期（缺失也算过期）"""
+    return manifest is None or manifest.get("sha256") != file_sha256(csv_path)
+
+
+def rebuild_manifest(csv_path):
+    """读取 CSV 重新生成清单；来源 URL、标题与楼层数无法从 CSV 得到，沿用旧清单中的值"""
+    old = load_manifest(csv_path) or {}
+    stats = ManifestStats().add_all(read_csv_records(csv_path))
+    return write_manifest(csv_path, stats, old.get("source_url"), old.get("title"), old.get("floors"))
+
+
+def csv_files(paths):
+    if paths:
+        return paths
+    if not os.path.isdir(DATA_DIR):
+        return []
+    return [
+        os.path.join(DATA_DIR, name)
+        for name in sorted(os.listdir(DATA_DIR))
+        if name.lower().endswith(CSV_SUFFIXES)
+    ]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CSV 清单：重新生成 / 检查")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rebuild = sub.add_parser("rebuild-manifests", help="为 CSV 重新生成清单")
+    p_rebuild.add_argument("files", nargs="*", help="CSV 文件，默认 backend/data 下全部")
+    p_check = sub.add_parser("check", help="按内容哈希检查清单是否过期")
+    p_check.add_argument("files", nargs="*", help="CSV 文件，默认 backend/data 下全部")
+    args = parser.parse_args()
+
+    stale = 0
+    for path in csv_files(args.files):
+        if args.command == "rebuild-manifests":
+            m = rebuild_manifest(path)
+            print(f"{path}: {m['rows']} 条，{m['min_created_at']} ~ {m['max_created_at']}")
+        elif is_stale(path, load_manifest(path)):
+            stale += 1
+            print(f"⚠️ 清单缺失或已过期: {path}")
+    if args.command == "check":
+        print("✅ 所有清单均为最新" if not stale else f"共 {stale} 个清单需要重新生成（rebuild-manifests）")
+        sys.exit(1 if stale else 0)
+
+
+if __name__ == "__main__":
+    main()
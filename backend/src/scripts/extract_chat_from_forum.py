@@ -1,15 +1,36 @@
 # extract_chat_from_forum.py
-# 已保留原脚本所有抓取、线程、命名、退避、补抓、解析逻辑
-# 仅做三处最小修改：
-# 1) BASE_URL 默认为 None（可由命令行参数传入以覆盖）
-# 2) INPUT_DIR 指向相对路径 ../data（即 backend/data）
-# 3) 支持命令行启动： python extract_chat_from_forum.py "<URL>"
-
-import requests, time, re, os, csv, random
-import pandas as pd
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import deque
+# 抓取六度世界（Discourse）聊天区备份帖，解析其中的 chat-transcript 消息，按帖子标题导出 CSV 到 backend/data。
+# 先探测楼层数，再并发抓取楼层页（或经 JSON 接口批量读取楼层）；全局令牌桶、AIMD 自适应并发与按主机熔断控制请求节奏，
+# 失败的楼层按退避时间重新排队。楼层按顺序流式写出到临时文件，完成后原子发布，并在旁边写清单文件。
+#
+# 用法：
+#   python extract_chat_from_forum.py <URL>                  # 抓取单个帖子
+#   python extract_chat_from_forum.py <URL> <URL> ...        # 批量模式：多个帖子共用请求配额（--urls-file 从文件读取 URL）
+#   python extract_chat_from_forum.py --discover [列表 URL]  # 遍历帖子列表，抓取新出现或有更新的月度备份帖
+#   python extract_chat_from_forum.py --reparse [URL ...]    # 不访问网络，用 --archive 保存的页面归档重建 CSV
+#   python extract_chat_from_forum.py --worker               # 常驻 worker：从标准输入逐行读取 JSON 任务（crawler.js 使用）
+#
+# 常用参数（完整说明见 --help 与 README）：
+#   --engine thread|async  --transport html|json  --stride auto|K|1  --parser auto|lxml|strainer|bs4  --parse-procs N
+#   --resume（断点续抓）  --archive（保存页面归档）  --compress none|gzip|zstd  --sqlite [PATH]
+#   --message-index  --no-http-cache  --events jsonl  --metrics PATH  --metrics-prom PATH
+
+import requests, time, re, os, sys, io, csv, json, gzip, hashlib, heapq, random, tempfile, threading, queue, asyncio, zlib
+import html as htmllib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, ProcessPoolExecutor, wait as futures_wait
+from collections import deque, OrderedDict
+from contextlib import contextmanager, asynccontextmanager, nullcontext
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlsplit
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from chat_store import ChatRecord
+from csv_manifest import ManifestStats, write_manifest
+from message_index import MessageIndex, owner_of_path
+from page_archive import ARCHIVE_SUFFIX, PageArchive, archive_dir, list_archives
+from crawl_metrics import CrawlMetrics, peak_memory_mb, print_summary, write_json, write_prometheus
+from urllib3.util.request import ACCEPT_ENCODING
 
 
 # ===== 配置区域 =====
@@ -30,27 +51,108 @@ HEADERS = {
     "Chrome/115.0.0.0 Safari/537.36"
 }
 TIMEOUT = 15  # 单次请求超时时间（秒）
-REQUEST_INTERVAL = 2.0  # 正常请求间隔（秒）
+REQUEST_INTERVAL = 2.0  # 每个并发槽位的正常请求间隔（秒），用于换算全局请求速率
 MAX_RETRIES = 3  # 单个楼层请求最大重试次数
-MAX_WORKERS = 8  # 并发线程数（抓取楼层时使用）
+MAX_WORKERS = 8  # 初始并发数（自适应并发的起点）
+MIN_WORKERS = 1  # 自适应并发下限
+MAX_WORKERS_CEILING = 16  # 自适应并发上限（抓取线程池大小 / asyncio 引擎最大在途请求数）
+CRAWL_ENGINE = "thread"  # 抓取引擎："thread"（线程池）或 "async"（asyncio，需要 aiohttp）；可由 --engine 指定
+TRANSPORT = "html"  # "html"：逐楼层抓取渲染页面；"json"：读取 Discourse JSON 接口，一次请求多个楼层；可由 --transport 指定
+JSON_POSTS_PER_REQUEST = 20  # JSON 方式每次请求的楼层数（posts.json?post_ids[]=…）
+
+# --- 连接复用 ---
+SESSION_POOL_SIZE = MAX_WORKERS_CEILING  # 共享 Session 数量，与抓取线程数一致
+PER_HOST_CONNECTIONS = MAX_WORKERS_CEILING  # 单个主机的最大保持连接数（超出时等待空闲连接）
 
 # --- 限速与退避策略 ---
+REQUEST_RATE = MAX_WORKERS / REQUEST_INTERVAL  # 全局令牌桶初始速率（次/秒）
+REQUEST_RATE_MIN = 0.2  # 速率下限（次/秒）
+REQUEST_RATE_MAX = MAX_WORKERS_CEILING / REQUEST_INTERVAL  # 速率上限（次/秒）
+REQUEST_BURST = 2  # 令牌桶容量（允许的瞬时突发请求数）
+RATE_INCREASE_STEP = 1.0  # 每个往返时间（RTT）内速率的加性增长（次/秒），按一个 RTT 内完成的请求数分摊到每次成功请求
+LATENCY_TARGET = 5.0  # 单次请求耗时超过此值（秒）视为服务器吃力，按限流处理
+AIMD_DECREASE_FACTOR = 0.5  # 触发限流时并发与速率的乘性下降系数
+AIMD_COOLDOWN = 5.0  # 两次乘性下降的最小间隔（秒），避免同一波 429 反复减半
 BACKOFF_BASE_DELAY = 5  # 触发 429 时的基准退避时间（秒）
 BACKOFF_MAX_DELAY = 60  # 动态退避最大时间（秒）
-RETRY_EXTRA_DELAY = 10  # 补抓时的额外延迟（秒），避免和正常抓取冲突
+RETRY_EXTRA_DELAY = 10  # 补抓时的额外延迟（秒）：楼层每连续失败 MAX_RETRIES 次、或抓到的页面没有消息时，重新排队前多等这么久
 
 # --- 自动补抓 ---
-MAX_SUPPLEMENT_ROUNDS = 3  # 自动补抓的最大轮数
+MAX_SUPPLEMENT_ROUNDS = 3  # 跳层抓取缺口补抓的最大轮数；抓到的页面没有消息时，该楼层最多重新排队的次数
+SUBMIT_WINDOW = MAX_WORKERS_CEILING * 2  # 每个帖子同时提交（在途 + 排队等待槽位）的楼层数上限，失败的楼层按各自的退避时间重新排队
+FLOOR_MAX_ATTEMPTS = MAX_RETRIES * (MAX_SUPPLEMENT_ROUNDS + 1)  # 单个楼层（JSON 方式为单个批次）最多请求次数，用尽后记为缺失
+FLOOR_STRIDE = "auto"  # 跳层抓取步长：每个楼层页会渲染附近约 20 个楼层，"auto" 按首页的楼层窗口确定步长，1 为逐层抓取；可由 --stride 指定
+
+# --- 熔断 ---
+BREAKER_THRESHOLD = 8  # 同一主机连续失败（网络异常、5xx、响应不完整）多少次后熔断；429 / 503 由令牌桶全局暂停处理，不计入
+BREAKER_COOLDOWN = 10  # 熔断后暂停向该主机发请求的时间（秒），之后只放行一个试探请求，失败时加倍（最多 BACKOFF_MAX_DELAY）
 
 # --- 楼层自动探测参数 ---
-STAGE1_MAX = 1000  # Stage1 顺序探测最大楼层数
-STOP_ON_EMPTY = 5  # Stage1 连续空页数阈值
+STAGE1_MAX = 100000  # Stage1 倍增探测的楼层上限（倍增到此为止）
+DISCOVERY_WAVE = 4  # Stage1 每轮并发探测的楼层数（倍增与多路二分共用）
+PLATEAU_MIN_GAP = 32  # 两个探测点相距至少这么多楼层且内容不再增长，才判定已到尾部
 TAIL_MAX = 100  # Stage2 尾部确认最大检查页数
-TAIL_STOP_EMPTY = 5  # Stage2 连续空页数阈值
-PROGRESS_EVERY = 10  # 每 N 页输出一次进度
+TAIL_STOP_EMPTY = 5  # Stage2 连续空页数阈值（也是每轮并发确认的页数）
+DISCOVERY_PROBE_RETRIES = 2  # 探测请求失败（重试耗尽）后再补探的轮数，仍失败的楼层视为未知，不参与尾部判定
 MIN_ACCEPT = 10  # 检测结果小于此值 → 提示人工确认
 MAX_ACCEPT = 2000  # 检测结果大于此值 → 提示人工确认
 
+# --- 页面解析 ---
+# 解析后端（可由 --parser 指定）：
+#   "auto"     默认：已安装 lxml 时用 lxml，否则用 strainer
+#   "lxml"     libxml2 解析，约为原实现的 10 倍速度（需要 pip install lxml）
+#   "strainer" html.parser 只构建聊天节点
+#   "bs4"      原始实现，html.parser 构建整棵文档树
+# 各后端输出与原实现逐字节一致，可用 bench_extract.py 做一致性检查与吞吐对比
+PARSER_BACKEND = "auto"
+PARSE_PROCESSES = 0  # 解析进程数；0 表示在抓取线程内直接解析，>0 启用抓取/解析流水线；可由 --parse-procs 指定
+PIPELINE_QUEUE_SIZE = 64  # 流水线中待解析 HTML 队列的容量（满时抓取线程等待）
+PIPELINE_LOG_EVERY = 10  # 流水线每隔多少秒输出一次队列深度与吞吐
+
+# --- 批量抓取 ---
+BATCH_PARALLEL_TOPICS = 3  # 批量模式下同时抓取的帖子数（共用同一个令牌桶与并发上限）；可由 --batch-parallel 指定
+INTERACTIVE = True  # 楼层探测结果异常时是否提示人工输入；批量模式下关闭
+
+# --- 新备份帖发现（--discover） ---
+DISCOVER_LISTING_URL = "https://6do.world/latest"  # 帖子列表页（/latest 或分类页 /c/<slug>/<id>），自动改用其 .json 接口
+DISCOVER_MAX_PAGES = 20  # 列表最多翻页数
+DISCOVER_TITLE_PATTERN = r"^六度世界聊天区\d{6}"  # 规范化标题（simplify_title_for_filename）匹配时才视为月度备份帖
+DISCOVER_STATE_FILE = ".discovery.json"  # 已抓帖子的回复数 / 最后活动时间（位于 INPUT_DIR 下）
+
+# --- CSV 输出 ---
+CSV_FIELDNAMES = ["message_id", "username", "channel_name", "content", "created_at"]
+CSV_COMPRESSION = "none"  # 输出压缩："none" / "gzip"（.csv.gz）/ "zstd"（.csv.zst，需 pip install zstandard）；可由 --compress 指定
+CSV_REORDER_MAX_FLOORS = 256  # 流式写出时重排缓冲最多暂存的乱序楼层数，超出时先写出其中最小的楼层
+SQLITE_PATH = None  # 同时写入的 SQLite 数据库路径（按 message_id 插入或更新）；None 表示不写，--sqlite 启用
+MESSAGE_INDEX_ENABLED = False  # 跳过已归档在其他 CSV 中的消息（INPUT_DIR/.index，见 message_index.py）；--message-index 开启
+
+# --- 磁盘 HTTP 缓存 ---
+HTTP_CACHE_ENABLED = True  # 是否启用磁盘 HTTP 缓存（ETag / Last-Modified 条件请求）；--no-http-cache 关闭
+HTTP_CACHE_DIR = None  # 缓存目录；None 表示 INPUT_DIR/.http_cache，可由 --http-cache-dir 指定
+HTTP_CACHE_MAX_MB = 512  # 缓存目录大小上限（MB），超出按最久未使用淘汰
+
+# --- 原始页面归档 ---
+ARCHIVE_PAGES = False  # 抓到的楼层页压缩存入 INPUT_DIR/.archive/topic-<id>.pages（见 page_archive.py），供 --reparse 离线重建 CSV；--archive 启用
+
+# --- 断点续抓 ---
+CHECKPOINT_DIRNAME = ".checkpoints"  # 断点日志目录（位于 INPUT_DIR 下，不会被当作 CSV 读取）
+CHECKPOINT_FSYNC_EVERY = 50  # 每写入多少条日志强制落盘一次
+RESUME = False  # 是否从已有断点日志继续抓取；可由 --resume 指定
+
+# --- 抓取指标 ---
+METRICS_PATH = None  # JSON 指标摘要路径；None 表示 INPUT_DIR/.metrics/crawl-metrics.json（每次运行覆盖），可由 --metrics 指定
+METRICS_PROM_PATH = None  # Prometheus 文本格式指标文件路径；None 表示不写，可由 --metrics-prom 指定
+
+# --- 进度事件 ---
+EVENTS_FORMAT = None  # "jsonl"：在标准输出逐行输出结构化进度事件，普通日志改写到标准错误；可由 --events 指定
+EVENTS_MIN_INTERVAL = 0.5  # 同一帖子的同类高频事件（进度、探测、重试、限流）最小间隔（秒）
+
+# --- 常驻 worker（--worker） ---
+WORKER_QUEUE_SIZE = 8  # 排队等待的任务数上限，超出时拒绝新任务（任务逐个执行，共用同一份请求配额）
+
+# --- 页面缓存（探测阶段抓到的楼层供正式抓取复用） ---
+PAGE_CACHE_MAX_MB = 64  # 单次抓取的页面缓存内存上限（MB），超出按最近最少使用淘汰
+
 # ====================
 
 
@@ -88,42 +190,672 @@ def simplify_title_for_filename(title: str) -> str:
     return title[:20].replace(" ", "")
 
 
-def fetch_page(url, session=None, is_retry=False):
+class _HandshakeCountingAdapter(HTTPAdapter):
+    """在连接池层面统计真正建立的 TCP/TLS 连接（握手）次数，连接断开后重连也计入"""
+
+    def __init__(self, *args, **kwargs):
+        self.handshakes = 0
+        self._count_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _count_handshake(self):
+        with self._count_lock:
+            self.handshakes += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting(conn_cls):
+            class CountingConnection(conn_cls):
+                def connect(self):
+                    super().connect()
+                    adapter._count_handshake()
+
+            return CountingConnection
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(
+                pool_cls.__name__,
+                (pool_cls,),
+                {"ConnectionCls": counting(pool_cls.ConnectionCls)},
+            )
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class SessionPool:
     """
-    抓取页面，支持限流动态退避 + 多次重试
+    线程共享的 Session 池
+    所有 Session 挂载同一个 HTTPAdapter（即同一个连接池），连接保持 keep-alive 复用，
+    每个主机的连接数不超过 PER_HOST_CONNECTIONS；请求头声明 urllib3 可解压的编码
+    （安装 brotli 后自动包含 br）。同时统计新建连接（握手）次数与传输字节数。
     """
-    if session is None:
+
+    def __init__(self, size=SESSION_POOL_SIZE, per_host=PER_HOST_CONNECTIONS):
+        self.size = size
+        self.adapter = _HandshakeCountingAdapter(
+            pool_connections=size, pool_maxsize=per_host, pool_block=True
+        )
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.wire_bytes = 0  # 网络上实际传输的响应体字节数（压缩后）
+        self.body_bytes = 0  # 解压后的响应体字节数
+
+    def _new_session(self):
         session = requests.Session()
-    delay = REQUEST_INTERVAL
-    for attempt in range(1, MAX_RETRIES + 1):
+        session.headers.update(HEADERS)
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        session.headers["Connection"] = "keep-alive"
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+        return session
+
+    @contextmanager
+    def session(self):
+        """借出一个 Session，用完自动归还；池满时等待其他线程归还"""
         try:
-            time.sleep(delay)
-            response = session.get(url, timeout=TIMEOUT, headers=HEADERS)
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            session = self._new_session() if can_create else self._idle.get()
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
 
-            if response.status_code == 200:
-                return response.text
+    def record(self, response):
+        try:
+            wire = response.raw.tell()
+        except Exception:
+            wire = 0
+        body = len(response.content)
+        with self._lock:
+            self.wire_bytes += wire or body
+            self.body_bytes += body
+        return wire or body, body
+
+    def stats(self):
+        pools = self.adapter.poolmanager.pools
+        requests_sent = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+        return {
+            "connections": self.adapter.handshakes,
+            "requests": requests_sent,
+            "wire_bytes": self.wire_bytes,
+            "body_bytes": self.body_bytes,
+        }
 
-            if response.status_code == 429:
-                backoff_time = min(
-                    BACKOFF_BASE_DELAY * (2 ** (attempt - 1)), BACKOFF_MAX_DELAY
-                )
-                print(
-                    f"请求失败({attempt}/{MAX_RETRIES}): {url}，原因: 429 Too Many Requests，退避 {backoff_time} 秒"
+    def report(self):
+        s = self.stats()
+        ratio = s["wire_bytes"] / s["body_bytes"] * 100 if s["body_bytes"] else 100
+        print(
+            f"HTTP 连接：建立连接（握手）{s['connections']} 次，发出请求 {s['requests']} 次，"
+            f"传输 {s['wire_bytes'] / 1024 / 1024:.2f} MB"
+            f"（解压后 {s['body_bytes'] / 1024 / 1024:.2f} MB，压缩后为 {ratio:.0f}%）"
+        )
+
+
+SESSION_POOL = SessionPool()
+
+
+class CrawlCancelled(BaseException):
+    """任务被取消（--worker 收到 cancel）。继承 BaseException，抓取代码里的 except Exception 不会把它当作普通失败吞掉"""
+
+
+CANCEL = threading.Event()  # 置位后，所有等待（令牌、退避）与下一次请求前都会抛出 CrawlCancelled
+
+
+def check_cancelled():
+    if CANCEL.is_set():
+        raise CrawlCancelled()
+
+
+def cancellable_sleep(seconds):
+    """等待 seconds 秒，期间任务被取消时立即抛出 CrawlCancelled"""
+    if CANCEL.wait(seconds) if seconds > 0 else CANCEL.is_set():
+        raise CrawlCancelled()
+
+
+class RateLimiter:
+    """
+    全局令牌桶（GCRA 实现），所有线程共享同一份请求配额
+    reserve() 只计算需要等待的时间而不阻塞，异步调用方也可使用；
+    收到 429 时调用 pause()，所有线程一起等到 Retry-After 指定的时间点。
+    """
+
+    def __init__(self, rate=REQUEST_RATE, burst=REQUEST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tat = time.monotonic()  # 理论上下一个令牌可用的时间
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """预订一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            interval = 1.0 / self.rate
+            start = max(now, self._tat - (self.burst - 1) * interval, self._paused_until)
+            self._tat = max(self._tat, start) + interval
+            return start - now
+
+    def acquire(self):
+        wait = self.reserve()
+        cancellable_sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """全局暂停 seconds 秒，暂停结束后按当前速率重新排队，不会集中突发"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._paused_until = max(self._paused_until, until)
+            self._tat = max(self._tat, self._paused_until)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = min(max(rate, REQUEST_RATE_MIN), REQUEST_RATE_MAX)
+
+
+def _fair_turn(active, waiting, key):
+    """公平分配：等待中的帖子里，在途请求最少的先拿到空出的槽位"""
+    mine = active.get(key, 0)
+    return all(active.get(k, 0) >= mine for k in waiting)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 自适应并发控制
+    请求成功且耗时正常：并发上限每轮约 +1，令牌桶速率每个 RTT 约 +RATE_INCREASE_STEP；
+    遇到 429 / 503 或耗时超过 LATENCY_TARGET：并发上限与速率同时乘性下降（带冷却时间）。
+    批量抓取多个帖子时，槽位按帖子公平分配，避免某个帖子占满全部并发。
+    """
+
+    def __init__(self, limiter, initial=MAX_WORKERS, minimum=MIN_WORKERS, maximum=MAX_WORKERS_CEILING):
+        self.limiter = limiter
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._active = {}  # 帖子 -> 在途请求数
+        self._waiting = {}  # 帖子 -> 等待槽位的请求数
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, key=None):
+        """占用一个并发槽位，当前在途请求数达到上限时等待；key 为请求所属的帖子"""
+        with self._cond:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            while self.in_flight >= int(self.limit) or not _fair_turn(self._active, self._waiting, key):
+                self._cond.wait()
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key]
+            self.in_flight += 1
+            self._active[key] = self._active.get(key, 0) + 1
+            if self._waiting and self.in_flight < int(self.limit):
+                self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+                self._cond.notify_all()
+
+    def on_success(self, latency):
+        if latency > LATENCY_TARGET:
+            self._decrease()
+            return
+        with self._cond:
+            self.completed += 1
+            grew = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            if int(self.limit) > grew:
+                self._cond.notify_all()
+        # 一个 RTT 内约有 rate × latency 个请求完成（至少按 1 个算），分摊后每个 RTT 共增长 RATE_INCREASE_STEP
+        rate = self.limiter.rate
+        self.limiter.set_rate(rate + RATE_INCREASE_STEP / max(1.0, rate * latency))
+
+    def on_throttle(self):
+        with self._cond:
+            self.throttled += 1
+        self._decrease()
+
+    def _decrease(self):
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < AIMD_COOLDOWN:
+                return
+            self._last_decrease = now
+            self.decreases += 1
+            self.limit = max(self.minimum, self.limit * AIMD_DECREASE_FACTOR)
+        self.limiter.set_rate(self.limiter.rate * AIMD_DECREASE_FACTOR)
+
+    def report(self):
+        print(
+            f"自适应并发：当前并发上限 {int(self.limit)}，请求速率 {self.limiter.rate:.2f} 次/秒，"
+            f"收到限流响应 {self.throttled} 次，降速 {self.decreases} 次"
+        )
+
+
+class _HostCircuit:
+    __slots__ = ("failures", "open_until", "cooldown", "probe_until")
+
+    def __init__(self, cooldown):
+        self.failures = 0  # 连续失败次数
+        self.open_until = 0.0  # 熔断结束时间，0 表示闭合（正常放行）
+        self.cooldown = cooldown  # 本次熔断的冷却时间（秒）
+        self.probe_until = 0.0  # 半开状态下已放行的试探请求的截止时间
+
+
+class CircuitBreaker:
+    """
+    按主机熔断：同一主机连续 BREAKER_THRESHOLD 次请求失败（网络异常、5xx、响应不完整）后熔断，
+    冷却期内发往该主机的请求（批量模式下所有帖子的探测、抓取与重试）都在发出前等待，不再白白消耗重试次数；
+    冷却结束后半开，只放行一个试探请求：成功则恢复，失败则再次熔断且冷却时间加倍（最多 BACKOFF_MAX_DELAY）。
+    429 / 503 已由令牌桶全局暂停处理，不计入连续失败；4xx 说明主机正常响应，按成功处理。
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.trips = 0
+        self._hosts = {}  # 主机 -> _HostCircuit
+        self._lock = threading.Lock()
+
+    def delay(self, url):
+        """向 url 所在主机发请求前需要等待的秒数；冷却结束后第一个调用方拿到试探请求（返回 0）"""
+        with self._lock:
+            circuit = self._hosts.get(urlsplit(url).netloc)
+            if circuit is None or not circuit.open_until:
+                return 0.0
+            now = time.monotonic()
+            if now < circuit.open_until:
+                return circuit.open_until - now
+            if now < circuit.probe_until:
+                return min(circuit.probe_until - now, 1.0)  # 试探请求进行中，每秒看一次结果
+            circuit.probe_until = now + TIMEOUT * 2  # 试探请求超时未归还时，再放行下一个
+            return 0.0
+
+    def wait(self, url):
+        """阻塞到可以向该主机发请求为止，返回等待的秒数"""
+        waited = 0.0
+        delay = self.delay(url)
+        while delay > 0:
+            cancellable_sleep(delay)
+            waited += delay
+            delay = self.delay(url)
+        return waited
+
+    def record(self, url, ok):
+        """记录一次请求的结果：ok 为 True 表示主机正常响应"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            circuit = self._hosts.get(host)
+            if ok:
+                if circuit is None or not (circuit.failures or circuit.open_until):
+                    return
+                if circuit.open_until:
+                    print(f"✅ {host} 恢复响应，解除熔断")
+                    EVENTS.emit("circuit", None, host=host, state="closed")
+                self._hosts[host] = _HostCircuit(self.cooldown)
+                return
+            if circuit is None:
+                circuit = self._hosts[host] = _HostCircuit(self.cooldown)
+            circuit.failures += 1
+            if circuit.probe_until:
+                circuit.cooldown = min(circuit.cooldown * 2, BACKOFF_MAX_DELAY)  # 试探请求失败
+            elif circuit.open_until or circuit.failures < self.threshold:
+                return  # 尚未达到阈值，或熔断前已发出的请求陆续失败
+            circuit.open_until = time.monotonic() + circuit.cooldown
+            circuit.probe_until = 0.0
+            self.trips += 1
+            print(f"⚠️ {host} 连续失败 {circuit.failures} 次，熔断 {circuit.cooldown:.0f} 秒后试探")
+            EVENTS.emit(
+                "circuit", None, host=host, state="open", failures=circuit.failures, cooldown=circuit.cooldown
+            )
+
+    def report(self):
+        if self.trips:
+            print(f"熔断：共 {self.trips} 次，等待 {METRICS.waits['circuit']:.1f} 秒")
+
+
+def _is_host_failure(error):
+    """请求异常是否说明主机有问题（网络异常、5xx、响应不完整）；4xx 说明主机正常响应"""
+    status = getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status", None)
+    return not isinstance(status, int) or status >= 500
+
+
+class EventStream:
+    """
+    结构化进度事件（--events jsonl）：每行一个 JSON 对象，包含 type、t（距启动的秒数）与 topic，
+    供 crawler.js 直接转发给前端，无需解析日志文本。
+    进度、探测、重试、限流等高频事件按 (类型, 帖子) 限频，期间跳过的条数记在下一条事件的 skipped 中，
+    事件流本身不会拖慢抓取；阶段结束、补抓、输出等事件总是立即写出。
+    --worker 模式下 job 为当前任务 ID，写入每个事件，crawler.js 据此把事件分发给对应任务。
+    """
+
+    def __init__(self):
+        self.stream = None
+        self.job = None
+        self.started = time.monotonic()
+        self._last = {}
+        self._skipped = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.stream is not None
+
+    def open(self, stream):
+        self.stream = stream
+        self.started = time.monotonic()
+
+    def emit(self, kind, topic=None, throttle=False, **fields):
+        if self.stream is None:
+            return
+        key = (kind, topic)
+        with self._lock:
+            now = time.monotonic()
+            last = self._last.get(key)
+            if throttle and last is not None and now - last < EVENTS_MIN_INTERVAL:
+                self._skipped[key] = self._skipped.get(key, 0) + 1
+                return
+            self._last[key] = now
+            event = {"type": kind, "t": round(now - self.started, 2), "topic": topic}
+            if self.job is not None:
+                event["job"] = self.job
+            event.update(fields)
+            skipped = self._skipped.pop(key, 0)
+            if skipped:
+                event["skipped"] = skipped
+            try:
+                self.stream.write(json.dumps(event, ensure_ascii=False) + "\n")
+                self.stream.flush()
+            except (OSError, ValueError):
+                self.stream = None  # 读取方已退出，不再输出事件
+
+    def progress(self, topic, stage, done, total, started, messages):
+        """某一阶段的进度与预计剩余时间；最后一条（done == total）总是写出"""
+        if self.stream is None:
+            return
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        self.emit(
+            "progress",
+            topic,
+            throttle=done < total,
+            stage=stage,
+            done=done,
+            total=total,
+            messages=messages,
+            pages_per_sec=round(rate, 2),
+            eta_seconds=round((total - done) / rate, 1) if rate else None,
+        )
+
+
+RATE_LIMITER = RateLimiter()
+CONCURRENCY = AdaptiveConcurrency(RATE_LIMITER)
+BREAKER = CircuitBreaker()
+METRICS = CrawlMetrics()
+EVENTS = EventStream()
+
+
+class HttpCache:
+    """
+    跨次运行的磁盘 HTTP 缓存
+    每个 URL 保存两个文件：<sha1>.html.gz（gzip 压缩的页面）与 <sha1>.json（URL、ETag、Last-Modified）。
+    再次抓取时带上 If-None-Match / If-Modified-Since，服务器返回 304 就直接用磁盘上的页面，
+    已结束的月度备份帖重抓时每个楼层只需传输一个空响应。
+    目录总大小超过 HTTP_CACHE_MAX_MB 时按最久未使用淘汰；目录在第一次使用时才确定，
+    因此命令行修改 INPUT_DIR / HTTP_CACHE_DIR 后依然生效。
+    """
+
+    def __init__(self):
+        self.directory = None
+        self._entries = OrderedDict()  # key -> 页面文件大小，按最近使用排序
+        self._total = 0
+        self._lock = threading.Lock()
+        self.revalidated = 0  # 304 命中次数
+        self.stored = 0  # 新写入 / 更新的页面数
+        self.saved_bytes = 0  # 304 命中省下的页面字节数（解压后）
+
+    def _load(self):
+        """首次使用时扫描缓存目录，按文件修改时间重建使用顺序"""
+        if self.directory is not None:
+            return
+        directory = HTTP_CACHE_DIR or os.path.join(INPUT_DIR, ".http_cache")
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".html.gz"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[: -len(".html.gz")], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        self.directory = directory
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".html.gz", base + ".json"
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _meta(self, key):
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(self, url):
+        """已缓存的 URL 返回条件请求头，否则返回空字典"""
+        if not HTTP_CACHE_ENABLED:
+            return {}
+        key = self._key(url)
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return {}
+        meta = self._meta(key)
+        if not meta:
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, url):
+        """服务器返回 304 时读取磁盘上的页面；文件已被淘汰或损坏时返回 None"""
+        key = self._key(url)
+        body_path, _ = self._paths(key)
+        try:
+            with gzip.open(body_path, "rt", encoding="utf-8") as f:
+                html = f.read()
+            os.utime(body_path)
+        except (OSError, EOFError):
+            self._forget(key)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.revalidated += 1
+            self.saved_bytes += len(html.encode("utf-8"))
+        return html
+
+    def store(self, url, headers, html):
+        """保存带 ETag / Last-Modified 的 200 响应；没有校验字段的响应无法重新验证，不缓存"""
+        if not HTTP_CACHE_ENABLED:
+            return
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        key = self._key(url)
+        with self._lock:
+            self._load()
+        body_path, meta_path = self._paths(key)
+        try:
+            # 先写临时文件再原子替换，中途退出不会留下半个缓存文件
+            with gzip.open(body_path + ".tmp", "wt", encoding="utf-8") as f:
+                f.write(html)
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f, ensure_ascii=False)
+            os.replace(body_path + ".tmp", body_path)
+            os.replace(meta_path + ".tmp", meta_path)
+            size = os.path.getsize(body_path)
+        except OSError as e:
+            print(f"⚠️ 写入 HTTP 缓存失败: {e}")
+            return
+        with self._lock:
+            self._total += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self.stored += 1
+            evicted = []
+            while self._total > HTTP_CACHE_MAX_MB * 1024 * 1024 and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._remove_files(old_key)
+
+    def _forget(self, key):
+        with self._lock:
+            self._total -= self._entries.pop(key, 0)
+        self._remove_files(key)
+
+    def _remove_files(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def report(self):
+        if not HTTP_CACHE_ENABLED or self.directory is None:
+            return
+        print(
+            f"HTTP 缓存：304 命中 {self.revalidated} 次（省下 {self.saved_bytes / 1024 / 1024:.2f} MB），"
+            f"新写入 {self.stored} 页，缓存目录共 {len(self._entries)} 页 / "
+            f"{self._total / 1024 / 1024:.1f} MB（上限 {HTTP_CACHE_MAX_MB} MB）"
+        )
+
+
+HTTP_CACHE = HttpCache()
+
+
+def backoff_delay(attempt):
+    """指数退避 + 随机抖动：在 [base/2, base] 之间取值，避免各线程同时重试"""
+    base = min(BACKOFF_BASE_DELAY * (2 ** (attempt - 1)), BACKOFF_MAX_DELAY)
+    return base / 2 + random.uniform(0, base / 2)
+
+
+def parse_retry_after(response):
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), BACKOFF_MAX_DELAY)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    seconds = retry_at.timestamp() - time.time()
+    return min(max(seconds, 0.0), BACKOFF_MAX_DELAY)
+
+
+def fetch_page(url, session=None, is_retry=False, attempt=None):
+    """
+    抓取页面，支持限流动态退避 + 多次重试
+    请求节奏由全局令牌桶 RATE_LIMITER 与自适应并发 CONCURRENCY 统一控制；
+    429 / 503 优先遵守 Retry-After，否则按带抖动的指数退避全局暂停；主机熔断期间先等待 BREAKER 放行。
+    未指定 session 时只在发出请求期间从共享 SessionPool 借用（等待熔断、令牌、槽位与退避时不占用），复用已建立的连接；
+    已缓存的页面发条件请求，304 时直接返回磁盘缓存中的页面。
+    指定 attempt（重试调度中的第几次请求）时只请求一次，失败后由调用方按楼层退避重新排队
+    """
+    single = attempt is not None
+    tries = range(attempt, attempt + 1) if single else range(1, MAX_RETRIES + 1)
+    limit = FLOOR_MAX_ATTEMPTS if single else MAX_RETRIES
+    for attempt in tries:
+        check_cancelled()
+        METRICS.record_wait("circuit", BREAKER.wait(url))
+        METRICS.record_attempt(attempt)
+        try:
+            conditional = HTTP_CACHE.conditional_headers(url)
+            METRICS.record_wait("rate_limit", RATE_LIMITER.acquire())
+            queued = time.monotonic()
+            with CONCURRENCY.slot(topic_key(url)):
+                started = time.monotonic()
+                METRICS.record_wait("slot", started - queued)
+                check_cancelled()
+                with SESSION_POOL.session() if session is None else nullcontext(session) as http:
+                    response = http.get(url, timeout=TIMEOUT, headers={**HEADERS, **conditional})
+                latency = time.monotonic() - started
+            METRICS.record_request(response.status_code, latency, *SESSION_POOL.record(response))
+
+            if response.status_code == 304 and conditional:
+                CONCURRENCY.on_success(latency)
+                BREAKER.record(url, True)
+                html = HTTP_CACHE.load(url)
+                if html is not None:
+                    return html
+                continue  # 缓存文件已失效，重新发不带条件的请求
+
+            if response.status_code in (429, 503):
+                retry_after = parse_retry_after(response)
+                backoff_time = retry_after if retry_after is not None else backoff_delay(min(attempt, MAX_RETRIES))
+                CONCURRENCY.on_throttle()
+                RATE_LIMITER.pause(backoff_time)
+                reason = "429 Too Many Requests" if response.status_code == 429 else "503 Service Unavailable"
+                print(f"请求失败({attempt}/{limit}): {url}，原因: {reason}，全局暂停 {backoff_time:.1f} 秒")
+                EVENTS.emit(
+                    "rate_limit",
+                    topic_key(url),
+                    throttle=True,
+                    status=response.status_code,
+                    pause_seconds=round(backoff_time, 1),
                 )
-                time.sleep(backoff_time)
                 continue
 
             response.raise_for_status()
+            CONCURRENCY.on_success(latency)
+            BREAKER.record(url, True)
+            HTTP_CACHE.store(url, response.headers, response.text)
             return response.text
 
         except Exception as e:
-            print(f"请求失败({attempt}/{MAX_RETRIES}): {url}，原因: {e}")
-            backoff_time = min(
-                BACKOFF_BASE_DELAY * (2 ** (attempt - 1)), BACKOFF_MAX_DELAY
-            )
-            time.sleep(backoff_time)
-
-    if not is_retry:
+            print(f"请求失败({attempt}/{limit}): {url}，原因: {e}")
+            METRICS.record_error()
+            BREAKER.record(url, not _is_host_failure(e))
+            EVENTS.emit("retry", topic_key(url), throttle=True, url=url, attempt=attempt, reason=str(e))
+            if attempt < tries[-1]:  # 最后一次失败后不再原地等待
+                delay = backoff_delay(attempt)
+                METRICS.record_wait("backoff", delay)
+                cancellable_sleep(delay)
+
+    if not (is_retry or single):
         print(f"⚠️ {url} 多次失败，交给补抓处理")
     return None
 
@@ -143,11 +875,15 @@ def fetch_all_floors(base_url, max_floor):
             print(f"❌ 楼层 {floor} 抓取失败，将稍后重试")
             pending.append(floor)  # 加回队列尾部
 
-        time.sleep(REQUEST_INTERVAL)  # 控制间隔
-
     return results
 
 
+def _month_index(yyyymm):
+    """"YYYYMM" 转为自公元 0 年起的月份序号，便于做月份加减（月份不合法时抛出 ValueError）"""
+    d = datetime.strptime(yyyymm, "%Y%m")
+    return d.year * 12 + d.month - 1
+
+
 def extract_post_title_and_yyyymm(html):
     """
     从帖子标题提取时间信息，支持多种日期格式：
@@ -157,8 +893,7 @@ def extract_post_title_and_yyyymm(html):
     4. 中文月份：2023年六月, 2023年6月
     5. 跨年范围：2023年12月-2024年1月
     """
-    soup = BeautifulSoup(html, "html.parser")
-    title = soup.title.string if soup.title else ""
+    title = extract_title(html) or ""
     # print(f"原始标题: {title}")  # 可开启调试
 
     yyyymm_list = []
@@ -224,16 +959,10 @@ def extract_post_title_and_yyyymm(html):
                     yyyymm_list.append(f"{year}{str(m).zfill(2)}")
             elif len(match) == 4:
                 start_year, start_month, end_year, end_month = match
-                start_date = pd.to_datetime(
-                    f"{start_year}{start_month.zfill(2)}", format="%Y%m"
-                )
-                end_date = pd.to_datetime(
-                    f"{end_year}{end_month.zfill(2)}", format="%Y%m"
-                )
-                current = start_date
-                while current <= end_date:
-                    yyyymm_list.append(current.strftime("%Y%m"))
-                    current += pd.DateOffset(months=1)
+                start = _month_index(f"{start_year}{start_month.zfill(2)}")
+                end = _month_index(f"{end_year}{end_month.zfill(2)}")
+                for index in range(start, end + 1):
+                    yyyymm_list.append(f"{index // 12:04d}{index % 12 + 1:02d}")
 
     # 5. 处理季度格式
     quarter_patterns = [r"(\d{4})年[第]?([一二三四1234])季度", r"(\d{4})年[Qq]([1234])"]
@@ -260,13 +989,10 @@ def extract_post_title_and_yyyymm(html):
         yyyymm = yyyymm_list[0]
     else:
         # 用月份差判断连续性
-        def month_diff(d1, d2):
-            return (d2.year - d1.year) * 12 + (d2.month - d1.month)
-
         is_continuous = True
-        dates = [pd.to_datetime(x, format="%Y%m") for x in yyyymm_list]
-        for i in range(1, len(dates)):
-            if month_diff(dates[i - 1], dates[i]) > 1:
+        months = [_month_index(x) for x in yyyymm_list]
+        for i in range(1, len(months)):
+            if months[i] - months[i - 1] > 1:
                 is_continuous = False
                 break
 
@@ -279,17 +1005,74 @@ def extract_post_title_and_yyyymm(html):
     return title, yyyymm
 
 
-def parse_chat_transcripts(html):
-    """解析聊天消息（自动清理用户名前缀）"""
-    soup = BeautifulSoup(html, "html.parser")
-    records = []
+def _is_transcript_class(value):
+    # 解析阶段 class 可能还是未拆分的原始字符串，需与 find_all 一样按空白拆分后匹配
+    if not value:
+        return False
+    if isinstance(value, str):
+        value = value.split()
+    return "chat-transcript" in value
+
+
+@lru_cache(maxsize=None)
+def _transcript_strainer():
+    """chat-transcript 节点之外的内容与消息无关，strainer / lxml 后端在解析阶段即可跳过"""
+    from bs4 import SoupStrainer
+
+    return SoupStrainer("div", class_=_is_transcript_class)
+
+
+_TITLE_RE = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+# BeautifulSoup 的 get_text() 不计入这些标签内的文字（脚本、样式、模板、注音）
+_NON_TEXT_TAGS = frozenset(["script", "style", "template", "rt", "rp"])
+
+
+def extract_title(html):
+    """
+    快速提取 <title> 文本，结果与 BeautifulSoup(html, "html.parser").title.string 一致
+    （无标题或标题为空时返回 None）；标题内含标签等特殊情况回退到 BeautifulSoup
+    """
+    m = _TITLE_RE.search(html)
+    if m is None:
+        return None
+    text = m.group(1)
+    if "<" in text:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        return soup.title.string if soup.title else None
+    if not text:
+        return None
+    return htmllib.unescape(text) if "&" in text else text
+
+
+_POST_ID_RE = re.compile(r"""\bid=["']post_(\d+)["']""")
+
+
+def page_window(html):
+    """楼层页渲染的楼层号范围 (最小, 最大)，取自 <div id="post_N">；页面中没有楼层号时返回 None"""
+    numbers = [int(n) for n in _POST_ID_RE.findall(html)]
+    return (min(numbers), max(numbers)) if numbers else None
 
-    for div in soup.find_all("div", class_="chat-transcript"):
-        mid = div.get("data-message-id")
-        username = div.get("data-username", "").strip()
-        created_at = div.get("data-datetime")
-        channel = div.get("data-channel-name", "未知频道")
 
+def _transcript_record(mid, username, created_at, channel, content):
+    """按原有规则组装一条消息：清理与用户名重复的前缀，空消息返回 None"""
+    # 清理与用户名重复的前缀
+    if username and content.startswith(username):
+        content = content[len(username) :].lstrip(
+            " ：: "
+        )  # 去掉全角/半角冒号与空格
+
+    # 去掉空消息
+    if not content:
+        return None
+
+    return ChatRecord.make(mid, username, channel, content, created_at)
+
+
+def _transcripts_from_soup(soup):
+    records = []
+    for div in soup.find_all("div", class_="chat-transcript"):
         # 尝试获取纯消息内容
         # 优先找 message 区块，否则取整个文本
         msg_div = div.find("div", class_="chat-transcript-message")
@@ -298,116 +1081,374 @@ def parse_chat_transcripts(html):
         else:
             content = div.get_text(separator="", strip=True)
 
-        # 清理与用户名重复的前缀
-        if username and content.startswith(username):
-            content = content[len(username) :].lstrip(
-                " ：: "
-            )  # 去掉全角/半角冒号与空格
+        record = _transcript_record(
+            div.get("data-message-id"),
+            div.get("data-username", "").strip(),
+            div.get("data-datetime"),
+            div.get("data-channel-name", "未知频道"),
+            content,
+        )
+        if record:
+            records.append(record)
+    return records
 
-        # 去掉空消息
-        if not content:
-            continue
 
-        records.append(
-            {
-                "message_id": mid,
-                "username": username,
-                "channel_name": channel,
-                "content": content,
-                "created_at": created_at,
-            }
+def _parse_transcripts_bs4(html):
+    """原始实现：html.parser 构建整棵文档树后查找聊天节点"""
+    from bs4 import BeautifulSoup
+
+    return _transcripts_from_soup(BeautifulSoup(html, "html.parser"))
+
+
+def _parse_transcripts_strainer(html):
+    """同样使用 html.parser，但只为 chat-transcript 节点及其子节点建树"""
+    if "chat-transcript" not in html:
+        return []
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser", parse_only=_transcript_strainer())
+    return _transcripts_from_soup(soup)
+
+
+def _lxml_text(el):
+    """等价于 BeautifulSoup 的 get_text(separator="", strip=True)"""
+    parts = []
+
+    def walk(node):
+        if node.text and node.tag not in _NON_TEXT_TAGS:
+            text = node.text.strip()
+            if text:
+                parts.append(text)
+        for child in node:
+            # 注释、处理指令的 tag 不是字符串，其自身文字不计入，但尾随文字属于父节点
+            if isinstance(child.tag, str) and child.tag not in _NON_TEXT_TAGS:
+                walk(child)
+            if child.tail:
+                tail = child.tail.strip()
+                if tail:
+                    parts.append(tail)
+
+    walk(el)
+    return "".join(parts)
+
+
+def _has_class(el, name):
+    return name in (el.get("class") or "").split()
+
+
+def _parse_transcripts_lxml(html):
+    """lxml（libxml2）解析，速度最快；需要 pip install lxml"""
+    if "chat-transcript" not in html:
+        return []
+    from lxml import etree, html as lxml_html
+
+    try:
+        root = lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return []
+    records = []
+    for div in root.iter("div"):
+        if not _has_class(div, "chat-transcript"):
+            continue
+        msg_div = next(
+            (d for d in div.iterdescendants("div") if _has_class(d, "chat-transcript-message")),
+            None,
         )
+        content = _lxml_text(msg_div if msg_div is not None else div)
+        record = _transcript_record(
+            div.get("data-message-id"),
+            div.get("data-username", "").strip(),
+            div.get("data-datetime"),
+            div.get("data-channel-name", "未知频道"),
+            content,
+        )
+        if record:
+            records.append(record)
+    return records
+
+
+@lru_cache(maxsize=None)
+def _auto_parser_backend():
+    try:
+        import lxml.html  # noqa: F401
+
+        return "lxml"
+    except ImportError:
+        return "strainer"
+
+
+def _parse_transcripts_auto(html):
+    return PARSER_BACKENDS[_auto_parser_backend()](html)
+
+
+PARSER_BACKENDS = {
+    "auto": _parse_transcripts_auto,
+    "bs4": _parse_transcripts_bs4,
+    "strainer": _parse_transcripts_strainer,
+    "lxml": _parse_transcripts_lxml,
+}
+
 
+def parse_chat_transcripts(html, backend=None):
+    """解析聊天消息（自动清理用户名前缀）；backend 默认为 PARSER_BACKEND"""
+    started = time.perf_counter()
+    records = PARSER_BACKENDS[backend or PARSER_BACKEND](html)
+    METRICS.record_parse(time.perf_counter() - started, len(html))
     return records
 
 
+def _timed_parse(html):
+    """解析进程中执行：返回 (消息, 解析耗时)，耗时由主进程计入指标"""
+    started = time.perf_counter()
+    records = PARSER_BACKENDS[PARSER_BACKEND](html)
+    return records, time.perf_counter() - started, len(html)
+
+
 def deduplicate_records(records):
     seen = set()
     unique = []
     for r in records:
-        mid = r["message_id"]
-        if mid and mid not in seen:
+        mid = r.message_id
+        if mid is not None and mid != "" and mid not in seen:
             seen.add(mid)
             unique.append(r)
     return unique
 
 
-def get_max_floors(base_url):
-    print("正在自动检测最大楼层数（Stage1）...")
-    seen_ids = set()
-    last_floor_with_new_ids = 1
+class PageCache:
+    """
+    单次抓取内的楼层解析结果缓存（按楼层 URL 索引，线程安全）
+    探测阶段写入，正式抓取与补抓读取，避免同一楼层重复下载和解析。
+    按估算内存占用限制容量，超出上限时淘汰最近最少使用的楼层。
+    """
+
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # url -> (records, size)
+        self._windows = {}  # url -> 该页渲染的楼层号范围 (lo, hi)，只有两个整数，不参与淘汰
+        self._lock = threading.Lock()
+        self.size = 0
+        self.peak_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _estimate_size(records):
+        size = sys.getsizeof(records)
+        for r in records:
+            size += sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r)
+        return size
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, url, records):
+        # 空页不缓存：补抓时仍会重新请求，与原有行为一致
+        if not records:
+            return
+        size = self._estimate_size(records)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[url] = (records, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+            self.peak_size = max(self.peak_size, self.size)
+
+    def put_window(self, url, window):
+        if window is not None:
+            with self._lock:
+                self._windows[url] = window
+
+    def window(self, url):
+        with self._lock:
+            return self._windows.get(url)
+
+    def report(self):
+        print(
+            f"页面缓存：命中 {self.hits} 次，未命中 {self.misses} 次，"
+            f"淘汰 {self.evictions} 页，峰值占用约 {self.peak_size / 1024 / 1024:.1f} MB"
+        )
+
+
+def _ids_of(records):
+    return {r.message_id for r in records if r.message_id is not None and r.message_id != ""}
+
+
+def _probe_floor_ids(base_url, floor, cache=None):
+    """探测单个楼层，返回该页的消息 ID 集合（无消息时为空集合，抓取失败时为 None）"""
+    records = fetch_and_parse_page(base_url, floor, is_retry=True, cache=cache)
+    return None if records is None else _ids_of(records)
+
+
+def _gallop_floors():
+    """倍增探测序列：1, 2, 4, 8 … 直到 STAGE1_MAX（上限本身也会被探测）"""
+    floors = []
     floor = 1
-    consecutive_empty = 0
+    while floor < STAGE1_MAX:
+        floors.append(floor)
+        floor *= 2
+    floors.append(STAGE1_MAX)
+    return floors
 
-    # Stage 1
-    while True:
-        test_url = base_url if floor == 1 else f"{base_url}/{floor}"
-        html = fetch_page(test_url)
-        if not html:
-            print(f"探测中断：第 {floor} 页无法获取或返回空内容，停止 Stage1")
-            break
-        records = parse_chat_transcripts(html)
-        ids = {r["message_id"] for r in records if r.get("message_id")}
-        if not ids:
-            consecutive_empty += 1
-            if consecutive_empty >= STOP_ON_EMPTY:
-                print(f"Stage1: 连续 {STOP_ON_EMPTY} 页无有效消息，停止 Stage1 探测")
+
+def _discovery_steps(topic=None):
+    """
+    楼层探测的判定流程（生成器，与具体抓取方式无关）
+    每次 yield 一批需要并发探测的楼层，调用方 send 回 {楼层: 消息 ID 集合}（抓取失败的楼层为 None）；
+    结束时以 return 返回最后出现新消息的楼层。线程池与 asyncio 引擎共用此流程。
+    抓取失败的楼层先补探 DISCOVERY_PROBE_RETRIES 轮，仍失败则视为未知：
+    既不当作空页（不会被判为尾部），也不计入 Stage2 的连续空页。
+    """
+    print("正在自动检测最大楼层数（Stage1：倍增 + 二分）...")
+    probed = {}  # floor -> 消息 ID 集合（None 表示多次探测失败，内容未知）
+    stage1_probes = 0
+    stage2_probes = 0
+
+    def probe(floors):
+        todo = [f for f in floors if f not in probed]
+        sent = 0
+        for _ in range(DISCOVERY_PROBE_RETRIES + 1):
+            if not todo:
                 break
-        else:
-            consecutive_empty = 0
-            new_ids = ids - seen_ids
-            if new_ids:
-                last_floor_with_new_ids = floor
-            seen_ids.update(ids)
-        if floor % PROGRESS_EVERY == 0:
-            print(
-                f"Stage1 已探测到第 {floor} 页，当前 last_new_floor={last_floor_with_new_ids}"
+            sent += len(todo)
+            probed.update((yield todo))
+            todo = [f for f in todo if probed[f] is None]
+        if todo:
+            print(f"⚠️ 第 {todo} 页多次探测失败，视为未知，不作为尾部判定依据")
+        if sent:
+            EVENTS.emit(
+                "discovery",
+                topic,
+                throttle=True,
+                probes=len(probed),
+                highest_probed=max(probed),
+                highest_with_messages=max((f for f, ids in probed.items() if ids), default=0),
             )
-        floor += 1
-        if floor > STAGE1_MAX:
-            print(f"达到 Stage1 上限 {STAGE1_MAX}，停止 Stage1")
+        return sent
+
+    # Stage 1a：倍增探测，找到第一个“已到尾部”的探测点
+    gallop = _gallop_floors()
+    tail_floor = None
+    prev = None
+    for i in range(0, len(gallop), DISCOVERY_WAVE):
+        wave = gallop[i : i + DISCOVERY_WAVE]
+        stage1_probes += yield from probe(wave)
+        for floor in wave:
+            ids = probed[floor]
+            if ids is None:
+                continue
+            if not ids:
+                tail_floor = floor
+            elif (
+                prev is not None
+                and floor - prev >= PLATEAU_MIN_GAP
+                and ids <= probed[prev]
+            ):
+                tail_floor = floor
+            if tail_floor is not None:
+                break
+            prev = floor
+        if tail_floor is not None:
             break
+        print(f"Stage1 倍增探测到第 {wave[-1]} 页，内容仍在增长")
+
+    if tail_floor is None:
+        print(f"达到 Stage1 上限 {STAGE1_MAX}，停止 Stage1")
+        last_floor_with_new_ids = STAGE1_MAX
+    elif probed[1] == set():
+        print("Stage1: 首页无有效消息")
+        last_floor_with_new_ids = 1
+    else:
+        # Stage 1b：尾页内容即“最终窗口”；某页的消息全部包含于最终窗口即视为已到尾部
+        final_ids = probed[tail_floor]
+
+        # 探测失败的楼层按“未到尾部”处理：宁可多抓几页，也不漏掉尾部楼层
+        def reached_tail(floor):
+            ids = probed[floor]
+            return ids is not None and ids <= final_ids
+
+        hi = min(f for f in probed if f <= tail_floor and reached_tail(f))
+        lo = max((f for f in probed if f < hi), default=0)
+        while hi - lo > 1:
+            step = (hi - lo) / (min(DISCOVERY_WAVE, hi - lo - 1) + 1)
+            points = sorted({int(lo + step * k) for k in range(1, DISCOVERY_WAVE + 1)})
+            points = [f for f in points if lo < f < hi]
+            stage1_probes += yield from probe(points)
+            for floor in points:
+                if reached_tail(floor):
+                    hi = floor
+                    break
+                lo = floor
+        # 尾页为空时，hi 是第一个空页，最后有消息的楼层是 lo
+        last_floor_with_new_ids = hi if final_ids else lo
 
-    print(f"Stage1 完成，记录到最后出现新消息的楼层: {last_floor_with_new_ids}")
+    print(
+        f"Stage1 完成，记录到最后出现新消息的楼层: {last_floor_with_new_ids}"
+        f"（探测 {stage1_probes} 次）"
+    )
 
-    # Stage 2
+    # Stage 2：尾部确认，每轮并发探测 TAIL_STOP_EMPTY 页，按楼层顺序判定
     print("开始尾部确认（Stage2）...")
+    seen_ids = set().union(*(ids for ids in probed.values() if ids))
     consecutive_no_new = 0
     check_floor = last_floor_with_new_ids + 1
-    tail_checked = 0
-    while tail_checked < TAIL_MAX:
-        test_url = f"{base_url}/{check_floor}"
-        html = fetch_page(test_url)
-        if not html:
-            consecutive_no_new += 1
-            if consecutive_no_new >= TAIL_STOP_EMPTY:
-                print(f"Stage2: 连续 {TAIL_STOP_EMPTY} 页无法获取或无新数据，停止")
-                break
-        else:
-            records = parse_chat_transcripts(html)
-            ids = {r["message_id"] for r in records if r.get("message_id")}
-            new_ids = ids - seen_ids if ids else set()
+    tail_end = check_floor + TAIL_MAX
+    done = False
+    while check_floor < tail_end and not done:
+        wave = list(range(check_floor, min(check_floor + TAIL_STOP_EMPTY, tail_end)))
+        stage2_probes += yield from probe(wave)
+        for floor in wave:
+            if probed[floor] is None:
+                continue
+            new_ids = probed[floor] - seen_ids
             if new_ids:
-                last_floor_with_new_ids = check_floor
-                seen_ids.update(ids)
+                last_floor_with_new_ids = floor
+                seen_ids.update(new_ids)
                 consecutive_no_new = 0
                 print(
-                    f"Stage2: 在第 {check_floor} 页发现新消息，更新 last_floor={last_floor_with_new_ids}"
+                    f"Stage2: 在第 {floor} 页发现新消息，更新 last_floor={last_floor_with_new_ids}"
                 )
             else:
                 consecutive_no_new += 1
                 if consecutive_no_new >= TAIL_STOP_EMPTY:
                     print(f"Stage2: 连续 {TAIL_STOP_EMPTY} 页无新数据，停止")
+                    done = True
                     break
-        check_floor += 1
-        tail_checked += 1
+        check_floor = wave[-1] + 1
 
     print(f"Stage2 完成，最终检测到最大楼层: {last_floor_with_new_ids}")
+    EVENTS.emit("discovery", topic, probes=len(probed), max_floors=last_floor_with_new_ids, done=True)
+    print(
+        f"楼层探测共发起 {stage1_probes + stage2_probes} 次探测请求"
+        f"（Stage1 {stage1_probes} 次，Stage2 {stage2_probes} 次）"
+    )
+    return last_floor_with_new_ids
+
 
-    if last_floor_with_new_ids < MIN_ACCEPT or last_floor_with_new_ids > MAX_ACCEPT:
+def _confirm_max_floors(detected):
+    """检测结果超出合理范围时提示人工确认（非交互模式下只提示，直接采用自动结果）"""
+    if detected < MIN_ACCEPT or detected > MAX_ACCEPT:
+        if not INTERACTIVE or not sys.stdin.isatty():
+            print(f"⚠️ 检测结果可能异常（{detected}），非交互模式下采用自动结果")
+            return detected
         try:
             user_input = input(
-                f"检测结果可能异常（{last_floor_with_new_ids}），请输入楼层数或回车接受自动结果: "
+                f"检测结果可能异常（{detected}），请输入楼层数或回车接受自动结果: "
             ).strip()
             if user_input:
                 manual_val = int(user_input)
@@ -415,115 +1456,2052 @@ def get_max_floors(base_url):
                 return manual_val
         except Exception:
             pass
+    return detected
 
-    return last_floor_with_new_ids
 
+def get_max_floors(base_url, cache=None):
+    """
+    自动探测最大楼层数
+    Stage1：按 1, 2, 4, 8 … 倍增探测，直到页面为空或内容不再增长，
+            再在最后两个探测点之间多路二分，定位“最后出现新消息 ID 的楼层”。
+            每一轮的探测点并发请求（并发数不超过 DISCOVERY_WAVE）。
+    Stage2：从该楼层之后逐页做尾部确认，连续若干页无新消息才停止。
+    传入 cache 时，探测到的楼层会写入缓存，供随后的正式抓取复用。
+    """
+    steps = _discovery_steps(topic_key(base_url))
+    with ThreadPoolExecutor(max_workers=DISCOVERY_WAVE) as executor:
+        try:
+            floors = next(steps)
+            while True:
+                results = executor.map(lambda f: _probe_floor_ids(base_url, f, cache), floors)
+                floors = steps.send(dict(zip(floors, results)))
+        except StopIteration as stop:
+            detected = stop.value
+    return _confirm_max_floors(detected)
 
-def crawl_post(base_url):
-    print(f"开始抓取首页以获取标题和时间信息: {base_url}")
-    first_page_html = fetch_page(base_url)
-    if not first_page_html:
-        print(f"[{base_url}] 首页请求失败，跳过")
-        return
 
-    soup = BeautifulSoup(first_page_html, "html.parser")
-    title = soup.title.string if soup.title else "未命名"
+def page_title(html):
+    return extract_title(html) or "未命名"
+
 
-    # 生成标准格式文件名
+def output_path_for_title(title):
+    """生成标准格式文件名（保留原始命名逻辑）"""
     clean_title = simplify_title_for_filename(title)
     output_name = sanitize_filename(clean_title) + ".csv"
-    output_file = os.path.join(INPUT_DIR, output_name)
+    return os.path.join(INPUT_DIR, output_name)
 
-    # 自动探测楼层
-    max_floors = get_max_floors(base_url)
 
-    # 第一次抓取
-    all_records = parse_chat_transcripts(first_page_html)
-    fetched_floors = {1} if all_records else set()
+CSV_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {
-            executor.submit(fetch_and_parse_page, base_url, floor): floor
-            for floor in range(2, max_floors + 1)
-        }
-        for future in as_completed(futures):
-            floor = futures[future]
+
+class CsvStreamWriter:
+    """
+    流式 CSV 写出（保留原始字段与命名逻辑）
+    楼层抓完即交给 add()，按楼层顺序边抓边写：内存中只保留乱序到达、尚未轮到的楼层（重排缓冲）
+    和已写出的消息 ID 集合（即时去重）。先写同目录下的临时文件，close() 时 fsync 后原子改名，
+    csvLoader.js 只会看到完整的文件；可选 gzip / zstd 压缩。
+    指定 store（chat_store.ChatStore）时，写出的消息同时按 message_id 写入数据库。
+    写出的同时累计统计，发布 CSV 后在旁边写清单文件（csv_manifest）。
+    指定 index（message_index.MessageIndex）时，已归档在其他 CSV 中的消息在进入重排缓冲前丢弃，
+    发布 CSV 后把本次写出的消息登记到索引。
+    """
+
+    def __init__(self, output_file, compression=None, store=None, topic=None, source_url=None, index=None):
+        compression = compression or CSV_COMPRESSION
+        self.path = output_file + CSV_SUFFIXES[compression]
+        if compression == "zstd":
+            import zstandard  # 先于创建临时文件导入：未安装时直接报错，不在输出目录留下 .tmp 文件
+        fd, self._tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path) or ".", prefix=os.path.basename(self.path) + ".", suffix=".tmp"
+        )
+        self._raw = os.fdopen(fd, "wb")
+        try:
+            if compression == "gzip":
+                self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb")
+            elif compression == "zstd":
+                self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+            else:
+                self._stream = self._raw
+            self._text = io.TextIOWrapper(self._stream, encoding="utf-8-sig", newline="")
+            self._writer = csv.writer(self._text)
+            self._writer.writerow(CSV_FIELDNAMES)  # ChatRecord 按 CSV_FIELDNAMES 顺序存放，直接按行写出
+        except BaseException:
+            self._raw.close()
+            os.remove(self._tmp_path)
+            raise
+        self._seen = set()
+        self._pending = {}  # 楼层 -> 消息，等待前面的楼层完成
+        self._skipped = set()  # 跳层抓取时不会抓取的楼层，写出时直接跳过
+        self._next_floor = 1
+        self.written = 0
+        self._store = store
+        self._topic = topic
+        self._source_url = source_url
+        self._index = index
+        self._owner = owner_of_path(self.path)
+        self._known = set()  # 已归档在其他 CSV 中而丢弃的消息 ID
+        self.known_floors = 0  # 消息全部已归档、没有新消息的楼层数
+        self.stats = ManifestStats()
+
+    def _write(self, records):
+        fresh = []
+        for r in records:
+            mid = r.message_id
+            if mid is not None and mid != "" and mid not in self._seen:
+                self._seen.add(mid)
+                fresh.append(r)
+        self._writer.writerows(fresh)
+        self.stats.add_all(fresh)
+        self.written += len(fresh)
+        if self._store is not None and fresh:
+            self._store.upsert(fresh, topic=self._topic)
+
+    def plan(self, floors):
+        """跳层抓取：声明接下来只会抓取 floors 中的楼层，其余楼层不再等待"""
+        floors = set(floors)
+        if floors:
+            self._skipped = set(range(self._next_floor, max(floors) + 1)) - floors
+            self._advance()
+
+    def _advance(self):
+        while True:
+            if self._next_floor in self._pending:
+                self._write(self._pending.pop(self._next_floor))
+            elif self._next_floor not in self._skipped:
+                return
+            self._next_floor += 1
+
+    def _drop_known(self, records):
+        """丢弃已归档在其他 CSV 中的消息；整层都已归档时直接按空楼层处理"""
+        fresh = []
+        for r in records:
+            mid = r.message_id
+            if mid in self._seen or not self._index.known_elsewhere(mid, self._owner):
+                fresh.append(r)
+            else:
+                self._known.add(mid)
+        self.known_floors += not fresh
+        return fresh
+
+    @property
+    def skipped_known(self):
+        """已归档在其他 CSV 中而丢弃的消息数（按 ID 去重）"""
+        return len(self._known)
+
+    def add(self, floor, records):
+        """某个楼层已完成（包括没有消息或抓取失败的楼层），写出所有已连续完成的楼层"""
+        if self._index is not None and records:
+            records = self._drop_known(records)
+        if floor < self._next_floor:
+            # 补抓回来的楼层：前面的楼层早已写出，直接追加
+            self._write(records)
+            return
+        self._pending[floor] = records
+        self._advance()
+        while len(self._pending) > CSV_REORDER_MAX_FLOORS:
+            floor = min(self._pending)
+            self._write(self._pending.pop(floor))
+            self._next_floor = floor + 1
+            self._advance()
+
+    def _close_file(self):
+        self._text.flush()
+        self._text.detach()
+        if self._stream is not self._raw:
+            self._stream.close()  # 写出压缩流尾部，不关闭底层文件
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+    def close(self, title, floors=None):
+        """写出剩余楼层并发布正式文件与清单，返回写出的消息数"""
+        for floor in sorted(self._pending):
+            self._write(self._pending[floor])
+        self._pending.clear()
+        self._close_file()
+        os.replace(self._tmp_path, self.path)
+        write_manifest(self.path, self.stats, self._source_url, title, floors)
+        print(f"[{title}] 抓取完成，共 {self.written} 条消息，已保存到 {self.path}")
+        if self._index is not None:
+            if self.skipped_known:
+                print(
+                    f"[{title}] 跳过 {self.skipped_known} 条已归档在其他 CSV 中的消息"
+                    f"（{self.known_floors} 个楼层没有新消息）"
+                )
             try:
-                floor_records = future.result()
-            except Exception as e:
-                print(f"楼层 {floor} 抓取时发生异常: {e}")
-                floor_records = []
-            if floor_records:
-                fetched_floors.add(floor)
-                all_records.extend(floor_records)
-
-    # 自动补抓缺失楼层
-    missing_floors = set(range(1, max_floors + 1)) - fetched_floors
-    round_num = 1
-    while missing_floors and round_num <= MAX_SUPPLEMENT_ROUNDS:
-        print(f"开始第 {round_num} 轮补抓，缺失楼层数: {len(missing_floors)}")
-        new_fetched = set()
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {
-                executor.submit(fetch_and_parse_page, base_url, floor): floor
-                for floor in missing_floors
-            }
-            for future in as_completed(futures):
-                floor = futures[future]
+                self._index.commit(self._owner, self._seen)
+            except OSError as e:
+                print(f"⚠️ 消息索引更新失败（python message_index.py rebuild 可重建）: {e}")
+        if self._store is not None:
+            print(f"[{title}] 已写入数据库 {self._store.path}（共 {self._store.count()} 条消息）")
+            self._store.close()
+        return self.written
+
+    def abort(self):
+        """抓取中途失败：丢弃临时文件，已有的正式文件保持不变（已写入数据库的消息保留）"""
+        if self._store is not None:
+            self._store.close()
+        if self._raw.closed:
+            return
+        try:
+            self._close_file()
+        finally:
+            os.remove(self._tmp_path)
+
+
+_MESSAGE_INDEXES = {}  # INPUT_DIR -> MessageIndex（同一进程内的各个帖子共用）
+_MESSAGE_INDEX_LOCK = threading.Lock()
+
+
+def message_index():
+    """
+    本进程共用的已归档消息索引；索引文件不存在时按 INPUT_DIR 下已有的 CSV 自动重建。
+    每次取用时丢弃所属 CSV 已被删除或改名的条目，这些消息不再算已归档
+    """
+    with _MESSAGE_INDEX_LOCK:
+        index = _MESSAGE_INDEXES.get(INPUT_DIR)
+        if index is None:
+            index = MessageIndex(data_dir=INPUT_DIR)
+            if not index.load():
+                counts, duplicates = index.rebuild()
+                print(f"已按现有 CSV 建立消息索引：{len(index)} 条消息，{len(counts)} 个 CSV（{index.path}）")
+                if duplicates:
+                    print(f"⚠️ 现有 CSV 之间有 {duplicates} 条重复消息，重新抓取后续帖子即可去掉")
+            _MESSAGE_INDEXES[INPUT_DIR] = index
+    try:
+        dropped = index.prune_missing()
+    except OSError as e:
+        print(f"⚠️ 消息索引更新失败（python message_index.py rebuild 可重建）: {e}")
+    else:
+        if dropped:
+            print(f"消息索引：所属 CSV 已不存在，丢弃 {dropped} 条")
+    return index
+
+
+def open_output(output_file, base_url):
+    """创建本次抓取的输出：流式 CSV，以及指定了 SQLITE_PATH 时的 SQLite 数据库"""
+    store = None
+    if SQLITE_PATH:
+        from chat_store import ChatStore
+
+        store = ChatStore(SQLITE_PATH)
+    index = message_index() if MESSAGE_INDEX_ENABLED else None
+    writer = CsvStreamWriter(output_file, store=store, topic=topic_key(base_url), source_url=base_url, index=index)
+    EVENTS.emit("topic_start", topic_key(base_url), url=base_url, output=writer.path)
+    return writer
+
+
+def topic_summary(base_url, title, output_file, messages, floors, missing_floors, started, skipped_known=0):
+    summary = {
+        "url": base_url,
+        "title": title,
+        "output": output_file,
+        "messages": messages,
+        "floors": floors,
+        "missing": len(missing_floors),
+        "skipped_known": skipped_known,
+        "seconds": time.monotonic() - started,
+    }
+    EVENTS.emit("output", topic_key(base_url), **summary)
+    return summary
+
+
+def topic_failed(base_url, reason):
+    """帖子抓取失败：输出日志与 topic_failed 事件"""
+    print(f"[{base_url}] {reason}")
+    EVENTS.emit("topic_failed", topic_key(base_url), url=base_url, reason=reason)
+
+
+def report_batch(urls, summaries, started):
+    """批量抓取汇总：每个帖子一行，加上合计吞吐"""
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print("========== 批量抓取汇总 ==========")
+    for url, s in zip(urls, summaries):
+        if s is None:
+            print(f"❌ {url}：失败")
+            continue
+        missing = f"，缺失 {s['missing']} 层" if s["missing"] else ""
+        known = f"，跳过已归档 {s['skipped_known']} 条" if s.get("skipped_known") else ""
+        print(
+            f"✅ {os.path.basename(s['output'])}：{s['messages']} 条消息{known}，{s['floors']} 层{missing}，"
+            f"{s['seconds']:.1f} 秒"
+        )
+    done = [s for s in summaries if s]
+    messages = sum(s["messages"] for s in done)
+    floors = sum(s["floors"] for s in done)
+    print(
+        f"合计：成功 {len(done)}/{len(urls)} 个帖子，{floors} 层，{messages} 条消息，"
+        f"成功请求 {CONCURRENCY.completed} 次；用时 {elapsed:.1f} 秒，"
+        f"{CONCURRENCY.completed / elapsed:.2f} 次请求/秒，{messages / elapsed:.0f} 条消息/秒"
+    )
+
+
+def report_run_stats(started, summaries=()):
+    """输出本次抓取耗时与进程峰值内存，便于比较不同抓取引擎；同时写出指标摘要（JSON / Prometheus）"""
+    elapsed = time.monotonic() - started
+    peak_mb = peak_memory_mb()
+    if peak_mb is not None:
+        print(f"总耗时 {elapsed:.1f} 秒，进程峰值内存 {peak_mb:.1f} MB")
+    else:
+        print(f"总耗时 {elapsed:.1f} 秒")
+
+    metrics = METRICS.summary(summaries)
+    print_summary(metrics)
+    path = METRICS_PATH or os.path.join(INPUT_DIR, ".metrics", "crawl-metrics.json")
+    try:
+        write_json(path, metrics)
+        if METRICS_PROM_PATH:
+            write_prometheus(METRICS_PROM_PATH, metrics)
+    except OSError as e:
+        print(f"⚠️ 指标文件写入失败: {e}")
+        path = None
+    else:
+        print(f"抓取指标已写入 {path}" + (f"，{METRICS_PROM_PATH}" if METRICS_PROM_PATH else ""))
+    done = [s for s in summaries if s]
+    EVENTS.emit(
+        "done",
+        topics=len(done),
+        failed=len(summaries) - len(done),
+        messages=sum(s["messages"] for s in done),
+        requests=metrics["requests"]["total"],
+        seconds=round(elapsed, 1),
+        metrics=path,
+    )
+
+
+def topic_key(base_url):
+    """帖子的稳定标识（用于断点日志等按帖子存放的文件名）"""
+    m = re.search(r"/t/(?:[^/]+/)?(\d+)", base_url)
+    if m:
+        return f"topic-{m.group(1)}"
+    return "url-" + hashlib.sha1(base_url.encode("utf-8")).hexdigest()[:16]
+
+
+class CrawlJournal:
+    """
+    单个帖子的断点日志（JSON Lines，逐条追加写入）
+    依次记录帖子信息、探测到的最大楼层、每个抓到消息的楼层及其消息、每轮补抓后的缺失楼层。
+    进程中途退出后，用 --resume 读取日志即可跳过已完成的楼层；抓取完成、CSV 写出后删除日志。
+    只由汇总结果的主线程（或事件循环）写入，不需要加锁。
+    """
+
+    def __init__(self, base_url):
+        self.path = os.path.join(INPUT_DIR, CHECKPOINT_DIRNAME, topic_key(base_url) + ".jsonl")
+        self._file = None
+        self._unsynced = 0
+
+    def load(self):
+        """读取已有日志；不存在或没有帖子信息时返回 None。崩溃时写了一半的末行会被忽略"""
+        if not os.path.exists(self.path):
+            return None
+        state = {"meta": None, "max_floor": None, "floors": {}, "windows": {}, "missing": None}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
                 try:
-                    floor_records = future.result()
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                kind = entry.get("type")
+                if kind == "meta":
+                    state["meta"] = entry
+                elif kind == "max_floor":
+                    state["max_floor"] = entry["value"]
+                elif kind == "floor":
+                    state["floors"][entry["floor"]] = [ChatRecord.load(r) for r in entry["records"]]
+                    if entry.get("window"):
+                        state["windows"][entry["floor"]] = tuple(entry["window"])
+                elif kind == "missing":
+                    state["missing"] = entry["floors"]
+        return state if state["meta"] else None
+
+    def _open(self, mode):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if mode == "a" and os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            # 上次中断时末行可能只写了一半，先补一个换行，避免与新内容粘连
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+            self._file = open(self.path, "a", encoding="utf-8")
+            if torn:
+                self._file.write("\n")
+        else:
+            self._file = open(self.path, mode, encoding="utf-8")
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= CHECKPOINT_FSYNC_EVERY:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def begin(self, base_url, title, output_file, first_page_records, first_page_window=None):
+        """开始一次全新的抓取（覆盖旧日志）"""
+        self._open("w")
+        self._write({"type": "meta", "base_url": base_url, "title": title, "output_file": output_file})
+        if first_page_records:
+            self.record_floor(1, first_page_records, first_page_window)
+
+    def reopen(self):
+        """续抓：在旧日志后继续追加"""
+        self._open("a")
+
+    def record_max_floor(self, max_floor):
+        self._write({"type": "max_floor", "value": max_floor})
+
+    def record_floor(self, floor, records, window=None):
+        entry = {"type": "floor", "floor": floor, "records": records}
+        if window is not None:
+            entry["window"] = list(window)  # 续抓时用于跳层抓取的覆盖检查
+        self._write(entry)
+
+    def record_missing(self, floors):
+        self._write({"type": "missing", "floors": sorted(floors)})
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """抓取结果已写出，删除断点日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _resume_from_journal(base_url, journal, cache):
+    """
+    --resume 时从断点日志恢复：返回 (title, output_file, max_floors, floor_records)，
+    floor_records 为 {楼层: 消息}，max_floors 在探测阶段尚未完成时为 None；
+    没有可用日志时返回 None（按全新抓取处理）
+    """
+    if not RESUME:
+        return None
+    state = journal.load()
+    if state is None:
+        print("未找到可用的断点日志，从头开始抓取")
+        return None
+
+    floor_records = state["floors"]
+    for floor, records in floor_records.items():
+        # 已抓到的楼层放入页面缓存，若需重新探测楼层也可直接复用
+        cache.put(floor_url(base_url, floor), records)
+        cache.put_window(floor_url(base_url, floor), state["windows"].get(floor))
+    max_floors = state["max_floor"]
+    journal.reopen()
+
+    meta = state["meta"]
+    total = f"/{max_floors}" if max_floors else ""
+    print(
+        f"从断点日志恢复：已完成 {len(floor_records)}{total} 个楼层，"
+        f"{sum(len(r) for r in floor_records.values())} 条消息（{journal.path}）"
+    )
+    return meta["title"], meta["output_file"], max_floors, floor_records
+
+
+# ===== 原始页面归档（--archive）与离线重建（--reparse） =====
+# 抓取时每个楼层页的 HTML 压缩存入帖子的归档文件（page_archive.PageArchive，按内容寻址、按楼层索引），
+# 解析规则改变后 --reparse 用全部 CPU 核并行解析归档中的页面，重新生成 CSV，不发出任何请求。
+
+_ARCHIVES = {}  # 帖子标识 -> 抓取中的 PageArchive
+_ARCHIVES_LOCK = threading.Lock()
+
+
+def archive_path(base_url):
+    return os.path.join(archive_dir(INPUT_DIR), topic_key(base_url) + ARCHIVE_SUFFIX)
+
+
+def open_archive(base_url, title, resume=False):
+    """开始归档本帖抓到的页面（未启用 --archive 时不做任何事）；续抓时接着上次中断的归档写"""
+    if not ARCHIVE_PAGES:
+        return
+    archive = PageArchive.for_crawl(archive_path(base_url), resume=resume)
+    archive.set_meta(base_url=base_url, title=title, transport=TRANSPORT)
+    with _ARCHIVES_LOCK:
+        _ARCHIVES[topic_key(base_url)] = archive
+
+
+def archive_page(base_url, floor, html):
+    """抓到一个楼层页后调用（抓取线程中执行）；本帖没有在归档时直接返回"""
+    archive = _ARCHIVES.get(topic_key(base_url))
+    if archive is not None and html:
+        archive.put(floor, html)
+
+
+def close_archive(base_url, max_floor):
+    """抓取完成：发布归档"""
+    with _ARCHIVES_LOCK:
+        archive = _ARCHIVES.pop(topic_key(base_url), None)
+    if archive is None:
+        return
+    archive.set_meta(max_floor=max_floor)
+    path = archive.publish()
+    stats = archive.stats()
+    print(
+        f"页面归档：{stats['floors']} 个楼层，{stats['pages']} 个不同页面，"
+        f"{archive.raw_bytes / 1024 / 1024:.1f} MB 压缩为 {stats['compressed_bytes'] / 1024 / 1024:.1f} MB（{path}）"
+    )
+
+
+def abort_archive(base_url):
+    """抓取中途失败：保留 .partial，--resume 时在其后续写"""
+    with _ARCHIVES_LOCK:
+        archive = _ARCHIVES.pop(topic_key(base_url), None)
+    if archive is not None:
+        archive.close()
+
+
+def _reparse_blob(blob):
+    """解析进程中执行：解压归档中的页面并解析，返回 (消息, 解析耗时, 页面长度)"""
+    return _timed_parse(zlib.decompress(blob).decode("utf-8"))
+
+
+def reparse_archive(path, executor):
+    """
+    按页面归档重建一个帖子的 CSV，返回摘要。不同的页面各解析一次（按楼层顺序分给解析进程），
+    结果按楼层顺序交给 CsvStreamWriter，去重、跨帖子索引、清单与数据库写入与抓取时相同。
+    标题在有首页时按当前规则从首页重新提取。
+    """
+    started = time.monotonic()
+    archive = PageArchive.read(path)
+    meta = archive.meta
+    base_url = meta.get("base_url") or path
+    max_floor = meta.get("max_floor")
+    # 探测阶段请求过的末尾之后的楼层也在归档中，与抓取时一样只写出最大楼层以内的楼层
+    floors = sorted(f for f in archive.floors if not max_floor or f <= max_floor)
+    if not floors:
+        topic_failed(base_url, f"归档中没有页面，跳过: {path}")
+        return None
+    title = meta.get("title") or "未命名"
+    if meta.get("transport", "html") == "html" and 1 in archive.floors:
+        title = page_title(archive.page(1))
+    print(f"[{title}] 从归档重建：{len(floors)} 个楼层，{len(archive.blobs)} 个不同页面（{path}）")
+
+    # 同一页面可能对应多个楼层：只解析一次，结果保留到最后一个使用它的楼层
+    shas = [archive.floors[f] for f in floors]
+    order = list(dict.fromkeys(shas))
+    last_use = {sha: i for i, sha in enumerate(shas)}
+    writer = open_output(output_path_for_title(title), base_url)
+    try:
+        writer.plan(floors)
+        results = executor.map(_reparse_blob, archive.iter_blobs(order), chunksize=4)
+        parsed = {}
+        for i, (floor, sha) in enumerate(zip(floors, shas)):
+            check_cancelled()
+            if sha not in parsed:
+                records, seconds, size = next(results)
+                METRICS.record_parse(seconds, size)
+                parsed[sha] = records
+            writer.add(floor, parsed[sha])
+            if last_use[sha] == i:
+                del parsed[sha]
+            EVENTS.progress(topic_key(base_url), "重建楼层", i + 1, len(floors), started, writer.written)
+    except BaseException:
+        writer.abort()
+        raise
+    max_floor = max_floor or floors[-1]
+    with METRICS.stage("write"):
+        messages = writer.close(title, floors=max_floor)
+    return topic_summary(base_url, title, writer.path, messages, max_floor, set(), started, writer.skipped_known)
+
+
+def reparse_archives(urls=()):
+    """--reparse：重建指定帖子（默认全部已归档的帖子）的 CSV，全部 CPU 核并行解析，不访问网络"""
+    paths = [archive_path(url) for url in urls] if urls else list_archives(INPUT_DIR)
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        print(f"❌ 没有找到页面归档（抓取时加 --archive 生成）: {', '.join(missing)}")
+        sys.exit(1)
+    if not paths:
+        print(f"❌ {archive_dir(INPUT_DIR)} 下没有页面归档（抓取时加 --archive 生成）")
+        sys.exit(1)
+    started = time.monotonic()
+    processes = PARSE_PROCESSES or os.cpu_count() or 1
+    print(f"离线重建 {len(paths)} 个帖子的 CSV（{processes} 个解析进程，不发出网络请求）")
+    summaries = []
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_parse_worker, initargs=(PARSER_BACKEND,)
+    ) as executor:
+        for path in paths:
+            with METRICS.stage("reparse"):
+                summaries.append(reparse_archive(path, executor))
+    if len(paths) > 1:
+        report_batch(paths, summaries, started)
+    report_run_stats(started, summaries)
+
+
+def _init_parse_worker(backend):
+    """解析进程初始化：沿用主进程的解析后端（命令行参数只作用于主进程）"""
+    global PARSER_BACKEND
+    PARSER_BACKEND = backend
+
+
+class ParsePipeline:
+    """
+    抓取 / 解析流水线（--parse-procs N）
+    抓取线程只负责下载，把原始 HTML 放入有界队列；队列满时抓取线程阻塞，形成背压，内存保持平稳。
+    分发线程把 HTML 交给 ProcessPoolExecutor 中的解析进程（同时在解析的页数也有上限），
+    解析结果进入结果队列，由主线程汇总。解析因此可利用多核，不再与抓取线程争抢 GIL。
+    """
+
+    def __init__(self, processes=None, queue_size=PIPELINE_QUEUE_SIZE):
+        processes = processes or PARSE_PROCESSES
+        self.processes = processes
+        self.pool = ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_parse_worker, initargs=(PARSER_BACKEND,)
+        )
+        self.raw = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue()
+        self._parse_slots = threading.BoundedSemaphore(processes * 2)
+        self._lock = threading.Lock()
+        self.parsing = 0
+        self.fetched = 0
+        self.parsed = 0
+        self.started = time.monotonic()
+        self._last_log = self.started
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def put_html(self, key, html):
+        """抓取线程调用：放入待解析 HTML，队列满时阻塞"""
+        self.raw.put((key, html))
+        with self._lock:
+            self.fetched += 1
+
+    def put_records(self, key, records):
+        """无需解析的结果（缓存命中、抓取失败）直接进入结果队列"""
+        self.results.put((key, records))
+
+    def _dispatch(self):
+        while True:
+            item = self.raw.get()
+            if item is None:
+                return
+            key, html = item
+            self._parse_slots.acquire()
+            with self._lock:
+                self.parsing += 1
+            future = self.pool.submit(_timed_parse, html)
+            future.add_done_callback(lambda f, key=key: self._parsed(key, f))
+
+    def _parsed(self, key, future):
+        self._parse_slots.release()
+        try:
+            records, seconds, size = future.result()
+            METRICS.record_parse(seconds, size)
+        except Exception as e:
+            print(f"解析 {key} 时异常: {e}")
+            records = []
+        with self._lock:
+            self.parsing -= 1
+            self.parsed += 1
+        self.results.put((key, records))
+
+    def get(self, timeout=None):
+        """主线程调用：取出一条解析结果，等待期间定期输出各阶段队列深度与吞吐；timeout 秒内没有结果时返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = PIPELINE_LOG_EVERY
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            try:
+                item = self.results.get(timeout=wait)
+            except queue.Empty:
+                item = None
+            if time.monotonic() - self._last_log >= PIPELINE_LOG_EVERY:
+                self.log_stats()
+            if item is not None or (deadline is not None and time.monotonic() >= deadline):
+                return item
+
+    def log_stats(self):
+        now = time.monotonic()
+        self._last_log = now
+        elapsed = max(now - self.started, 1e-6)
+        print(
+            f"流水线：待解析队列 {self.raw.qsize()}/{self.raw.maxsize}，解析中 {self.parsing}，"
+            f"已下载 {self.fetched} 页（{self.fetched / elapsed:.1f} 页/秒），"
+            f"已解析 {self.parsed} 页（{self.parsed / elapsed:.1f} 页/秒）"
+        )
+
+    def close(self):
+        self.raw.put(None)
+        self._dispatcher.join()
+        self.pool.shutdown()
+        self.log_stats()
+
+
+def _fetch_into_pipeline(base_url, floor, cache, pipeline, attempt=None):
+    """流水线模式下的抓取任务：只下载，不解析；请求失败时放入 None，由主线程重新排队"""
+    try:
+        url = floor_url(base_url, floor)
+        records = cache.get(url) if cache is not None else None
+        if records is not None:
+            pipeline.put_records(floor, records)
+            return
+        html = fetch_page(url, attempt=attempt)
+        if html:
+            archive_page(base_url, floor, html)
+            if cache is not None:
+                cache.put_window(url, page_window(html))
+            pipeline.put_html(floor, html)
+        else:
+            pipeline.put_records(floor, None)
+    except CrawlCancelled:
+        pipeline.put_records(floor, [])  # 主线程仍在按楼层数取结果，占位后再向上抛出
+        raise
+    except Exception as e:
+        print(f"楼层 {floor} 抓取时发生异常: {e}")
+        pipeline.put_records(floor, None)
+
+
+def _floor_stride(first_window):
+    """跳层抓取步长：FLOOR_STRIDE 为 "auto" 时取首页渲染的楼层数（页面中没有楼层号时逐层抓取）"""
+    if FLOOR_STRIDE != "auto":
+        return max(1, int(FLOOR_STRIDE))
+    if first_window is None:
+        return 1
+    lo, hi = first_window
+    return max(1, hi - lo + 1)
+
+
+def _uncovered_floors(base_url, max_floors, cache, fetched):
+    """没有被任何已抓页面的楼层窗口覆盖、本身也没有抓到消息的楼层"""
+    covered = bytearray(max_floors + 1)
+    for floor in range(1, max_floors + 1):
+        window = cache.window(floor_url(base_url, floor))
+        if window is not None:
+            lo, hi = max(1, window[0]), min(max_floors, window[1])
+            if lo <= hi:
+                covered[lo : hi + 1] = b"\x01" * (hi - lo + 1)
+    return {f for f in range(1, max_floors + 1) if not covered[f] and f not in fetched}
+
+
+def _gap_floors(uncovered, stride, dense=False):
+    """
+    为未覆盖的楼层挑选补抓楼层：每段缺口从第一个未覆盖楼层开始，每隔 stride 层抓一页；
+    dense=True（最后一轮）时逐层补抓，保证不漏楼层
+    """
+    picks = []
+    for floor in sorted(uncovered):
+        if dense or not picks or floor >= picks[-1] + stride:
+            picks.append(floor)
+    return picks
+
+
+def _floor_schedule(base_url, max_floors, fetched, cache, writer, journal):
+    """
+    楼层抓取计划（线程池与 asyncio 引擎共用的生成器）：yield (阶段, 标签, 楼层列表)，
+    调用方抓取后 send 回成功抓到消息的楼层集合；结束时返回仍然缺失的楼层集合。
+
+    失败的楼层由调用方的重试调度（RetryQueue）在同一阶段内按各自的退避时间重新排队，不再分轮补抓。
+    步长为 1 时逐层抓取，阶段结束后仍缺失的楼层即为最终缺失。步长 K>1 时利用每个楼层页都会渲染附近一批楼层：
+    只抓每隔 K 层的楼层（以及探测阶段已缓存的楼层），再按各页的楼层号范围检查连续性，
+    只补抓没有被任何页面覆盖的缺口，请求数与解析量约为逐层抓取的 1/K。
+    """
+    topic = topic_key(base_url)
+    stride = _floor_stride(cache.window(floor_url(base_url, 1)))
+    if stride == 1:
+        pending = [f for f in range(2, max_floors + 1) if f not in fetched]
+        EVENTS.emit("plan", topic, max_floors=max_floors, stride=1, floors=len(pending))
+        fetched |= yield "floors", "楼层抓取", pending
+        missing_floors = set(range(1, max_floors + 1)) - fetched
+        journal.record_missing(missing_floors)
+        return missing_floors
+
+    # 探测阶段已缓存的楼层一并写出（不产生请求），它们的窗口也计入覆盖
+    plan = set(range(1, max_floors + 1, stride)) | {max_floors}
+    plan |= {f for f in range(1, max_floors + 1) if cache.window(floor_url(base_url, f)) is not None}
+    plan -= fetched
+    writer.plan(plan | fetched)
+    print(f"跳层抓取：每页约 {stride} 个楼层，步长 {stride}，先抓取 {len(plan)} 个楼层")
+    EVENTS.emit("plan", topic, max_floors=max_floors, stride=stride, floors=len(plan))
+    fetched |= yield "floors", "跳层抓取", sorted(plan)
+    requested, gap_requests, rounds = len(plan), 0, 0
+
+    uncovered = _uncovered_floors(base_url, max_floors, cache, fetched)
+    journal.record_missing(uncovered)
+    while uncovered and rounds <= MAX_SUPPLEMENT_ROUNDS:
+        gaps = _gap_floors(uncovered, stride, dense=rounds == MAX_SUPPLEMENT_ROUNDS)
+        rounds += 1
+        print(f"覆盖检查：{len(uncovered)} 个楼层未被覆盖，第 {rounds} 轮补抓 {len(gaps)} 个楼层")
+        EVENTS.emit("supplement", topic, round=rounds, missing=len(uncovered), floors=len(gaps))
+        fetched |= yield "supplement", "补抓缺口楼层", gaps
+        gap_requests += len(gaps)
+        uncovered = _uncovered_floors(base_url, max_floors, cache, fetched)
+        journal.record_missing(uncovered)
+
+    covered = max_floors - len(uncovered)
+    pages = requested + gap_requests
+    print(
+        f"覆盖统计：窗口 {stride} 层，步长 {stride}；跳层抓取 {requested} 页，补抓 {gap_requests} 页（{rounds} 轮）；"
+        f"覆盖 {covered}/{max_floors} 个楼层（{covered / max(1, max_floors):.1%}），"
+        f"比逐层抓取少 {max(0, max_floors - 1 - pages)} 页"
+    )
+    return uncovered
+
+
+class RetryQueue:
+    """
+    楼层（JSON 方式为楼层批次）的重试调度：待抓队列 + 按到期时间排序的重试堆，线程池与 asyncio 引擎共用。
+    调用方在途数不超过 SUBMIT_WINDOW 时用 take() 取出已到期的楼层提交，不再一次提交全部楼层；
+    没抓到的楼层用 retry() 立即按自己的退避时间重新排队，其余楼层照常抓取，
+    个别慢请求或反复失败的楼层不会让整批楼层等它们结束后才开始下一轮补抓。
+    请求失败时前 MAX_RETRIES 次按 backoff_delay 退避，之后每 MAX_RETRIES 次额外等待 RETRY_EXTRA_DELAY，
+    最多请求 FLOOR_MAX_ATTEMPTS 次；抓到了页面但没有消息时等待 RETRY_EXTRA_DELAY 后重抓，最多 MAX_SUPPLEMENT_ROUNDS 次。
+    """
+
+    def __init__(self, keys, label="楼层"):
+        self.label = label
+        self._ready = deque(keys)
+        self._delayed = []  # (到期时间, 楼层) 小根堆
+        self.attempts = {}  # 楼层 -> 已请求次数
+        self._empty = {}  # 楼层 -> 抓到页面但没有消息的次数
+        self.requeued = 0
+        self.exhausted = []  # 次数用尽、记为缺失的楼层
+
+    def __bool__(self):
+        return bool(self._ready or self._delayed)
+
+    def take(self):
+        """取出一个已到期的楼层，返回 (楼层, 第几次请求)；暂时没有可抓的楼层时返回 None"""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._ready.append(heapq.heappop(self._delayed)[1])
+        if not self._ready:
+            return None
+        key = self._ready.popleft()
+        self.attempts[key] = self.attempts.get(key, 0) + 1
+        return key, self.attempts[key]
+
+    def next_due(self):
+        """距离最早的重试楼层到期还有多少秒；没有等待重试的楼层时返回 None"""
+        if not self._delayed:
+            return None
+        return max(0.0, self._delayed[0][0] - time.monotonic())
+
+    def retry(self, key, failed=True):
+        """
+        楼层这次没有抓到：failed 为 True 表示请求失败，False 表示抓到了页面但没有消息。
+        还有剩余次数时按退避时间重新排队并返回 True，否则记为缺失并返回 False
+        """
+        attempt = self.attempts[key]
+        if failed:
+            retry = attempt < FLOOR_MAX_ATTEMPTS
+            delay = backoff_delay((attempt - 1) % MAX_RETRIES + 1)
+            if attempt % MAX_RETRIES == 0:
+                delay += RETRY_EXTRA_DELAY
+        else:
+            self._empty[key] = self._empty.get(key, 0) + 1
+            retry = self._empty[key] <= MAX_SUPPLEMENT_ROUNDS and attempt < FLOOR_MAX_ATTEMPTS
+            delay = RETRY_EXTRA_DELAY
+        if not retry:
+            self.exhausted.append(key)
+            print(f"⚠️ {self.label} {key} 已请求 {attempt} 次仍未抓到，记为缺失")
+            return False
+        heapq.heappush(self._delayed, (time.monotonic() + delay, key))
+        self.requeued += 1
+        return True
+
+    def report(self, label):
+        if self.requeued:
+            print(f"{label}：失败后重新排队 {self.requeued} 次，{len(self.exhausted)} 个{self.label}次数用尽")
+
+
+def _retry_floor(work, base_url, floor, records, cache):
+    """楼层没有抓到（请求失败，或页面既没有消息也没有楼层号）且还有剩余次数时重新排队，返回 True"""
+    if records:
+        return False
+    if records is not None and cache is not None and cache.window(floor_url(base_url, floor)) is not None:
+        return False  # 页面正常渲染，只是这些楼层没有聊天记录
+    return work.retry(floor, failed=records is None)
+
+
+def _drain(work, start, finished, settle):
+    """
+    线程池引擎的调度循环：在途数低于 SUBMIT_WINDOW 时从 work 取出到期的楼层交给 start(楼层, 第几次)，
+    finished(timeout) 返回 timeout 秒内完成的 (楼层, 结果) 列表，逐个交给 settle（其中决定是否重新排队）
+    """
+    in_flight = 0
+    while work or in_flight:
+        while in_flight < SUBMIT_WINDOW:
+            item = work.take()
+            if item is None:
+                break
+            start(*item)
+            in_flight += 1
+        if not in_flight:
+            cancellable_sleep(work.next_due())
+            continue
+        for key, result in finished(work.next_due()):
+            in_flight -= 1
+            settle(key, result)
+        check_cancelled()
+
+
+def _collect_futures(running, timeout, label):
+    """等待 running（future -> 楼层）中至少一个完成（最多 timeout 秒），返回 [(楼层, 结果)]；任务异常时结果为 None"""
+    done, _ = futures_wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+    results = []
+    for future in done:
+        key = running.pop(future)
+        try:
+            results.append((key, future.result()))
+        except Exception as e:
+            print(f"{label} {key} 时发生异常: {e}")
+            results.append((key, None))
+    return results
+
+
+def _crawl_floors(base_url, floors, cache, writer, label, pipeline=None, journal=None):
+    """
+    并发抓取一批楼层（在途数受 SUBMIT_WINDOW 限制，失败的楼层在本批内按退避重新排队），
+    消息交给 writer 流式写出（并写入断点日志），返回成功抓到消息的楼层集合
+    """
+    fetched = set()
+    floors = list(floors)
+    topic, started, done = topic_key(base_url), time.monotonic(), 0
+    work = RetryQueue(floors)
+
+    def settle(floor, floor_records):
+        nonlocal done
+        if _retry_floor(work, base_url, floor, floor_records, cache):
+            return
+        floor_records = floor_records or []
+        if pipeline is not None and cache is not None:
+            cache.put(floor_url(base_url, floor), floor_records)
+        done += 1
+        writer.add(floor, floor_records)
+        EVENTS.progress(topic, label, done, len(floors), started, writer.written)
+        if floor_records:
+            fetched.add(floor)
+            if journal is not None:
+                journal.record_floor(floor, floor_records, cache.window(floor_url(base_url, floor)) if cache else None)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS_CEILING) as executor:
+        if pipeline is not None:
+
+            def start(floor, attempt):
+                executor.submit(_fetch_into_pipeline, base_url, floor, cache, pipeline, attempt)
+
+            def finished(timeout):
+                item = pipeline.get(timeout)
+                return [] if item is None else [item]
+
+        else:
+            running = {}
+
+            def start(floor, attempt):
+                running[executor.submit(fetch_and_parse_page, base_url, floor, cache=cache, attempt=attempt)] = floor
+
+            def finished(timeout):
+                return _collect_futures(running, timeout, label)
+
+        _drain(work, start, finished, settle)
+    work.report(label)
+    return fetched
+
+
+def crawl_post(base_url, report=True):
+    """
+    抓取单个帖子并输出 CSV，返回本帖的抓取摘要（首页请求失败时返回 None）
+    report=False 时不输出全进程统计（批量模式在全部帖子结束后统一输出）
+    """
+    if CRAWL_ENGINE == "async":
+        return asyncio.run(crawl_post_async(base_url, report))
+    if TRANSPORT == "json":
+        return crawl_post_json(base_url, report)
+
+    started = time.monotonic()
+    cache = PageCache()
+    journal = CrawlJournal(base_url)
+    resumed = _resume_from_journal(base_url, journal, cache)
+    if resumed:
+        title, output_file, max_floors, done_floors = resumed
+        first_page_html = None
+    else:
+        print(f"开始抓取首页以获取标题和时间信息: {base_url}")
+        with METRICS.stage("first_page"):
+            first_page_html = fetch_page(base_url)
+        if not first_page_html:
+            topic_failed(base_url, "首页请求失败，跳过")
+            return
+
+        title = page_title(first_page_html)
+        output_file = output_path_for_title(title)
+
+        # 首页已下载，放入本次抓取的页面缓存，探测与正式抓取均可复用
+        first_records = parse_chat_transcripts(first_page_html)
+        first_window = page_window(first_page_html)
+        cache.put(floor_url(base_url, 1), first_records)
+        cache.put_window(floor_url(base_url, 1), first_window)
+        done_floors = {1: first_records} if first_records else {}
+        journal.begin(base_url, title, output_file, first_records, first_window)
+        max_floors = None
+
+    writer = open_output(output_file, base_url)
+    open_archive(base_url, title, resume=bool(resumed))
+    archive_page(base_url, 1, first_page_html)
+    for floor, records in sorted(done_floors.items()):
+        writer.add(floor, records)
+    fetched_floors = set(done_floors)
+    done_floors = None
+
+    pipeline = None
+    try:
+        # 自动探测楼层（断点日志中已有结果时跳过）
+        if max_floors is None:
+            with METRICS.stage("discovery"):
+                max_floors = get_max_floors(base_url, cache=cache)
+            journal.record_max_floor(max_floors)
+
+        pipeline = ParsePipeline() if PARSE_PROCESSES > 0 else None
+        # 第一次抓取（续抓时只抓尚未完成的楼层）与自动补抓缺失楼层
+        schedule = _floor_schedule(base_url, max_floors, fetched_floors, cache, writer, journal)
+        try:
+            stage, label, floors = next(schedule)
+            while True:
+                with METRICS.stage(stage):
+                    done = _crawl_floors(base_url, floors, cache, writer, label, pipeline, journal)
+                stage, label, floors = schedule.send(done)
+        except StopIteration as stop:
+            missing_floors = stop.value
+    except BaseException:
+        writer.abort()
+        abort_archive(base_url)
+        raise
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        journal.close()
+
+    if missing_floors:
+        print(f"⚠️ 最终仍有 {len(missing_floors)} 个楼层缺失: {sorted(missing_floors)}")
+
+    with METRICS.stage("write"):
+        messages = writer.close(title, floors=max_floors)
+    close_archive(base_url, max_floors)
+    journal.finish()
+    cache.report()
+    summary = topic_summary(
+        base_url, title, writer.path, messages, max_floors, missing_floors, started, writer.skipped_known
+    )
+    if report:
+        HTTP_CACHE.report()
+        SESSION_POOL.report()
+        CONCURRENCY.report()
+        BREAKER.report()
+        report_run_stats(started, [summary])
+    return summary
+
+
+# ===== Discourse JSON 接口（--transport json） =====
+# /t/<id>.json 一次拿到标题、posts_count 与全部楼层 ID（post_stream.stream），
+# 其余楼层按 ID 分批请求 /t/<id>/posts.json?post_ids[]=…，每个楼层的 cooked HTML
+# 交给原有的 chat-transcript 解析。楼层数无需探测，请求数约为 HTML 方式的 1/JSON_POSTS_PER_REQUEST。
+
+
+def _topic_base(base_url):
+    """帖子 URL 去掉楼层号，返回 (站点与路径前缀, 帖子 ID)"""
+    m = re.search(r"^(.*?)/t/(?:[^/]+/)?(\d+)", base_url)
+    if not m:
+        raise ValueError(f"无法从 URL 中识别帖子 ID: {base_url}")
+    return m.group(1), m.group(2)
+
+
+def topic_json_url(base_url):
+    prefix, topic_id = _topic_base(base_url)
+    return f"{prefix}/t/{topic_id}.json"
+
+
+def posts_json_url(base_url, post_ids):
+    prefix, topic_id = _topic_base(base_url)
+    return f"{prefix}/t/{topic_id}/posts.json?" + "&".join(f"post_ids[]={i}" for i in post_ids)
+
+
+def _load_json(url, text):
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        print(f"⚠️ 响应不是有效的 JSON: {url}")
+        return None
+
+
+def _json_plan(topic):
+    """
+    根据 /t/<id>.json 的内容规划抓取：返回 (标题, 楼层数, 批次列表)
+    第 1 批是接口随帖子一起返回的楼层（无需再请求），其余为待请求的楼层 ID 分组
+    """
+    stream = topic.get("post_stream") or {}
+    initial = stream.get("posts") or []
+    initial_ids = {p["id"] for p in initial}
+    remaining = [i for i in stream.get("stream") or [] if i not in initial_ids]
+    batches = [initial] + [
+        remaining[i : i + JSON_POSTS_PER_REQUEST] for i in range(0, len(remaining), JSON_POSTS_PER_REQUEST)
+    ]
+    floors = topic.get("highest_post_number") or topic.get("posts_count") or len(initial_ids) + len(remaining)
+    return topic.get("title") or "未命名", floors, batches
+
+
+def _json_posts_records(base_url, posts):
+    """按楼层号顺序解析一批楼层的 cooked HTML（启用 --archive 时按楼层号归档）"""
+    records = []
+    for post in sorted(posts, key=lambda p: p.get("post_number", 0)):
+        cooked = post.get("cooked") or ""
+        if post.get("post_number"):
+            archive_page(base_url, post["post_number"], cooked)
+        records.extend(parse_chat_transcripts(cooked))
+    return records
+
+
+def _fetch_posts_batch(base_url, post_ids, attempt=None):
+    """请求一批楼层，失败时返回 None"""
+    url = posts_json_url(base_url, post_ids)
+    data = _load_json(url, fetch_page(url, attempt=attempt))
+    if data is None:
+        return None
+    return (data.get("post_stream") or {}).get("posts") or []
+
+
+def _json_start(base_url, topic):
+    title, floors, batches = _json_plan(topic)
+    print(
+        f"[{title}] JSON 接口：{floors} 层，{sum(len(b) for b in batches)} 个楼层 ID，"
+        f"分 {len(batches) - 1} 批请求（每批 {JSON_POSTS_PER_REQUEST} 个）"
+    )
+    if RESUME:
+        print("JSON 方式请求数很少，不使用断点日志，重新抓取全部楼层")
+    writer = open_output(output_path_for_title(title), base_url)
+    open_archive(base_url, title)
+    EVENTS.emit("plan", topic_key(base_url), max_floors=floors, batches=len(batches) - 1)
+    # 写出顺序按批次编号（即楼层 ID 顺序），第 1 批已随帖子信息返回
+    writer.add(1, _json_posts_records(base_url, batches[0]))
+    return title, floors, batches, writer
+
+
+def _json_settle(work, base_url, batches, writer, b, posts):
+    """一个批次完成：请求失败且还有剩余次数时重新排队，否则按批次编号写出"""
+    if posts is None and work.retry(b):
+        return
+    # 批次编号 +1 作为写出顺序（第 1 批为帖子信息中的楼层）
+    writer.add(b + 1, _json_posts_records(base_url, posts or []))
+
+
+def _json_finish(base_url, title, floors, batches, failed, writer, started):
+    missing = {i for b in failed for i in batches[b]}
+    if missing:
+        print(f"⚠️ 最终仍有 {len(missing)} 个楼层缺失（楼层 ID）: {sorted(missing)}")
+    with METRICS.stage("write"):
+        messages = writer.close(title, floors=floors)
+    close_archive(base_url, floors)
+    return topic_summary(base_url, title, writer.path, messages, floors, missing, started, writer.skipped_known)
+
+
+def crawl_post_json(base_url, report=True):
+    started = time.monotonic()
+    print(f"开始读取帖子信息: {topic_json_url(base_url)}")
+    with METRICS.stage("first_page"):
+        topic = _load_json(topic_json_url(base_url), fetch_page(topic_json_url(base_url)))
+    if not topic:
+        topic_failed(base_url, "帖子信息请求失败，跳过")
+        return None
+    title, floors, batches, writer = _json_start(base_url, topic)
+
+    work = RetryQueue(range(1, len(batches)), label="楼层批次")
+    running = {}
+    try:
+        with METRICS.stage("floors"), ThreadPoolExecutor(max_workers=MAX_WORKERS_CEILING) as executor:
+
+            def start(b, attempt):
+                running[executor.submit(_fetch_posts_batch, base_url, batches[b], attempt)] = b
+
+            _drain(
+                work,
+                start,
+                lambda timeout: _collect_futures(running, timeout, "楼层批次抓取"),
+                lambda b, posts: _json_settle(work, base_url, batches, writer, b, posts),
+            )
+    except BaseException:
+        writer.abort()
+        abort_archive(base_url)
+        raise
+
+    work.report("批次抓取")
+    summary = _json_finish(base_url, title, floors, batches, work.exhausted, writer, started)
+    if report:
+        HTTP_CACHE.report()
+        SESSION_POOL.report()
+        CONCURRENCY.report()
+        BREAKER.report()
+        report_run_stats(started, [summary])
+    return summary
+
+
+def floor_url(base_url, floor):
+    """楼层 URL：第 1 层即帖子首页"""
+    return base_url if floor == 1 else f"{base_url}/{floor}"
+
+
+def fetch_and_parse_page(base_url, floor, session=None, is_retry=False, cache=None, attempt=None):
+    """
+    抓取并解析单个楼层（传入 cache 时优先读取缓存，抓取结果写回缓存）
+    请求失败时返回 None（与抓到了页面但没有消息的 [] 区分）；
+    attempt 为重试调度中的第几次请求：传入时只请求一次，失败后交给调用方重新排队
+    """
+    url = floor_url(base_url, floor)
+    if cache is not None:
+        records = cache.get(url)
+        if records is not None:
+            return records
+    html = fetch_page(url, session=session, is_retry=is_retry, attempt=attempt)
+    if not html:
+        return None
+    archive_page(base_url, floor, html)
+    records = parse_chat_transcripts(html)
+    if cache is not None:
+        cache.put(url, records)
+        cache.put_window(url, page_window(html))
+    return records
+
+
+# ===== asyncio 抓取引擎（--engine async） =====
+# 单个事件循环内完成探测、正式抓取与补抓，在途请求数由 AIMD 并发上限约束；
+# 令牌桶、页面缓存、解析与输出逻辑与线程池引擎共用，输出的 CSV 完全一致。
+
+
+class _AsyncSlots:
+    """异步版并发槽位：上限跟随 CONCURRENCY.limit（AIMD）动态变化，多个帖子之间公平分配"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._active = {}
+        self._waiting = {}
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self, key=None):
+        async with self._cond:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            await self._cond.wait_for(
+                lambda: self.in_flight < int(CONCURRENCY.limit)
+                and _fair_turn(self._active, self._waiting, key)
+            )
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key]
+            self.in_flight += 1
+            self._active[key] = self._active.get(key, 0) + 1
+            if self._waiting and self.in_flight < int(CONCURRENCY.limit):
+                self._cond.notify_all()
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+                self._cond.notify_all()
+
+
+async def fetch_page_async(http, slots, url, is_retry=False, attempt=None):
+    """fetch_page 的 asyncio 版本：同样的令牌桶、Retry-After、抖动退避与熔断策略"""
+    single = attempt is not None
+    tries = range(attempt, attempt + 1) if single else range(1, MAX_RETRIES + 1)
+    limit = FLOOR_MAX_ATTEMPTS if single else MAX_RETRIES
+    for attempt in tries:
+        check_cancelled()
+        delay = BREAKER.delay(url)
+        while delay > 0:
+            METRICS.record_wait("circuit", delay)
+            await asyncio.sleep(delay)
+            check_cancelled()
+            delay = BREAKER.delay(url)
+        METRICS.record_attempt(attempt)
+        try:
+            conditional = HTTP_CACHE.conditional_headers(url)
+            # 先拿到并发槽位再预订令牌：在途请求之外的任务不会提前占用令牌，
+            # 多个帖子之间按槽位公平轮换，429 全局暂停对排队中的请求同样生效
+            queued = time.monotonic()
+            async with slots.slot(topic_key(url)):
+                METRICS.record_wait("slot", time.monotonic() - queued)
+                wait = RATE_LIMITER.reserve()
+                METRICS.record_wait("rate_limit", wait)
+                await asyncio.sleep(wait)
+                check_cancelled()
+                started = time.monotonic()
+                async with http.get(url, headers=conditional) as response:
+                    text = await response.text()
+                    body = len(await response.read())
+                latency = time.monotonic() - started
+            METRICS.record_request(response.status, latency, response.content_length or body, body)
+
+            if response.status == 304 and conditional:
+                CONCURRENCY.on_success(latency)
+                BREAKER.record(url, True)
+                html = HTTP_CACHE.load(url)
+                if html is not None:
+                    return html
+                continue
+
+            if response.status in (429, 503):
+                retry_after = parse_retry_after(response)
+                backoff_time = retry_after if retry_after is not None else backoff_delay(min(attempt, MAX_RETRIES))
+                CONCURRENCY.on_throttle()
+                RATE_LIMITER.pause(backoff_time)
+                reason = "429 Too Many Requests" if response.status == 429 else "503 Service Unavailable"
+                print(f"请求失败({attempt}/{limit}): {url}，原因: {reason}，全局暂停 {backoff_time:.1f} 秒")
+                EVENTS.emit(
+                    "rate_limit",
+                    topic_key(url),
+                    throttle=True,
+                    status=response.status,
+                    pause_seconds=round(backoff_time, 1),
+                )
+                continue
+
+            response.raise_for_status()
+            CONCURRENCY.on_success(latency)
+            BREAKER.record(url, True)
+            HTTP_CACHE.store(url, response.headers, text)
+            return text
+
+        except Exception as e:
+            print(f"请求失败({attempt}/{limit}): {url}，原因: {e}")
+            METRICS.record_error()
+            BREAKER.record(url, not _is_host_failure(e))
+            EVENTS.emit("retry", topic_key(url), throttle=True, url=url, attempt=attempt, reason=str(e))
+            if attempt < tries[-1]:
+                delay = backoff_delay(attempt)
+                METRICS.record_wait("backoff", delay)
+                await asyncio.sleep(delay)
+                check_cancelled()
+
+    if not (is_retry or single):
+        print(f"⚠️ {url} 多次失败，交给补抓处理")
+    return None
+
+
+async def fetch_and_parse_page_async(http, slots, base_url, floor, is_retry=False, cache=None, attempt=None):
+    url = floor_url(base_url, floor)
+    if cache is not None:
+        records = cache.get(url)
+        if records is not None:
+            return records
+    html = await fetch_page_async(http, slots, url, is_retry=is_retry, attempt=attempt)
+    if not html:
+        return None
+    archive_page(base_url, floor, html)
+    # 解析放到线程里执行，避免阻塞事件循环上的网络读写
+    records = await asyncio.to_thread(parse_chat_transcripts, html)
+    if cache is not None:
+        cache.put(url, records)
+        cache.put_window(url, page_window(html))
+    return records
+
+
+async def get_max_floors_async(http, slots, base_url, cache=None):
+    steps = _discovery_steps(topic_key(base_url))
+    try:
+        floors = next(steps)
+        while True:
+            results = await asyncio.gather(
+                *(
+                    fetch_and_parse_page_async(http, slots, base_url, f, is_retry=True, cache=cache)
+                    for f in floors
+                )
+            )
+            floors = steps.send({f: None if r is None else _ids_of(r) for f, r in zip(floors, results)})
+    except StopIteration as stop:
+        detected = stop.value
+    return _confirm_max_floors(detected)
+
+
+async def _drain_async(work, run, settle, label):
+    """
+    _drain 的 asyncio 版本：run(楼层, 第几次) 为返回结果的协程，在途任务数不超过 SUBMIT_WINDOW；
+    任务异常或被取消时结果按 None 交给 settle（与 _collect_futures 一致），退出时取消并等待剩余任务
+    """
+    running = {}
+    try:
+        while work or running:
+            while len(running) < SUBMIT_WINDOW:
+                item = work.take()
+                if item is None:
+                    break
+                running[asyncio.ensure_future(run(*item))] = item[0]
+            if not running:
+                await asyncio.sleep(work.next_due())
+                check_cancelled()
+                continue
+            done, _ = await asyncio.wait(running, timeout=work.next_due(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                key = running.pop(task)
+                try:
+                    result = None if task.cancelled() else task.result()
                 except Exception as e:
-                    print(f"补抓楼层 {floor} 时异常: {e}")
-                    floor_records = []
-                if floor_records:
-                    new_fetched.add(floor)
-                    all_records.extend(floor_records)
-        missing_floors -= new_fetched
-        print(f"第 {round_num} 轮补抓完成，剩余缺失楼层: {len(missing_floors)}")
-        round_num += 1
+                    print(f"{label} {key} 时发生异常: {e}")
+                    result = None
+                settle(key, result)
+            check_cancelled()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def _crawl_floors_async(http, slots, base_url, floors, cache, writer, label, journal=None):
+    """并发抓取一批楼层（在途数受 SUBMIT_WINDOW 限制，失败的楼层在本批内按退避重新排队），返回成功抓到消息的楼层集合"""
+
+    async def one(floor, attempt):
+        try:
+            return await fetch_and_parse_page_async(http, slots, base_url, floor, cache=cache, attempt=attempt)
+        except Exception as e:
+            print(f"{label} {floor} 时异常: {e}")
+            return None
+
+    fetched = set()
+    floors = list(floors)
+    topic, started, done = topic_key(base_url), time.monotonic(), 0
+    work = RetryQueue(floors)
+
+    def settle(floor, floor_records):
+        nonlocal done
+        if _retry_floor(work, base_url, floor, floor_records, cache):
+            return
+        floor_records = floor_records or []
+        done += 1
+        writer.add(floor, floor_records)
+        EVENTS.progress(topic, label, done, len(floors), started, writer.written)
+        if floor_records:
+            fetched.add(floor)
+            if journal is not None:
+                journal.record_floor(floor, floor_records, cache.window(floor_url(base_url, floor)) if cache else None)
+
+    await _drain_async(work, one, settle, label)
+    work.report(label)
+    return fetched
+
+
+def _open_http_async():
+    """创建 asyncio 引擎共用的 aiohttp 会话；未安装 aiohttp 时返回 None"""
+    try:
+        import aiohttp
+    except ImportError:
+        print("❌ asyncio 引擎需要 aiohttp，请先安装：pip install aiohttp")
+        return None
+    connector = aiohttp.TCPConnector(limit=MAX_WORKERS_CEILING, limit_per_host=PER_HOST_CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS)
+
+
+async def crawl_post_async(base_url, report=True):
+    started = time.monotonic()
+    http = _open_http_async()
+    if http is None:
+        return None
+    async with http:
+        summary = await _crawl_topic_async(http, _AsyncSlots(), base_url)
+    if report:
+        HTTP_CACHE.report()
+        CONCURRENCY.report()
+        BREAKER.report()
+        report_run_stats(started, [summary])
+    return summary
+
+
+async def _crawl_topic_json_async(http, slots, base_url):
+    """crawl_post_json 的 asyncio 版本"""
+    started = time.monotonic()
+    print(f"开始读取帖子信息: {topic_json_url(base_url)}")
+    with METRICS.stage("first_page"):
+        text = await fetch_page_async(http, slots, topic_json_url(base_url))
+    topic = _load_json(topic_json_url(base_url), text)
+    if not topic:
+        topic_failed(base_url, "帖子信息请求失败，跳过")
+        return None
+    title, floors, batches, writer = _json_start(base_url, topic)
+
+    async def one(b, attempt):
+        url = posts_json_url(base_url, batches[b])
+        try:
+            data = _load_json(url, await fetch_page_async(http, slots, url, attempt=attempt))
+        except Exception as e:
+            print(f"楼层批次 {b} 抓取时异常: {e}")
+            data = None
+        return None if data is None else (data.get("post_stream") or {}).get("posts") or []
+
+    work = RetryQueue(range(1, len(batches)), label="楼层批次")
+    try:
+        with METRICS.stage("floors"):
+            await _drain_async(
+                work, one, lambda b, posts: _json_settle(work, base_url, batches, writer, b, posts), "楼层批次抓取"
+            )
+    except BaseException:
+        writer.abort()
+        abort_archive(base_url)
+        raise
+    work.report("批次抓取")
+    return _json_finish(base_url, title, floors, batches, work.exhausted, writer, started)
+
+
+async def _crawl_topic_async(http, slots, base_url):
+    """在已有的会话与并发槽位上抓取单个帖子（批量模式下多个帖子共用）"""
+    if TRANSPORT == "json":
+        return await _crawl_topic_json_async(http, slots, base_url)
+    started = time.monotonic()
+    cache = PageCache()
+    journal = CrawlJournal(base_url)
+    resumed = _resume_from_journal(base_url, journal, cache)
+    if resumed:
+        title, output_file, max_floors, done_floors = resumed
+        first_page_html = None
+    else:
+        print(f"开始抓取首页以获取标题和时间信息: {base_url}")
+        with METRICS.stage("first_page"):
+            first_page_html = await fetch_page_async(http, slots, base_url)
+        if not first_page_html:
+            topic_failed(base_url, "首页请求失败，跳过")
+            return None
+
+        title = page_title(first_page_html)
+        output_file = output_path_for_title(title)
+
+        first_records = parse_chat_transcripts(first_page_html)
+        first_window = page_window(first_page_html)
+        cache.put(floor_url(base_url, 1), first_records)
+        cache.put_window(floor_url(base_url, 1), first_window)
+        done_floors = {1: first_records} if first_records else {}
+        journal.begin(base_url, title, output_file, first_records, first_window)
+        max_floors = None
+
+    writer = open_output(output_file, base_url)
+    open_archive(base_url, title, resume=bool(resumed))
+    archive_page(base_url, 1, first_page_html)
+    for floor, records in sorted(done_floors.items()):
+        writer.add(floor, records)
+    fetched_floors = set(done_floors)
+    done_floors = None
+
+    try:
+        if max_floors is None:
+            with METRICS.stage("discovery"):
+                max_floors = await get_max_floors_async(http, slots, base_url, cache=cache)
+            journal.record_max_floor(max_floors)
+
+        schedule = _floor_schedule(base_url, max_floors, fetched_floors, cache, writer, journal)
+        try:
+            stage, label, floors = next(schedule)
+            while True:
+                with METRICS.stage(stage):
+                    done = await _crawl_floors_async(http, slots, base_url, floors, cache, writer, label, journal)
+                stage, label, floors = schedule.send(done)
+        except StopIteration as stop:
+            missing_floors = stop.value
+    except BaseException:
+        writer.abort()
+        abort_archive(base_url)
+        raise
+    finally:
+        journal.close()
 
     if missing_floors:
         print(f"⚠️ 最终仍有 {len(missing_floors)} 个楼层缺失: {sorted(missing_floors)}")
 
-    # 去重
-    all_records = deduplicate_records(all_records)
-
-    # 输出（保留原始字段与命名逻辑）
-    with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "message_id",
-                "username",
-                "channel_name",
-                "content",
-                "created_at",
-            ],
-        )
-        writer.writeheader()
-        writer.writerows(all_records)
+    with METRICS.stage("write"):
+        messages = writer.close(title, floors=max_floors)
+    close_archive(base_url, max_floors)
+    journal.finish()
+    cache.report()
+    return topic_summary(
+        base_url, title, writer.path, messages, max_floors, missing_floors, started, writer.skipped_known
+    )
+
+
+def _listing_json_url(url):
+    """Discourse 列表页 URL 转为对应的 .json 接口"""
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/") or "/latest"
+    if not path.endswith(".json"):
+        path += ".json"
+    return parts._replace(path=path).geturl()
+
+
+def iter_listing_topics(listing_url):
+    """逐页读取帖子列表（沿 more_topics_url 翻页），逐个返回帖子信息"""
+    url = _listing_json_url(listing_url)
+    for _ in range(DISCOVER_MAX_PAGES):
+        text = fetch_page(url)
+        if not text:
+            print(f"⚠️ 帖子列表请求失败: {url}")
+            return
+        try:
+            topic_list = json.loads(text).get("topic_list") or {}
+        except ValueError:
+            print(f"⚠️ 帖子列表不是有效的 JSON: {url}")
+            return
+        yield from topic_list.get("topics") or []
+        more = topic_list.get("more_topics_url")
+        if not more:
+            return
+        url = _listing_json_url(urljoin(url, more))
 
-    print(f"[{title}] 抓取完成，共 {len(all_records)} 条消息，已保存到 {output_file}")
 
+def _discovery_state_path():
+    return os.path.join(INPUT_DIR, DISCOVER_STATE_FILE)
 
-def fetch_and_parse_page(base_url, floor, session=None, is_retry=False):
-    """抓取并解析单个楼层"""
-    url = base_url if floor == 1 else f"{base_url}/{floor}"
-    html = fetch_page(url, session=session, is_retry=is_retry)
-    return parse_chat_transcripts(html) if html else []
 
+def load_discovery_state():
+    try:
+        with open(_discovery_state_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-# 入口：支持命令行传入 URL；若未传且 BASE_URL 有值则使用 BASE_URL；否则提示并退出
-if __name__ == "__main__":
-    import sys
 
-    if len(sys.argv) >= 2:
-        TARGET_URL = sys.argv[1]
+def save_discovery_state(state):
+    path = _discovery_state_path()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def discover_topics(listing_url):
+    """
+    遍历帖子列表，找出月度备份帖（标题规范化后匹配 DISCOVER_TITLE_PATTERN），
+    与上次抓取时记录的最大楼层号 / 最后回复时间比较，并检查 backend/data 中的输出文件是否还在，
+    返回需要抓取的 [(帖子 URL, 列表中的帖子信息)]
+    """
+    state = load_discovery_state()
+    origin = "{0.scheme}://{0.netloc}".format(urlsplit(listing_url))
+    queued, skipped, seen = [], 0, set()
+    for topic in iter_listing_topics(listing_url):
+        topic_id = str(topic.get("id"))
+        title = topic.get("title") or ""
+        if topic_id in seen or not re.search(DISCOVER_TITLE_PATTERN, simplify_title_for_filename(title)):
+            continue
+        seen.add(topic_id)
+        url = f"{origin}/t/topic/{topic_id}"
+        info = {
+            "title": title,
+            "highest_post_number": topic.get("highest_post_number") or topic.get("posts_count"),
+            "last_posted_at": topic.get("last_posted_at") or topic.get("bumped_at"),
+        }
+        known = state.get(topic_id)
+        if known is None:
+            reason = "新帖"
+        elif not os.path.exists(known.get("output") or ""):
+            reason = "输出文件不存在"
+        elif (known.get("highest_post_number"), known.get("last_posted_at")) != (
+            info["highest_post_number"],
+            info["last_posted_at"],
+        ):
+            reason = f"有更新（{known.get('highest_post_number')} → {info['highest_post_number']} 层）"
+        else:
+            skipped += 1
+            continue
+        print(f"发现 {simplify_title_for_filename(title)}：{reason} {url}")
+        queued.append((url, info))
+    print(f"帖子列表中共 {len(seen)} 个备份帖，需要抓取 {len(queued)} 个，未变化跳过 {skipped} 个")
+    return queued
+
+
+def crawl_discovered(listing_url):
+    """--discover：只抓取新出现或有更新的备份帖，成功后记录其楼层号与最后回复时间"""
+    queued = discover_topics(listing_url)
+    if not queued:
+        return []
+    urls = [url for url, _ in queued]
+    summaries = crawl_batch(urls) if len(urls) > 1 else [crawl_post(urls[0])]
+    state = load_discovery_state()
+    for (url, info), summary in zip(queued, summaries):
+        if summary is None or summary["missing"]:
+            continue  # 失败或仍有缺失楼层：不记录，下次继续抓
+        state[topic_key(url)[len("topic-"):]] = {
+            **info,
+            "url": url,
+            "output": summary["output"],
+            "crawled_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+    save_discovery_state(state)
+    return summaries
+
+
+def read_url_list(path):
+    """读取 URL 列表文件（"-" 表示标准输入），每行一个，忽略空行与 # 注释"""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+async def crawl_batch_async(urls):
+    http = _open_http_async()
+    if http is None:
+        return [None] * len(urls)
+    slots = _AsyncSlots()
+    gate = asyncio.Semaphore(BATCH_PARALLEL_TOPICS)
+
+    async def one(url):
+        async with gate:
+            try:
+                return await _crawl_topic_async(http, slots, url)
+            except Exception as e:
+                topic_failed(url, f"抓取失败: {e}")
+                return None
+
+    async with http:
+        return await asyncio.gather(*(one(u) for u in urls))
+
+
+def crawl_batch(urls):
+    """
+    批量抓取多个帖子：同一进程内最多 BATCH_PARALLEL_TOPICS 个帖子同时进行，
+    共用令牌桶、自适应并发、连接池与 HTTP 缓存（即同一份按主机计的请求配额），
+    并发槽位在帖子之间公平轮换；每个帖子各自输出 CSV，最后输出汇总
+    """
+    global INTERACTIVE
+    INTERACTIVE = False
+    urls = list(dict.fromkeys(urls))
+    started = time.monotonic()
+    print(f"批量抓取 {len(urls)} 个帖子，同时进行 {min(BATCH_PARALLEL_TOPICS, len(urls))} 个")
+
+    if CRAWL_ENGINE == "async":
+        summaries = asyncio.run(crawl_batch_async(urls))
     else:
-        if BASE_URL:
-            TARGET_URL = BASE_URL
+
+        def one(url):
+            try:
+                return crawl_post(url, report=False)
+            except Exception as e:
+                topic_failed(url, f"抓取失败: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=BATCH_PARALLEL_TOPICS) as executor:
+            summaries = list(executor.map(one, urls))
+
+    report_batch(urls, summaries, started)
+    HTTP_CACHE.report()
+    if CRAWL_ENGINE != "async":
+        SESSION_POOL.report()
+    CONCURRENCY.report()
+    BREAKER.report()
+    report_run_stats(started, summaries)
+    return summaries
+
+
+def run_worker_job(request, defaults):
+    """
+    在 worker 中执行一个任务，返回结束状态：finished / cancelled / failed。
+    任务可覆盖 resume 与 transport，其余选项沿用 worker 启动时的命令行参数
+    """
+    global RESUME, TRANSPORT
+    urls = list(request.get("urls") or [])
+    discover = request.get("discover")
+    RESUME = bool(request.get("resume", defaults["resume"]))
+    TRANSPORT = request.get("transport") if request.get("transport") in ("html", "json") else defaults["transport"]
+    METRICS.reset()
+    EVENTS.job = request.get("job")
+    EVENTS.started = time.monotonic()
+    EVENTS.emit("start", urls=urls, discover=discover, engine=CRAWL_ENGINE, transport=TRANSPORT)
+    try:
+        if discover:
+            crawl_discovered(discover if isinstance(discover, str) else DISCOVER_LISTING_URL)
+        elif len(urls) > 1:
+            crawl_batch(urls)
+        elif urls:
+            crawl_post(urls[0])
+        else:
+            print("❌ 任务缺少 URL")
+            return "failed"
+        return "finished"
+    except CrawlCancelled:
+        print("⏹️ 任务已取消；断点日志已落盘，带 resume 重新提交即可继续")
+        return "cancelled"
+    except Exception as e:
+        print(f"❌ 任务失败: {e}")
+        return "failed"
+    finally:
+        EVENTS.job = None
+
+
+def serve_worker(defaults):
+    """
+    --worker：常驻进程，省去每次抓取重新启动 Python、导入依赖与建立连接的开销。
+    标准输入每行一个 JSON 请求，标准输出每行一个事件（带 job 字段）：
+      {"op": "crawl", "job": "<id>", "urls": [...], "discover": null | true | "<列表页>", "resume": false, "transport": "html"}
+      {"op": "cancel", "job": "<id>"}    取消排队中或正在进行的任务（进行中的任务会落盘断点日志）
+      {"op": "shutdown"}                  取消当前任务后退出（标准输入关闭时同样退出）
+    任务按提交顺序逐个执行，排队超过 WORKER_QUEUE_SIZE 个时拒绝（job_rejected）；
+    任务之间共用令牌桶、自适应并发、连接池与 HTTP 缓存
+    """
+    global INTERACTIVE
+    INTERACTIVE = False
+    pending = queue.Queue(maxsize=WORKER_QUEUE_SIZE)
+    lock = threading.Lock()
+    cancelled = set()  # 已取消但仍在队列中的任务
+    running = [None]
+
+    def run():
+        while True:
+            request = pending.get()
+            if request is None:
+                return
+            job = request.get("job")
+            with lock:
+                if job in cancelled:
+                    cancelled.discard(job)
+                    EVENTS.emit("job_finished", job=job, status="cancelled")
+                    continue
+                running[0] = job
+                CANCEL.clear()
+            EVENTS.emit("job_started", job=job)
+            status = run_worker_job(request, defaults)
+            with lock:
+                running[0] = None
+            EVENTS.emit("job_finished", job=job, status=status)
+
+    runner = threading.Thread(target=run, name="crawl-worker", daemon=True)
+    runner.start()
+    EVENTS.emit("ready", pid=os.getpid(), queue_size=WORKER_QUEUE_SIZE)
+    # 从复制的文件描述符读取请求：解析进程由 fork 创建时会关闭 sys.stdin，
+    # 若主线程正阻塞在 sys.stdin 的读取上（持有其锁），子进程会卡死在关闭操作里
+    requests_in = os.fdopen(os.dup(sys.stdin.fileno()), encoding="utf-8")
+    for line in requests_in:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError:
+            EVENTS.emit("error", reason=f"无法解析的请求: {line.strip()[:200]}")
+            continue
+        op, job = request.get("op"), request.get("job")
+        if op == "crawl":
+            try:
+                pending.put_nowait(request)
+            except queue.Full:
+                EVENTS.emit("job_rejected", job=job, reason=f"排队任务已满（{WORKER_QUEUE_SIZE} 个）")
+                continue
+            EVENTS.emit("job_queued", job=job, position=pending.qsize())
+        elif op == "cancel":
+            with lock:
+                if running[0] == job:
+                    CANCEL.set()
+                else:
+                    cancelled.add(job)
+        elif op == "shutdown":
+            break
         else:
-            print("❌ 请提供帖子 URL，例如：")
-            print("python extract_chat_from_forum.py https://6do.world/t/topic/754330")
+            EVENTS.emit("error", job=job, reason=f"未知操作: {op}")
+
+    # 退出：丢弃排队中的任务，取消正在进行的任务并等待其落盘
+    while True:
+        try:
+            request = pending.get_nowait()
+        except queue.Empty:
+            break
+        EVENTS.emit("job_finished", job=request.get("job"), status="cancelled")
+    CANCEL.set()
+    pending.put(None)
+    runner.join()
+
+
+# 入口：支持命令行传入 URL；若未传且 BASE_URL 有值则使用 BASE_URL；否则提示并退出
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="抓取六度世界聊天区备份帖并导出 CSV")
+    parser.add_argument("url", nargs="*", help="帖子 URL；多个 URL 时进入批量模式")
+    parser.add_argument(
+        "--urls-file",
+        metavar="FILE",
+        help="从文件读取帖子 URL（每行一个，\"-\" 表示标准输入），与命令行 URL 合并后批量抓取",
+    )
+    parser.add_argument(
+        "--discover",
+        nargs="?",
+        const=DISCOVER_LISTING_URL,
+        metavar="LISTING_URL",
+        help="遍历帖子列表，自动抓取新出现或有更新的月度备份帖（默认列表 /latest，可指定分类页）",
+    )
+    parser.add_argument(
+        "--batch-parallel",
+        type=int,
+        default=BATCH_PARALLEL_TOPICS,
+        help=f"批量模式下同时抓取的帖子数，默认 {BATCH_PARALLEL_TOPICS}",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["thread", "async"],
+        default=CRAWL_ENGINE,
+        help="抓取引擎：thread（线程池，默认）或 async（asyncio，需要 aiohttp）",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["html", "json"],
+        default=TRANSPORT,
+        help="html：逐楼层抓取渲染页面（默认）；json：读取 Discourse JSON 接口，一次请求多个楼层",
+    )
+    parser.add_argument(
+        "--json-batch",
+        type=int,
+        default=JSON_POSTS_PER_REQUEST,
+        help=f"JSON 方式每次请求的楼层数，默认 {JSON_POSTS_PER_REQUEST}",
+    )
+    parser.add_argument(
+        "--stride",
+        default=FLOOR_STRIDE,
+        help="跳层抓取步长：auto（默认，按首页渲染的楼层数确定）、K（每隔 K 层抓一页）或 1（逐层抓取）",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=sorted(PARSER_BACKENDS),
+        default=PARSER_BACKEND,
+        help="聊天记录解析后端，默认 auto（有 lxml 用 lxml，否则 strainer）",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="从上次中断处继续：读取断点日志，只抓取尚未完成的楼层",
+    )
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="把抓到的楼层页压缩存入 backend/data/.archive/topic-<id>.pages，解析规则改变后可用 --reparse 离线重建",
+    )
+    parser.add_argument(
+        "--reparse",
+        action="store_true",
+        help="不访问网络，用页面归档重建 CSV（指定 URL 时只重建这些帖子，否则重建全部已归档的帖子），全部 CPU 核并行解析",
+    )
+    parser.add_argument(
+        "--message-index",
+        action="store_true",
+        help="跨帖子去重：按 backend/data/.index 中的消息索引，跳过已归档在其他 CSV 中的消息（默认关闭）",
+    )
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help="不使用磁盘 HTTP 缓存（默认开启：已缓存的页面发条件请求，304 时直接读磁盘）",
+    )
+    parser.add_argument(
+        "--http-cache-dir",
+        default=HTTP_CACHE_DIR,
+        help="磁盘 HTTP 缓存目录，默认 backend/data/.http_cache",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(CSV_SUFFIXES),
+        default=CSV_COMPRESSION,
+        help="输出 CSV 压缩方式：none（默认）、gzip（.csv.gz）或 zstd（.csv.zst，需要 zstandard）",
+    )
+    parser.add_argument(
+        "--sqlite",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="同时写入 SQLite 数据库（按 message_id 插入或更新），默认 backend/data/chat.db",
+    )
+    parser.add_argument(
+        "--events",
+        choices=["jsonl"],
+        default=EVENTS_FORMAT,
+        help="jsonl：在标准输出逐行输出结构化进度事件（普通日志改写到标准错误），供 crawler.js 转发给前端",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=METRICS_PATH,
+        metavar="PATH",
+        help="抓取指标 JSON 摘要路径，默认 backend/data/.metrics/crawl-metrics.json",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        default=METRICS_PROM_PATH,
+        metavar="PATH",
+        help="同时写出 Prometheus 文本格式指标（node_exporter textfile collector）",
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="常驻 worker：从标准输入逐行读取 JSON 任务，进度事件写到标准输出（供 crawler.js 复用同一进程）",
+    )
+    parser.add_argument(
+        "--worker-queue",
+        type=int,
+        default=WORKER_QUEUE_SIZE,
+        help=f"worker 排队等待的任务数上限，默认 {WORKER_QUEUE_SIZE}",
+    )
+    parser.add_argument(
+        "--parse-procs",
+        type=int,
+        default=PARSE_PROCESSES,
+        help="解析进程数，>0 时抓取与解析分离为流水线（建议设为 CPU 核数），默认 0",
+    )
+    args = parser.parse_args()
+
+    urls = list(args.url)
+    if args.urls_file:
+        urls += read_url_list(args.urls_file)
+    if not urls and BASE_URL:
+        urls = [BASE_URL]
+    if not urls and not args.discover and not args.worker and not args.reparse:
+        print("❌ 请提供帖子 URL，例如：")
+        print("python extract_chat_from_forum.py https://6do.world/t/topic/754330")
+        sys.exit(1)
+    if args.stride != "auto" and not (args.stride.isdigit() and int(args.stride) >= 1):
+        print("❌ --stride 只能是 auto 或正整数")
+        sys.exit(1)
+    if args.compress == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("❌ zstd 压缩需要 zstandard，请先安装：pip install zstandard")
             sys.exit(1)
-    crawl_post(TARGET_URL)
+    CRAWL_ENGINE = args.engine
+    TRANSPORT = args.transport
+    JSON_POSTS_PER_REQUEST = max(1, args.json_batch)
+    FLOOR_STRIDE = args.stride
+    CSV_COMPRESSION = args.compress
+    if args.sqlite is not None:
+        SQLITE_PATH = args.sqlite or os.path.join(INPUT_DIR, "chat.db")
+    RESUME = args.resume
+    HTTP_CACHE_ENABLED = not args.no_http_cache
+    MESSAGE_INDEX_ENABLED = args.message_index
+    ARCHIVE_PAGES = args.archive
+    HTTP_CACHE_DIR = args.http_cache_dir
+    PARSER_BACKEND = args.parser
+    PARSE_PROCESSES = args.parse_procs
+    METRICS_PATH = args.metrics
+    EVENTS_FORMAT = "jsonl" if args.worker else args.events
+    WORKER_QUEUE_SIZE = max(1, args.worker_queue)
+    if args.worker:
+        EVENTS.open(sys.stdout)
+        sys.stdout = sys.stderr
+        METRICS_PROM_PATH = args.metrics_prom
+        BATCH_PARALLEL_TOPICS = max(1, args.batch_parallel)
+        serve_worker({"resume": RESUME, "transport": TRANSPORT})
+        sys.exit(0)
+    if EVENTS_FORMAT == "jsonl":
+        # 标准输出只留给事件；由程序调用时没有人输入，探测结果异常也不再等待确认
+        EVENTS.open(sys.stdout)
+        sys.stdout = sys.stderr
+        INTERACTIVE = False
+        EVENTS.emit("start", urls=urls, discover=args.discover, engine=CRAWL_ENGINE, transport=TRANSPORT)
+    METRICS_PROM_PATH = args.metrics_prom
+    BATCH_PARALLEL_TOPICS = max(1, args.batch_parallel)
+    if args.reparse:
+        reparse_archives(urls)
+    elif args.discover:
+        INTERACTIVE = False
+        crawl_discovered(args.discover)
+    elif len(urls) > 1:
+        crawl_batch(urls)
+    else:
+        crawl_post(urls[0])
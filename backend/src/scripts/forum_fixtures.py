@@ -0,0 +1,197 @@
+# forum_fixtures.py
+# 生成离线使用的合成论坛页面（结构仿照 6do.world 的 Discourse 楼层页），
+# 供解析后端一致性检查与性能基准使用，不依赖网络。
+
+import random
+
+TOPIC_TITLE = "六度世界聊天区202508 总备份 - 🧗🏻‍♀️资深网友讨论区 - 六度世界"
+
+USERNAMES = ["小明", "alice", "Bob_99", "六度网友", "猫猫🐱", "zhang-san", "Ω用户"]
+CHANNELS = ["六度世界聊天区", "资深网友讨论区", "General", "闲聊 & 灌水"]
+PHRASES = [
+    "今天天气不错",
+    "有人在吗？",
+    "哈哈哈哈 😂",
+    "see you tomorrow",
+    "这个链接看看",
+    "A &amp; B &lt;tag&gt;",
+    "换行之后\n还有一行",
+    "全角：冒号",
+    "   前后有空格   ",
+    "emoji 🎉🎉 结尾",
+]
+
+PAGE_HEAD = (
+    "<!DOCTYPE html>\n<html lang=\"zh-CN\">\n<head>\n"
+    "<meta charset=\"utf-8\">\n<title>{title}</title>\n"
+    "<meta name=\"description\" content=\"聊天记录备份\">\n"
+    "<link rel=\"stylesheet\" href=\"/stylesheets/desktop.css\">\n"
+    "<script>window.Discourse = {{}};</script>\n"
+    "</head>\n<body class=\"crawler\">\n"
+    "<header class=\"d-header\"><div class=\"wrap\"><a href=\"/\">六度世界</a></div></header>\n"
+    "<div id=\"main-outlet\" class=\"wrap\" role=\"main\">\n"
+    "<div id=\"topic-title\"><h1><a href=\"/t/topic/1\">{title}</a></h1></div>\n"
+)
+PAGE_TAIL = (
+    "</div>\n<footer class=\"container wrap\"><nav class=\"crawler-nav\">"
+    "<ul><li><a href=\"/\">首页</a></li><li><a href=\"/categories\">类别</a></li></ul>"
+    "</nav></footer>\n</body>\n</html>\n"
+)
+
+
+def message_html(mid, username, channel, created_at, text, with_message_div=True, prefix_username=False):
+    """单条聊天消息的 chat-transcript 片段"""
+    body = f"{username}：{text}" if prefix_username else text
+    paragraphs = "".join(f"<p>{line}</p>" for line in body.split("\n"))
+    inner = (
+        "<div class=\"chat-transcript-user\">"
+        "<div class=\"chat-transcript-user-avatar\"><img loading=\"lazy\" alt=\"\" "
+        "width=\"20\" height=\"20\" src=\"/user_avatar/6do.world/u/48/1.png\" class=\"avatar\"></div>"
+        f"<div class=\"chat-transcript-username\">{username}</div>"
+        f"<div class=\"chat-transcript-datetime\"><a href=\"/chat/c/-/1/{mid}\" title=\"{created_at}\">"
+        f"{created_at[:16].replace('T', ' ')}</a></div></div>"
+    )
+    if with_message_div:
+        inner += f"<div class=\"chat-transcript-messages\"><div class=\"chat-transcript-message\">{paragraphs}</div></div>"
+    else:
+        inner += paragraphs
+    return (
+        f"<div class=\"chat-transcript\" data-message-id=\"{mid}\" data-username=\"{username}\" "
+        f"data-datetime=\"{created_at}\" data-channel-name=\"{channel}\" data-channel-id=\"2\">"
+        f"{inner}</div>\n"
+    )
+
+
+def post_html(post_number, messages):
+    return (
+        f"<div id=\"post_{post_number}\" itemscope itemtype=\"http://schema.org/DiscussionForumPosting\" "
+        "class=\"topic-body crawler-post\">\n"
+        "<div class=\"crawler-post-meta\"><span class=\"creator\" itemprop=\"author\">"
+        "<a itemprop=\"url\" href=\"/u/system\"><span itemprop=\"name\">system</span></a></span>"
+        f"<span class=\"crawler-post-infos\"><span class=\"post-count\">#{post_number}</span></span></div>\n"
+        "<div class=\"post\" itemprop=\"text\">\n"
+        + "".join(messages)
+        + "</div>\n<meta itemprop=\"position\" content=\"{}\">\n</div>\n".format(post_number)
+    )
+
+
+def post_messages(post_number, per_post, seed=0):
+    """某一楼层的聊天消息（同一楼层、同一 seed 每次生成结果相同）"""
+    rng = random.Random(seed * 1_000_003 + post_number)
+    messages = []
+    for k in range(per_post):
+        mid = post_number * 1000 + k
+        username = rng.choice(USERNAMES)
+        day = 1 + (post_number // 48) % 28
+        created_at = f"2025-08-{day:02d}T{(post_number // 2) % 24:02d}:{k % 60:02d}:{rng.randrange(60):02d}Z"
+        messages.append(
+            message_html(
+                mid,
+                username,
+                rng.choice(CHANNELS),
+                created_at,
+                " ".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 3))),
+                with_message_div=rng.random() > 0.05,
+                prefix_username=rng.random() < 0.1,
+            )
+        )
+    return messages
+
+
+def floor_page_html(first_post, last_post, per_post=5, seed=0, title=TOPIC_TITLE):
+    """渲染包含 first_post..last_post 楼层的一整页"""
+    posts = [post_html(p, post_messages(p, per_post, seed)) for p in range(first_post, last_post + 1)]
+    return PAGE_HEAD.format(title=title) + "".join(posts) + PAGE_TAIL
+
+
+def synthetic_pages(count, window=20, per_post=5, seed=0):
+    """按 Discourse 每页 window 个楼层的方式生成 count 个楼层页面"""
+    pages = []
+    for floor in range(1, count + 1):
+        first = (floor - 1) // window * window + 1
+        pages.append(floor_page_html(first, min(first + window - 1, count), per_post, seed))
+    return pages
+
+
+def topic_posts(count, per_post=5, seed=0, deleted=()):
+    """
+    合成帖子的全部楼层（Discourse post 对象：id、post_number、cooked），
+    与 floor_page_html 渲染的是同一批消息；deleted 中的楼层视为已删除
+    """
+    return [
+        {"id": 100000 + n, "post_number": n, "username": "system", "cooked": "".join(post_messages(n, per_post, seed))}
+        for n in range(1, count + 1)
+        if n not in deleted
+    ]
+
+
+TITLE_FORMATS = [
+    "六度世界聊天区{y}{m:02d} 总备份",
+    "六度世界聊天区 {y}{m:02d} 备份（第二部分）",
+    "聊天记录 {y}-{m:02d}",
+    "聊天记录 {y}.{m:02d} 合集",
+    "{y}年{m}月 聊天区存档",
+    "{y}年{cn} 聊天区存档",
+    "{y}年{m}月至{m2}月 聊天记录",
+    "{y}/{m:02d} 聊天记录",
+    "{y}{m:02d}-{y2}{m3:02d} 跨年备份",
+    "{y}年Q{q} 季度备份",
+    "{y}年第{cq}季度 备份",
+    "🎉 六度世界 / 聊天区: 没有日期的备份 <{y}> ✨",
+    "资深网友讨论区 {y}{m:02d} 与 {y}{m3:02d} 精选",
+]
+CN_MONTHS = ["一月", "二月", "三月", "四月", "五月", "六月", "七月", "八月", "九月", "十月", "十一月", "十二月"]
+
+
+def topic_titles(count, seed=0):
+    """帖子标题：覆盖 extract_post_title_and_yyyymm 支持的各种年月格式、emoji 与文件名非法字符"""
+    rng = random.Random(seed)
+    titles = []
+    for i in range(count):
+        y, m = rng.randint(2019, 2026), rng.randint(1, 12)
+        title = TITLE_FORMATS[i % len(TITLE_FORMATS)].format(
+            y=y,
+            y2=y + 1,
+            m=m,
+            m2=rng.randint(m, 12),
+            m3=rng.randint(1, 12),
+            cn=CN_MONTHS[m - 1],
+            q=rng.randint(1, 4),
+            cq="一二三四"[rng.randrange(4)],
+        )
+        titles.append(f"{title} - 🧗🏻‍♀️资深网友讨论区 - 六度世界")
+    return titles
+
+
+def tricky_pages():
+    """解析边界情况：实体、注释、脚本、嵌套引用、空消息、异常标题等"""
+    m = message_html
+    t = "2025-08-01T12:00:00Z"
+    return [
+        floor_page_html(1, 2, per_post=3),
+        PAGE_HEAD.format(title="A &amp; B &#x6d4b;试 &lt;202508&gt;") + m("1", "alice", "c", t, "hi") + PAGE_TAIL,
+        "<html><head><title></title></head><body>" + m("2", "bob", "c", t, "无标题") + "</body></html>",
+        "<html><body>" + m("3", "bob", "c", t, "没有 head") + "</body></html>",
+        "<html><head><title>六度世界聊天区202507 <b>加粗</b></title></head><body></body></html>",
+        # 空消息、只有用户名前缀的消息
+        "<html><body>" + m("4", "carol", "c", t, "") + m("5", "carol", "c", t, "：", prefix_username=True) + "</body></html>",
+        # 消息内含注释、脚本、样式、注音与 CDATA 风格内容
+        "<html><body><div class=\"chat-transcript\" data-message-id=\"6\" data-username=\" dave \" "
+        "data-datetime=\"" + t + "\"><div class=\"chat-transcript-message\"><p>前<!-- 注释 -->后</p>"
+        "<script>var x = 1;</script><style>p{}</style><ruby>漢<rp>(</rp><rt>han</rt><rp>)</rp></ruby>"
+        "<p>&nbsp;不间断&nbsp;空格 &copy; &#128512;</p></div></div></body></html>",
+        # 引用另一段聊天记录（嵌套 chat-transcript）
+        "<html><body><div class=\"chat-transcript\" data-message-id=\"7\" data-username=\"erin\" "
+        "data-datetime=\"" + t + "\" data-channel-name=\"频道\"><div class=\"chat-transcript-message\">"
+        "<p>外层</p>" + m("8", "frank", "频道", t, "内层") + "</div></div></body></html>",
+        # 多个 class、缺失属性、没有 message 区块
+        "<html><body><div class=\"onebox chat-transcript chat-transcript-chained\">"
+        "<span>  只有   文本  </span>\n<em>强调</em></div></body></html>",
+        # 标签未闭合、属性使用单引号
+        "<html><body><div class='chat-transcript' data-message-id='9' data-username='gina'>"
+        "<div class='chat-transcript-message'><p>未闭合段落<p>第二段<br>换行</div></div></body></html>",
+        # Windows 换行、制表符、控制字符附近的空白
+        "<html>\r\n<body>\r\n" + m("10", "hank", "c", t, "第一行\r\n第二行\t制表") + "</body></html>",
+        "<html><body><p>没有聊天记录的普通楼层</p></body></html>",
+        "",
+    ]
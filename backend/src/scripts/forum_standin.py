@@ -0,0 +1,469 @@
+# forum_standin.py
+# 本地论坛替身：用合成或录制的帖子数据模拟 6do.world（Discourse）的楼层页与 JSON 接口，
+# 离线验证两种传输方式（--transport html / json），并可注入故障，对完整的爬虫做压测，不访问真实论坛。
+#
+# 用法：
+#   python forum_standin.py --floors 500                  # 启动替身服务器，打印帖子 URL，Ctrl+C 退出
+#   python forum_standin.py --topic-json recorded.json    # 使用录制的 /t/<id>.json（post_stream.posts 需包含全部楼层，
+#                                                         #   例如保存 /t/<id>.json?print=true 的响应）
+#   python forum_standin.py --compare --floors 500        # 分别用 html / json 方式抓取替身，比较输出与请求数
+#   python forum_standin.py --load --floors 2000 --latency 0.05 --storm-every 10 --storm-seconds 2 --error-rate 0.02
+#                                                         # 用完整的爬虫抓取替身，报告墙钟时间、请求数、重复下载、
+#                                                         #   缺失楼层与每秒消息数（--output 另存为 JSON）
+#
+# 路由（与 Discourse 一致）：
+#   /t/<slug>/<id>[/<楼层>]          渲染页面，每页 --window 个楼层（默认 20）
+#   /t/[<slug>/]<id>.json            帖子信息：标题、楼层数、前一页楼层与全部楼层 ID
+#   /t/<id>/posts.json?post_ids[]=…  按 ID 批量返回楼层
+#
+# 故障注入（每个请求独立抽样，--seed 固定时可复现）：
+#   --latency / --jitter          每个响应前固定延迟 + [0, jitter) 随机延迟（秒）
+#   --storm-every / --storm-seconds / --retry-after
+#                                 每隔 storm-every 秒出现一次持续 storm-seconds 秒的 429 风暴，响应带 Retry-After
+#   --error-rate                  返回 500 / 502 / 503 的比例
+#   --truncate-rate               响应体只发送一半就断开连接的比例（Content-Length 仍为完整长度）
+#   --drip-rate / --drip-delay    慢速响应的比例：每 DRIP_CHUNK 字节停顿 drip-delay 秒
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import forum_fixtures
+
+PAGE_SIZE = 20  # Discourse 每页 / 每次随帖子信息返回的楼层数
+JSON_TITLE = "六度世界聊天区202508 总备份"
+DRIP_CHUNK = 2048  # 慢速响应每次发送的字节数
+ERROR_STATUSES = (500, 502, 503)
+
+
+class Faults:
+    """故障注入配置；各 *_rate 为每个请求独立抽样的概率，seed 固定时抽样序列可复现"""
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        storm_every=0.0,
+        storm_seconds=0.0,
+        retry_after=1,
+        error_rate=0.0,
+        truncate_rate=0.0,
+        drip_rate=0.0,
+        drip_delay=0.05,
+        fail_paths=(),
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.storm_every = storm_every
+        self.storm_seconds = storm_seconds
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.drip_rate = drip_rate
+        self.drip_delay = drip_delay
+        self.fail_paths = set(fail_paths)  # 这些路径的请求总是返回 500，模拟反复失败的楼层
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def _chance(self, rate):
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+    def delay(self):
+        if self.jitter <= 0:
+            return self.latency
+        with self._lock:
+            return self.latency + self._rng.uniform(0, self.jitter)
+
+    def in_storm(self):
+        """每个周期的最后 storm_seconds 秒为 429 风暴（替身启动后先正常服务一段时间）"""
+        if self.storm_every <= 0 or self.storm_seconds <= 0:
+            return False
+        phase = (time.monotonic() - self.started) % self.storm_every
+        return phase >= self.storm_every - self.storm_seconds
+
+    def error_status(self, path=None):
+        if path in self.fail_paths:
+            return 500
+        if not self._chance(self.error_rate):
+            return None
+        with self._lock:
+            return self._rng.choice(ERROR_STATUSES)
+
+    def truncate(self):
+        return self._chance(self.truncate_rate)
+
+    def drip(self):
+        return self._chance(self.drip_rate)
+
+
+class StandinForum:
+    """
+    单个帖子的替身服务器：requests 按类型记录请求次数，statuses 记录状态码，injected 记录注入的故障，
+    fetches 记录每个路径的请求次数（包括失败的请求，用于统计重复下载），
+    downloads / windows 记录完整下载成功的路径与楼层窗口
+    """
+
+    def __init__(self, posts, title=JSON_TITLE, topic_id=1, window=PAGE_SIZE, faults=None):
+        self.posts = sorted(posts, key=lambda p: p["post_number"])
+        self.by_id = {p["id"]: p for p in self.posts}
+        self.title = title
+        self.topic_id = topic_id
+        self.window = window
+        self.faults = faults or Faults()
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.injected = Counter()
+        self.fetches = Counter()
+        self.downloads = Counter()
+        self.windows = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def record(self, counter, key):
+        with self._lock:
+            counter[key] += 1
+
+    def reset(self):
+        with self._lock:
+            for counter in (self.requests, self.statuses, self.injected, self.fetches, self.downloads, self.windows):
+                counter.clear()
+
+    def topic_json(self):
+        return {
+            "id": self.topic_id,
+            "title": self.title,
+            "posts_count": len(self.posts),
+            "highest_post_number": self.posts[-1]["post_number"] if self.posts else 0,
+            "post_stream": {"posts": self.posts[: self.window], "stream": [p["id"] for p in self.posts]},
+        }
+
+    def posts_json(self, ids):
+        return {"post_stream": {"posts": [self.by_id[i] for i in ids if i in self.by_id]}}
+
+    def floor_window(self, floor):
+        """楼层页渲染的第一个楼层号（超过最后一层时为最后一页）"""
+        last = self.posts[-1]["post_number"] if self.posts else 1
+        return (min(floor, last) - 1) // self.window * self.window + 1
+
+    def floor_html(self, floor):
+        """楼层页：包含该楼层所在的一页"""
+        first = self.floor_window(floor)
+        page = [p for p in self.posts if first <= p["post_number"] < first + self.window]
+        title = f"{self.title} - 🧗🏻‍♀️资深网友讨论区 - 六度世界"
+        return (
+            forum_fixtures.PAGE_HEAD.format(title=title)
+            + "".join(forum_fixtures.post_html(p["post_number"], [p["cooked"]]) for p in page)
+            + forum_fixtures.PAGE_TAIL
+        )
+
+    def start(self, port=0):
+        forum = self
+        faults = self.faults
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type, headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                forum.record(forum.statuses, status)
+                if status != 200:
+                    self.wfile.write(data)
+                    return False
+                if faults.truncate():
+                    # 只发送一半就断开：客户端读到的长度小于 Content-Length
+                    forum.record(forum.injected, "truncated")
+                    self.wfile.write(data[: len(data) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return False
+                if faults.drip():
+                    forum.record(forum.injected, "drip")
+                    for i in range(0, len(data), DRIP_CHUNK):
+                        self.wfile.write(data[i : i + DRIP_CHUNK])
+                        self.wfile.flush()
+                        time.sleep(faults.drip_delay)
+                else:
+                    self.wfile.write(data)
+                forum.record(forum.downloads, self.path)
+                return True
+
+            def _fault(self):
+                """注入延迟、429 风暴与 5xx；已返回错误响应时返回 True"""
+                delay = faults.delay()
+                if delay > 0:
+                    time.sleep(delay)
+                if faults.in_storm():
+                    forum.record(forum.injected, "429")
+                    self._send(429, "rate limited", "text/plain", {"Retry-After": str(faults.retry_after)})
+                    return True
+                status = faults.error_status(urlsplit(self.path).path)
+                if status is not None:
+                    forum.record(forum.injected, str(status))
+                    self._send(status, "server error", "text/plain")
+                    return True
+                return False
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                path = parts.path.rstrip("/")
+                forum.record(forum.fetches, self.path)
+                m = re.fullmatch(r"/t/(?:[^/]+/)?(\d+)\.json", path)
+                if m and int(m.group(1)) == forum.topic_id:
+                    forum.count("topic_json")
+                    if not self._fault():
+                        self._send(200, json.dumps(forum.topic_json(), ensure_ascii=False), "application/json")
+                    return
+                m = re.fullmatch(r"/t/(\d+)/posts\.json", path)
+                if m and int(m.group(1)) == forum.topic_id:
+                    forum.count("posts_json")
+                    if not self._fault():
+                        ids = [int(i) for i in parse_qs(parts.query).get("post_ids[]", []) if i.isdigit()]
+                        self._send(200, json.dumps(forum.posts_json(ids), ensure_ascii=False), "application/json")
+                    return
+                m = re.fullmatch(r"/t/[^/]+/(\d+)(?:/(\d+))?", path)
+                if m and int(m.group(1)) == forum.topic_id:
+                    forum.count("html")
+                    if not self._fault():
+                        floor = int(m.group(2) or 1)
+                        if self._send(200, forum.floor_html(floor), "text/html; charset=utf-8"):
+                            forum.record(forum.windows, forum.floor_window(floor))
+                    return
+                forum.count("not_found")
+                self._send(404, "not found", "text/plain")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/t/topic/{self.topic_id}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def load_recorded(path):
+    """读取录制的 /t/<id>.json，返回 (楼层列表, 标题, 帖子 ID)"""
+    with open(path, encoding="utf-8") as f:
+        topic = json.load(f)
+    posts = (topic.get("post_stream") or {}).get("posts") or []
+    return posts, topic.get("title") or JSON_TITLE, topic.get("id") or 1
+
+
+def compare_transports(forum):
+    """分别用 html / json 方式抓取替身，逐行比较输出，返回是否一致"""
+    import io
+    import os
+    import tempfile
+    from contextlib import redirect_stdout
+
+    import extract_chat_from_forum as crawler
+    from chat_store import read_csv_records
+
+    url = forum.start()
+    crawler.HTTP_CACHE_ENABLED = False
+    crawler.INTERACTIVE = False
+    crawler.REQUEST_RATE_MAX = 1000.0
+    crawler.RATE_LIMITER.set_rate(1000.0)
+    outputs = {}
+    for transport in ("html", "json"):
+        crawler.TRANSPORT = transport
+        crawler.INPUT_DIR = tempfile.mkdtemp(prefix=f"standin-{transport}-")
+        forum.reset()
+        with redirect_stdout(io.StringIO()):
+            summary = crawler.crawl_post(url, report=False)
+        rows = read_csv_records(summary["output"])
+        outputs[transport] = rows
+        print(
+            f"{transport:>4}: {len(rows)} 条消息，请求 {sum(forum.requests.values())} 次 {dict(forum.requests)}，"
+            f"输出 {os.path.basename(summary['output'])}"
+        )
+    forum.stop()
+    if outputs["html"] == outputs["json"]:
+        print("✅ 两种方式输出逐行一致")
+        return True
+    same_set = sorted(map(tuple, (r.values() for r in outputs["html"]))) == sorted(
+        map(tuple, (r.values() for r in outputs["json"]))
+    )
+    print("⚠️ 消息相同但顺序不同" if same_set else "❌ 两种方式输出不一致")
+    return same_set
+
+
+def run_load(forum, engine="thread", transport="html", stride="auto", rate=50.0, backoff=None, verbose=False):
+    """
+    用完整的爬虫（crawl_post：探测、抓取、补抓、写出）抓取替身，返回压测报告：
+    墙钟时间、各类请求数与状态码、注入的故障、重复下载、缺失楼层与每秒写出的消息数
+    """
+    import io
+    import tempfile
+    from contextlib import redirect_stdout
+
+    import extract_chat_from_forum as crawler
+    from chat_store import read_csv_records
+
+    # 每个楼层应有的消息 ID（与爬虫使用同一个解析器从 cooked 中提取）
+    expected = {
+        p["post_number"]: {str(r["message_id"]) for r in crawler.parse_chat_transcripts(p["cooked"])}
+        for p in forum.posts
+    }
+    url = forum.start()
+    crawler.HTTP_CACHE_ENABLED = False
+    crawler.INTERACTIVE = False
+    crawler.INPUT_DIR = tempfile.mkdtemp(prefix="standin-load-")
+    crawler.CRAWL_ENGINE = engine
+    crawler.TRANSPORT = transport
+    crawler.FLOOR_STRIDE = stride
+    crawler.REQUEST_RATE_MAX = rate
+    crawler.RATE_LIMITER.set_rate(rate)
+    if backoff is not None:
+        crawler.BACKOFF_BASE_DELAY = backoff
+    forum.reset()
+    forum.faults.started = time.monotonic()
+
+    started = time.monotonic()
+    with redirect_stdout(sys.stderr if verbose else io.StringIO()):
+        summary = crawler.crawl_post(url, report=False)
+    wall = time.monotonic() - started
+    forum.stop()
+
+    rows = read_csv_records(summary["output"]) if summary else []
+    written = {r["message_id"] for r in rows}
+    missing = sorted(floor for floor, ids in expected.items() if ids - written)
+    html_ok = sum(forum.windows.values())
+    return {
+        "engine": engine,
+        "transport": transport,
+        "stride": stride,
+        "floors": len(forum.posts),
+        "window": forum.window,
+        "wall_seconds": round(wall, 3),
+        "requests": sum(forum.requests.values()),
+        "requests_by_kind": dict(forum.requests),
+        "statuses": {str(k): v for k, v in sorted(forum.statuses.items())},
+        "injected": dict(forum.injected),
+        "duplicate_downloads": sum(n - 1 for n in forum.fetches.values() if n > 1),
+        "redundant_windows": html_ok - len(forum.windows),
+        "missing_floors": len(missing),
+        "missing_sample": missing[:20],
+        "messages_expected": sum(len(ids) for ids in expected.values()),
+        "messages_written": len(rows),
+        "messages_per_sec": round(len(rows) / wall, 1) if wall > 0 else None,
+    }
+
+
+def print_load_report(report):
+    r = report
+    print(
+        f"引擎 {r['engine']}，传输 {r['transport']}，步长 {r['stride']}；{r['floors']} 个楼层，每页 {r['window']} 层"
+    )
+    print(f"墙钟时间 {r['wall_seconds']:.2f} 秒，请求 {r['requests']} 次 {r['requests_by_kind']}，状态码 {r['statuses']}")
+    print(f"注入故障：{r['injected'] or '无'}")
+    print(
+        f"重复下载：同一 URL 重复请求 {r['duplicate_downloads']} 次（含失败后的重试），"
+        f"同一楼层窗口重复 {r['redundant_windows']} 次"
+    )
+    sample = f"（如 {r['missing_sample']}）" if r["missing_floors"] else ""
+    print(
+        f"缺失楼层 {r['missing_floors']}/{r['floors']}{sample}；"
+        f"写出消息 {r['messages_written']}/{r['messages_expected']}，每秒 {r['messages_per_sec']} 条"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地论坛替身（Discourse 楼层页与 JSON 接口）")
+    parser.add_argument("--floors", type=int, default=200, help="合成帖子的楼层数")
+    parser.add_argument("--per-post", type=int, default=5, help="合成帖子每层的消息数")
+    parser.add_argument("--window", type=int, default=PAGE_SIZE, help=f"每页渲染的楼层数，默认 {PAGE_SIZE}")
+    parser.add_argument("--topic-json", help="录制的 /t/<id>.json，替代合成数据")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--compare", action="store_true", help="比较 html / json 两种传输方式的输出")
+
+    faults = parser.add_argument_group("故障注入")
+    faults.add_argument("--latency", type=float, default=0.0, help="每个响应前的固定延迟（秒）")
+    faults.add_argument("--jitter", type=float, default=0.0, help="额外的随机延迟上限（秒）")
+    faults.add_argument("--storm-every", type=float, default=0.0, help="429 风暴周期（秒），0 表示不注入")
+    faults.add_argument("--storm-seconds", type=float, default=0.0, help="每次 429 风暴持续的秒数")
+    faults.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After（秒），默认 1")
+    faults.add_argument("--error-rate", type=float, default=0.0, help="返回 500 / 502 / 503 的比例")
+    faults.add_argument("--truncate-rate", type=float, default=0.0, help="响应体发送一半即断开连接的比例")
+    faults.add_argument("--drip-rate", type=float, default=0.0, help="慢速响应的比例")
+    faults.add_argument("--drip-delay", type=float, default=0.05, help=f"慢速响应每 {DRIP_CHUNK} 字节的停顿（秒）")
+    faults.add_argument("--seed", type=int, default=0, help="故障抽样的随机种子")
+
+    load = parser.add_argument_group("压测（--load）")
+    load.add_argument("--load", action="store_true", help="用完整的爬虫抓取替身并输出压测报告")
+    load.add_argument("--engine", choices=["thread", "async"], default="thread")
+    load.add_argument("--transport", choices=["html", "json"], default="html")
+    load.add_argument("--stride", default="auto", help="跳层抓取步长：auto、K 或 1")
+    load.add_argument("--rate", type=float, default=50.0, help="爬虫全局请求速率上限（次/秒），默认 50")
+    load.add_argument("--backoff", type=float, help="覆盖爬虫的基准退避时间（秒），缩短 5xx / 断连后的等待")
+    load.add_argument("--output", help="压测报告另存为 JSON")
+    load.add_argument("--verbose", action="store_true", help="爬虫日志输出到标准错误")
+    args = parser.parse_args()
+
+    fault_config = Faults(
+        latency=args.latency,
+        jitter=args.jitter,
+        storm_every=args.storm_every,
+        storm_seconds=args.storm_seconds,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        truncate_rate=args.truncate_rate,
+        drip_rate=args.drip_rate,
+        drip_delay=args.drip_delay,
+        seed=args.seed,
+    )
+    if args.topic_json:
+        posts, title, topic_id = load_recorded(args.topic_json)
+        forum = StandinForum(posts, title, topic_id, window=args.window, faults=fault_config)
+    else:
+        posts = forum_fixtures.topic_posts(args.floors, args.per_post)
+        forum = StandinForum(posts, window=args.window, faults=fault_config)
+
+    if args.compare:
+        sys.exit(0 if compare_transports(forum) else 1)
+    if args.load:
+        report = run_load(forum, args.engine, args.transport, args.stride, args.rate, args.backoff, args.verbose)
+        print_load_report(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+            print(f"压测报告已写入 {args.output}")
+        sys.exit(0 if report["missing_floors"] == 0 else 1)
+
+    url = forum.start(args.port)
+    print(f"替身服务器已启动：{url}（{len(forum.posts)} 个楼层），Ctrl+C 退出")
+    print(f"python extract_chat_from_forum.py {url} --transport json")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        forum.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+# message_index.py
+# 跨帖子的已归档消息索引：backend/data 下所有 CSV 中的 message_id 与其所属 CSV，
+# 抓取时据此丢弃已经保存在其他 CSV 中的消息（例如 202306-202308 跨月帖与各月的月度帖互相重叠），
+# 同一条消息只出现在最先归档它的 CSV 中，loadChatRecords 不会再读到重复的行。
+#
+# 存储：有序 int64 数组（消息 ID）+ 平行的 uint32 数组（所属 CSV 的编号），前置 Bloom 过滤器；
+# 查询先查 Bloom 过滤器（绝大多数新消息在这里就被排除），命中时再二分查找。
+# 每百万条消息约占 13 ~ 15 MB（ID 8 字节 + 所属 4 字节 + Bloom 1.25 ~ 2.5 字节）。
+# 文件写入同目录临时文件后原子改名，崩溃不会留下写了一半的索引。
+#
+# 用法：
+#   python message_index.py rebuild          # 按 backend/data 下已有的 CSV 重建索引（索引不存在时抓取会自动重建）
+#   python message_index.py stats            # 索引条数、各 CSV 的消息数与 Bloom 过滤器参数
+#
+# 所属 CSV 以去掉 .csv / .csv.gz / .csv.zst 后缀的文件名标识：重新抓取同一个帖子时仍写到同一个文件，
+# 它自己的消息不算“已归档”，改用压缩格式输出也不影响。所属 CSV 被删除或改名后，它的条目在下次使用索引时丢弃，
+# 这些消息不再算“已归档”。
+
+import array
+import bisect
+import glob
+import itertools
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+from chat_store import MESSAGE_ID_INT_LIMIT, compact_message_id, read_csv_records
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.normpath(os.path.join(BASE_DIR, "..", "data"))
+INDEX_DIRNAME = ".index"  # 位于数据目录下（不会被当作 CSV 读取）
+INDEX_FILENAME = "message-ids.bin"
+INDEX_MAGIC = b"MSGIDX01"
+INDEX_VERSION = 1
+CSV_SUFFIXES = (".csv.gz", ".csv.zst", ".csv")
+BLOOM_BITS_PER_ID = 10  # 每条消息占用的 Bloom 位数；配合 7 个哈希函数误判率约 1%
+BLOOM_HASHES = 7
+BLOOM_MIN_BITS = 1 << 13
+
+_MASK64 = (1 << 64) - 1
+
+
+def owner_of_path(path):
+    """CSV 路径 -> 所属标识（去掉目录与 .csv / .csv.gz / .csv.zst 后缀）"""
+    name = os.path.basename(path)
+    for suffix in CSV_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def message_int(mid):
+    """
+    message_id 转为整数（与 ChatRecord 存为 int 的规则相同：纯数字、无前导零、小于 2**63）；
+    其他 ID 返回 None（不进入索引，也永远不算已归档）
+    """
+    if not isinstance(mid, int):
+        mid = compact_message_id(mid)
+    return mid if isinstance(mid, int) and 0 <= mid < MESSAGE_ID_INT_LIMIT else None
+
+
+class BloomFilter:
+    """固定大小的位数组；双重哈希生成 k 个位置（整数键，无需额外的哈希库）"""
+
+    def __init__(self, bits, hashes=BLOOM_HASHES, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray(bits // 8)
+
+    @classmethod
+    def for_count(cls, count):
+        bits = max(BLOOM_MIN_BITS, count * BLOOM_BITS_PER_ID)
+        return cls((bits + 63) // 64 * 64)
+
+    @property
+    def capacity(self):
+        """误判率保持在设计值以内可容纳的键数"""
+        return self.bits // BLOOM_BITS_PER_ID
+
+    def _positions(self, key):
+        h1 = (key * 0x9E3779B97F4A7C15) & _MASK64
+        h2 = (((key ^ (key >> 31)) * 0xBF58476D1CE4E5B9) & _MASK64) | 1
+        bits = self.bits
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % bits
+
+    def add(self, key):
+        data = self.data
+        for pos in self._positions(key):
+            data[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        data = self.data
+        for pos in self._positions(key):
+            if not data[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class MessageIndex:
+    """
+    已归档消息索引（线程安全）：owner / known_elsewhere 供抓取时查询，commit 在 CSV 发布后更新。
+    文件格式：8 字节魔数、4 字节头部长度、JSON 头部（补齐到 8 字节边界）、
+    ids（int64 × count）、owners（uint32 × count）、Bloom 位数组。
+    """
+
+    def __init__(self, path=None, data_dir=None):
+        self.data_dir = data_dir or DATA_DIR
+        self.path = path or os.path.join(self.data_dir, INDEX_DIRNAME, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._clear()
+
+    def _clear(self):
+        self.ids = array.array("q")
+        self.owner_ids = array.array("I")
+        self.owners = []
+        self.bloom = BloomFilter.for_count(0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------- 读写 ----------
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """读取索引文件；文件不存在或格式不符时返回 False（保持为空索引）"""
+        with self._lock:
+            return self._load()
+
+    def _load(self):
+        self._clear()
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            self._mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._mtime = None
+            return False
+        if raw[:8] != INDEX_MAGIC:
+            return False
+        (header_len,) = struct.unpack_from("<I", raw, 8)
+        header = json.loads(raw[12 : 12 + header_len].decode("utf-8"))
+        if header.get("version") != INDEX_VERSION or header.get("byteorder") != sys.byteorder:
+            return False
+        offset = 12 + header_len
+        offset += -offset % 8
+        count = header["count"]
+        self.ids.frombytes(raw[offset : offset + 8 * count])
+        offset += 8 * count
+        self.owner_ids.frombytes(raw[offset : offset + 4 * count])
+        offset += 4 * count
+        self.owners = header["owners"]
+        bloom_bits = header["bloom_bits"]
+        self.bloom = BloomFilter(bloom_bits, header["bloom_hashes"], raw[offset : offset + bloom_bits // 8])
+        return True
+
+    def _save(self):
+        header = json.dumps(
+            {
+                "version": INDEX_VERSION,
+                "byteorder": sys.byteorder,
+                "count": len(self.ids),
+                "owners": self.owners,
+                "bloom_bits": self.bloom.bits,
+                "bloom_hashes": self.bloom.hashes,
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+        pad = b"\0" * (-(12 + len(header)) % 8)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=INDEX_FILENAME + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(INDEX_MAGIC + struct.pack("<I", len(header)) + header + pad)
+                f.write(self.ids.tobytes())
+                f.write(self.owner_ids.tobytes())
+                f.write(self.bloom.data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._mtime = os.path.getmtime(self.path)
+
+    def _owner_present(self, owner):
+        """所属 CSV 仍在数据目录中（任一压缩格式）"""
+        return any(os.path.exists(os.path.join(self.data_dir, owner + suffix)) for suffix in CSV_SUFFIXES)
+
+    def _prune_missing(self):
+        """丢弃所属 CSV 已不存在的条目（不保存），返回丢弃的条数；已清理的所属在 owners 中记为 None"""
+        gone = {o for o, owner in enumerate(self.owners) if owner is not None and not self._owner_present(owner)}
+        if not gone:
+            return 0
+        for o in gone:
+            self.owners[o] = None
+        keep = [o not in gone for o in self.owner_ids]
+        dropped = len(keep) - sum(keep)
+        if dropped:
+            self.ids = array.array("q", itertools.compress(self.ids, keep))
+            self.owner_ids = array.array("I", itertools.compress(self.owner_ids, keep))
+            self._rebuild_bloom()
+        return dropped
+
+    def prune_missing(self):
+        """丢弃所属 CSV 已被删除或改名的条目并保存索引，返回丢弃的条数"""
+        with self._lock:
+            if self.exists() and os.path.getmtime(self.path) != self._mtime:
+                self._load()
+            dropped = self._prune_missing()
+            if dropped:
+                self._save()
+            return dropped
+
+    # ---------- 查询 ----------
+
+    def owner(self, mid):
+        """消息所属的 CSV 标识；索引中没有时返回 None（与 commit / prune_missing 互斥，不会读到替换了一半的数组）"""
+        with self._lock:
+            return self._owner(mid)
+
+    def _owner(self, mid):
+        key = message_int(mid)
+        if key is None or key not in self.bloom:
+            return None
+        i = bisect.bisect_left(self.ids, key)
+        if i < len(self.ids) and self.ids[i] == key:
+            return self.owners[self.owner_ids[i]]
+        return None
+
+    def known_elsewhere(self, mid, owner):
+        """消息已归档在 owner 以外的 CSV 中"""
+        found = self.owner(mid)
+        return found is not None and found != owner
+
+    # ---------- 更新 ----------
+
+    def _rebuild_bloom(self, capacity=0):
+        self.bloom = BloomFilter.for_count(max(capacity, len(self.ids)))
+        for key in self.ids:
+            self.bloom.add(key)
+
+    def commit(self, owner, message_ids):
+        """
+        owner 的 CSV 已发布：用本次写出的消息替换它在索引中原有的条目并保存。
+        其他进程在此期间更新过索引文件时先重新读取；已属于其他 CSV 的消息保持原所属（先归档者优先）。
+        返回新登记的消息数。
+
+        Bloom 过滤器只追加新键（被替换掉的旧键留下的位只会让少数查询多做一次二分查找），
+        条数超过容量时才按两倍容量重建，逐个帖子提交的总开销与索引大小成线性关系。
+        """
+        keys = sorted({k for k in map(message_int, message_ids) if k is not None})
+        with self._lock:
+            if self.exists() and os.path.getmtime(self.path) != self._mtime:
+                self._load()
+            self._prune_missing()
+            if owner not in self.owners:
+                self.owners.append(owner)
+            me = self.owners.index(owner)
+            if me in self.owner_ids:
+                mine = [o != me for o in self.owner_ids]
+                self.ids = array.array("q", itertools.compress(self.ids, mine))
+                self.owner_ids = array.array("I", itertools.compress(self.owner_ids, mine))
+            fresh = [k for k in keys if self._owner(k) is None]
+            if not self.ids or not fresh or fresh[0] > self.ids[-1]:
+                # 消息 ID 随时间递增，新帖子的消息通常都排在已有条目之后，直接追加
+                self.ids.extend(fresh)
+                self.owner_ids.extend([me] * len(fresh))
+            else:
+                entries = sorted(itertools.chain(zip(self.ids, self.owner_ids), ((k, me) for k in fresh)))
+                self.ids = array.array("q", (k for k, _ in entries))
+                self.owner_ids = array.array("I", (o for _, o in entries))
+            if len(self.ids) > self.bloom.capacity:
+                self._rebuild_bloom(2 * len(self.ids))
+            else:
+                for key in fresh:
+                    self.bloom.add(key)
+            self._save()
+            return len(fresh)
+
+    def rebuild(self, paths=None):
+        """按已有 CSV 重建索引（按文件名顺序，先出现的文件优先），返回 {所属: 消息数} 与重复条数"""
+        if paths is None:
+            paths = sorted(
+                p for suffix in CSV_SUFFIXES for p in glob.glob(os.path.join(self.data_dir, "*" + suffix))
+            )
+        with self._lock:
+            self._clear()
+            owner_index, seen, duplicates = {}, {}, 0
+            for path in paths:
+                owner = owner_of_path(path)
+                o = owner_index.setdefault(owner, len(owner_index))
+                for r in read_csv_records(path):
+                    key = message_int(r.get("message_id"))
+                    if key is None:
+                        continue
+                    if key in seen:
+                        duplicates += seen[key] != o
+                        continue
+                    seen[key] = o
+            self.owners = list(owner_index)
+            entries = sorted(seen.items())
+            self.ids = array.array("q", (k for k, _ in entries))
+            self.owner_ids = array.array("I", (o for _, o in entries))
+            self._rebuild_bloom()
+            self._save()
+            return self._counts(), duplicates
+
+    def counts(self):
+        """{所属: 消息数}，按消息数从多到少"""
+        with self._lock:
+            return self._counts()
+
+    def _counts(self):
+        return {self.owners[o]: n for o, n in Counter(self.owner_ids).most_common()}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="跨帖子的已归档消息索引")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="CSV 所在目录，默认 backend/data")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="按已有 CSV 重建索引")
+    p_rebuild.add_argument("files", nargs="*", help="只使用指定的 CSV（默认数据目录下全部）")
+    sub.add_parser("stats", help="索引统计")
+    args = parser.parse_args()
+
+    index = MessageIndex(data_dir=args.data_dir)
+    if args.command == "rebuild":
+        counts, duplicates = index.rebuild(args.files or None)
+        print(f"已重建索引 {index.path}：{len(index)} 条消息，{len(counts)} 个 CSV")
+        if duplicates:
+            print(f"⚠️ 已有 CSV 之间有 {duplicates} 条重复消息（归属最先出现的文件），重新抓取后续文件即可去掉")
+        return
+    if not index.load():
+        print(f"索引不存在或格式不符：{index.path}（python message_index.py rebuild 重建）")
+        sys.exit(1)
+    size = os.path.getsize(index.path)
+    print(f"{index.path}：{len(index)} 条消息，{size / 1024 / 1024:.1f} MB")
+    print(f"Bloom 过滤器：{index.bloom.bits} 位，{index.bloom.hashes} 个哈希函数")
+    for owner, n in index.counts().items():
+        print(f"  {owner}: {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# page_archive.py
+# 原始页面归档：抓取时（--archive）把每个楼层页的 HTML（JSON 方式为各楼层的 cooked HTML）压缩存入
+# 每个帖子一个文件 backend/data/.archive/topic-<id>.pages，解析规则改变后用 --reparse 离线重建 CSV，
+# 不再需要按每 2 秒一个请求重新抓取整个帖子。
+#
+# 文件格式（只追加）：8 字节魔数，之后是一个个帧：1 字节类型 + 4 字节长度（小端）+ 内容
+#   M：帖子信息（JSON：base_url、title、transport、max_floor），后写的覆盖先写的
+#   B：页面内容，SHA-1（20 字节）+ zlib 压缩的 HTML；内容寻址，相同页面只存一份
+#   F：楼层索引，楼层号（4 字节）+ 页面 SHA-1；同一楼层后写的覆盖先写的
+# 打开时顺序扫描帧建立索引（只读帧头，跳过页面内容）；崩溃时写了一半的末尾帧被忽略，续写前截掉。
+# 抓取中的归档写在 <文件名>.partial，抓取完成后原子改名，中途失败时保留 .partial 供 --resume 续写。
+#
+# 用法：
+#   python page_archive.py                   # 列出 backend/data/.archive 下的归档：楼层数、页面数、压缩前后大小
+#   python page_archive.py topic-123.pages   # 只看指定的归档
+
+import glob
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.normpath(os.path.join(BASE_DIR, "..", "data"))
+ARCHIVE_DIRNAME = ".archive"  # 位于数据目录下（不会被当作 CSV 读取）
+ARCHIVE_SUFFIX = ".pages"
+PARTIAL_SUFFIX = ".partial"
+ARCHIVE_MAGIC = b"PGARC001"
+COMPRESS_LEVEL = 6
+
+_FRAME = struct.Struct("<cI")
+_FLOOR = struct.Struct("<I20s")
+
+
+def archive_dir(data_dir=None):
+    return os.path.join(data_dir or DATA_DIR, ARCHIVE_DIRNAME)
+
+
+def list_archives(data_dir=None):
+    """已完成的归档文件（不含抓取中的 .partial）"""
+    return sorted(glob.glob(os.path.join(archive_dir(data_dir), "*" + ARCHIVE_SUFFIX)))
+
+
+class PageArchive:
+    """
+    单个帖子的页面归档。抓取时由多个抓取线程调用 put（线程安全），
+    重建时用 floors / blob 按楼层读取压缩内容（解压交给解析进程）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = {}
+        self.floors = {}  # 楼层 -> 页面 SHA-1
+        self.blobs = {}  # SHA-1 -> (内容偏移, 压缩后长度)
+        self.raw_bytes = 0  # 本次写入的页面压缩前的总字节数（用于统计压缩比）
+        self._file = None
+        self._lock = threading.Lock()
+
+    # ---------- 打开 / 关闭 ----------
+
+    @classmethod
+    def read(cls, path):
+        """只读打开已有归档"""
+        archive = cls(path)
+        archive._scan()
+        return archive
+
+    @classmethod
+    def for_crawl(cls, path, resume=False):
+        """
+        抓取时打开：写入 path + .partial。resume 为 True 且存在上次中断留下的 .partial 时在其后续写，
+        否则新建（已完成的旧归档保持不变，直到本次抓取完成后被替换）
+        """
+        partial = path + PARTIAL_SUFFIX
+        archive = cls(partial)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume and os.path.exists(partial):
+            end = archive._scan()
+            archive._file = open(partial, "r+b")
+            archive._file.truncate(end)
+            archive._file.seek(end)
+        else:
+            archive._file = open(partial, "wb")
+            archive._file.write(ARCHIVE_MAGIC)
+        return archive
+
+    def _scan(self):
+        """顺序读取帧头建立索引，返回最后一个完整帧的结束位置"""
+        with open(self.path, "rb") as f:
+            if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"不是页面归档文件: {self.path}")
+            end = f.tell()
+            size = os.fstat(f.fileno()).st_size
+            while True:
+                head = f.read(_FRAME.size)
+                if len(head) < _FRAME.size:
+                    break
+                kind, length = _FRAME.unpack(head)
+                start = f.tell()
+                if start + length > size:
+                    break
+                if kind == b"B":
+                    sha = f.read(20)
+                    self.blobs[sha] = (start + 20, length - 20)
+                    f.seek(start + length)
+                elif kind == b"F":
+                    floor, sha = _FLOOR.unpack(f.read(length))
+                    self.floors[floor] = sha
+                elif kind == b"M":
+                    self.meta.update(json.loads(f.read(length).decode("utf-8")))
+                else:
+                    break
+                end = start + length
+        return end
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def publish(self):
+        """抓取完成：落盘后把 .partial 原子改名为正式归档，返回正式路径"""
+        self.close()
+        final = self.path[: -len(PARTIAL_SUFFIX)] if self.path.endswith(PARTIAL_SUFFIX) else self.path
+        os.replace(self.path, final)
+        self.path = final
+        return final
+
+    # ---------- 写入 ----------
+
+    def _frame(self, kind, payload):
+        self._file.write(_FRAME.pack(kind, len(payload)) + payload)
+
+    def set_meta(self, **meta):
+        with self._lock:
+            self.meta.update(meta)
+            self._frame(b"M", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+            self._file.flush()
+
+    def put(self, floor, html):
+        """存入一个楼层的页面；内容与已有页面相同时只追加楼层索引"""
+        data = html.encode("utf-8")
+        sha = hashlib.sha1(data).digest()
+        packed = None if sha in self.blobs else zlib.compress(data, COMPRESS_LEVEL)
+        with self._lock:
+            if self.floors.get(floor) == sha:
+                return
+            if sha not in self.blobs:
+                self._frame(b"B", sha + packed)
+                self.blobs[sha] = (self._file.tell() - len(packed), len(packed))
+                self.raw_bytes += len(data)
+            self._frame(b"F", _FLOOR.pack(floor, sha))
+            self.floors[floor] = sha
+            self._file.flush()
+
+    # ---------- 读取 ----------
+
+    def blob(self, sha):
+        """页面的压缩内容（zlib）"""
+        return next(self.iter_blobs([sha]))
+
+    def iter_blobs(self, shas):
+        """按给定顺序逐个读取压缩内容（共用一个文件句柄）"""
+        with open(self.path, "rb") as f:
+            for sha in shas:
+                offset, length = self.blobs[sha]
+                f.seek(offset)
+                yield f.read(length)
+
+    def page(self, floor):
+        return zlib.decompress(self.blob(self.floors[floor])).decode("utf-8")
+
+    def stats(self):
+        compressed = sum(length for _, length in self.blobs.values())
+        return {"floors": len(self.floors), "pages": len(self.blobs), "compressed_bytes": compressed}
+
+
+def main():
+    paths = sys.argv[1:] or list_archives()
+    if not paths:
+        print(f"{archive_dir()} 下没有页面归档（抓取时加 --archive 生成）")
+        return
+    for path in paths:
+        if not os.path.exists(path):
+            path = os.path.join(archive_dir(), path)
+        archive = PageArchive.read(path)
+        stats = archive.stats()
+        raw = sum(len(zlib.decompress(blob)) for blob in archive.iter_blobs(archive.blobs))
+        ratio = f"，压缩后为 {stats['compressed_bytes'] / raw:.0%}" if raw else ""
+        print(
+            f"{os.path.basename(path)}：{archive.meta.get('title') or '?'}（{archive.meta.get('transport', 'html')}），"
+            f"{stats['floors']} 个楼层，{stats['pages']} 个不同页面，"
+            f"{raw / 1024 / 1024:.1f} MB → {stats['compressed_bytes'] / 1024 / 1024:.1f} MB{ratio}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# conftest.py
+# 爬虫脚本的 pytest 公共设置：把 scripts 目录加入导入路径，并为每个测试隔离爬虫的全局配置与输出目录。
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extract_chat_from_forum as crawler  # noqa: E402
+import forum_standin  # noqa: E402
+
+
+@pytest.fixture
+def crawler_env(tmp_path, monkeypatch):
+    """爬虫模块本身：输出写到临时目录，关闭交互与 HTTP 缓存，测试结束后还原全部被改动的全局配置"""
+    monkeypatch.setattr(crawler, "INPUT_DIR", str(tmp_path / "csv"))
+    monkeypatch.setattr(crawler, "HTTP_CACHE_ENABLED", False)
+    monkeypatch.setattr(crawler, "INTERACTIVE", False)
+    os.makedirs(crawler.INPUT_DIR)
+    return crawler
+
+
+@pytest.fixture
+def standin(crawler_env, monkeypatch):
+    """
+    启动本地论坛替身：standin(posts, **kwargs) 返回 (StandinForum, 帖子 URL)，测试结束后关闭服务器。
+    爬虫的令牌桶、自适应并发与熔断状态按测试重新创建，退避时间缩短到毫秒级，测试不必等待真实的退避。
+    """
+    limiter = crawler_env.RateLimiter(rate=200.0)
+    monkeypatch.setattr(crawler_env, "REQUEST_RATE_MAX", 200.0)
+    monkeypatch.setattr(crawler_env, "RATE_LIMITER", limiter)
+    monkeypatch.setattr(crawler_env, "CONCURRENCY", crawler_env.AdaptiveConcurrency(limiter))
+    monkeypatch.setattr(crawler_env, "BREAKER", crawler_env.CircuitBreaker(cooldown=0.2))
+    monkeypatch.setattr(crawler_env, "BACKOFF_BASE_DELAY", 0.05)
+    monkeypatch.setattr(crawler_env, "RETRY_EXTRA_DELAY", 0.1)
+    forums = []
+
+    def start(posts, **kwargs):
+        forum = forum_standin.StandinForum(posts, **kwargs)
+        forums.append(forum)
+        return forum, forum.start()
+
+    yield start
+    for forum in forums:
+        forum.stop()
+
+
+def expected_message_ids(forum):
+    """替身帖子中应被抓到的全部消息 ID（与爬虫使用同一个解析器从 cooked 中提取）"""
+    return {str(r.message_id) for p in forum.posts for r in crawler.parse_chat_transcripts(p["cooked"])}
@@ -0,0 +1,81 @@
+# make_golden.py
+# 生成解析一致性测试（test_parser_conformance.py）使用的固定页面与标准输出：
+# pages/page_XX.html 为 forum_fixtures 的边界情况页面与合成楼层页；
+# golden/page_XX.csv 与 golden/titles.json 由基线提交（可插拔解析后端之前）中的原始实现生成：
+# parse_chat_transcripts → deduplicate_records → 按 crawl_post 原有的输出方式写 CSV，
+# 标题按 crawl_post 原有的方式取 soup.title.string（没有 <title> 时为“未命名”）。
+#
+# 用法（在仓库内运行，需要 git）：
+#   python backend/src/scripts/tests/fixtures/make_golden.py
+
+import csv
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BASELINE_COMMIT = "b4ceec4"
+BASELINE_PATH = "backend/src/scripts/extract_chat_from_forum.py"
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(HERE))
+PAGES_DIR = os.path.join(HERE, "pages")
+GOLDEN_DIR = os.path.join(HERE, "golden")
+SYNTHETIC_PAGES = 3
+
+
+def load_baseline(tmp):
+    """从 git 取出基线版本的爬虫脚本并作为独立模块导入"""
+    source = subprocess.run(
+        ["git", "show", f"{BASELINE_COMMIT}:{BASELINE_PATH}"], cwd=HERE, check=True, capture_output=True
+    ).stdout
+    path = os.path.join(tmp, "scripts", "baseline_extract.py")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("baseline_extract", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_baseline_csv(baseline, path, html):
+    """与基线 crawl_post 的输出部分相同：解析、去重，按原始字段写 CSV"""
+    records = baseline.deduplicate_records(baseline.parse_chat_transcripts(html))
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=["message_id", "username", "channel_name", "content", "created_at"])
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def baseline_title(baseline, html):
+    soup = baseline.BeautifulSoup(html, "html.parser")
+    return soup.title.string if soup.title else "未命名"
+
+
+def main():
+    sys.path.insert(0, SCRIPTS_DIR)
+    import forum_fixtures
+
+    pages = forum_fixtures.tricky_pages() + forum_fixtures.synthetic_pages(SYNTHETIC_PAGES)
+    os.makedirs(PAGES_DIR, exist_ok=True)
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    titles = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = load_baseline(tmp)
+        for i, html in enumerate(pages):
+            name = f"page_{i:02d}"
+            with open(os.path.join(PAGES_DIR, name + ".html"), "w", encoding="utf-8", newline="") as f:
+                f.write(html)
+            write_baseline_csv(baseline, os.path.join(GOLDEN_DIR, name + ".csv"), html)
+            titles[name] = baseline_title(baseline, html)
+    with open(os.path.join(GOLDEN_DIR, "titles.json"), "w", encoding="utf-8", newline="\n") as f:
+        json.dump(titles, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"已生成 {len(pages)} 个页面的标准输出：{GOLDEN_DIR}")
+
+
+if __name__ == "__main__":
+    main()
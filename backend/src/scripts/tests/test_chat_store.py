@@ -0,0 +1,56 @@
+# test_chat_store.py
+# ChatRecord 的 message_id 压缩规则：int64 范围内的纯数字存为 int，其余保留原文；ID "0" 与其他 ID 一样有效。
+
+import pytest
+
+from chat_store import ChatRecord, compact_message_id, read_csv_records
+from message_index import MessageIndex, message_int
+
+BIG = str(1 << 63)
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("0", 0),
+        ("12345", 12345),
+        (str((1 << 63) - 1), (1 << 63) - 1),
+        (BIG, BIG),
+        ("99999999999999999999999", "99999999999999999999999"),
+        ("007", "007"),
+        ("abc", "abc"),
+        ("²", "²"),
+        ("", ""),
+        (None, None),
+    ],
+)
+def test_compact_message_id(raw, expected):
+    assert compact_message_id(raw) == expected
+    assert type(compact_message_id(raw)) is type(expected)
+
+
+@pytest.mark.parametrize(
+    "mid, expected",
+    [("0", 0), (0, 0), ("42", 42), (1 << 63, None), (BIG, None), ("007", None), ("²", None), ("", None), (None, None)],
+)
+def test_message_int(mid, expected):
+    assert message_int(mid) == expected
+
+
+def test_index_commit_ignores_ids_beyond_int64(tmp_path):
+    (tmp_path / "a.csv").write_text("message_id\n", encoding="utf-8")
+    index = MessageIndex(data_dir=str(tmp_path))
+    assert index.commit("a", [ChatRecord.make(BIG, "", "", "", "").message_id, 1 << 64, "1"]) == 1
+    assert index.owner("1") == "a"
+    assert index.owner(BIG) is None
+
+
+def test_message_id_zero_is_kept(crawler_env, tmp_path):
+    records = [ChatRecord.make(mid, "alice", "c", "hi", "2025-08-01T00:00:00Z") for mid in ("0", "0", BIG, "")]
+    assert [r.message_id for r in crawler_env.deduplicate_records(records)] == [0, BIG]
+    assert crawler_env._ids_of(records) == {0, BIG}
+
+    writer = crawler_env.CsvStreamWriter(str(tmp_path / "out.csv"))
+    writer.add(1, records)
+    writer.close("测试")
+    assert [r["message_id"] for r in read_csv_records(str(tmp_path / "out.csv"))] == ["0", BIG]
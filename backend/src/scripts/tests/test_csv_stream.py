@@ -0,0 +1,121 @@
+# test_csv_stream.py
+# 流式 CSV 写出（CsvStreamWriter）：按楼层顺序写出乱序到达的楼层，close() 时原子发布，中途失败不影响已有文件。
+
+import importlib.util
+import os
+import sys
+
+import pytest
+from conftest import expected_message_ids
+
+import forum_fixtures
+import forum_standin
+from chat_store import ChatRecord, read_csv_records
+
+
+def floor_records(floor, per_floor=2):
+    return [
+        ChatRecord.make(str(floor * 10 + k), "alice", "c", f"第 {floor} 层", "2025-08-01T00:00:00Z")
+        for k in range(per_floor)
+    ]
+
+
+def test_out_of_order_floors_are_written_in_floor_order(crawler_env, tmp_path):
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    writer = crawler_env.CsvStreamWriter(str(out_dir / "out.csv"))
+    for floor in (3, 1, 5, 2, 4):
+        writer.add(floor, floor_records(floor))
+    writer.add(4, floor_records(4))  # 重复的楼层只写一次
+    writer.close("测试")
+    rows = read_csv_records(str(out_dir / "out.csv"))
+    assert [r["message_id"] for r in rows] == [str(f * 10 + k) for f in range(1, 6) for k in range(2)]
+    # 临时文件已改名为正式文件，旁边只多一个清单文件
+    assert sorted(os.listdir(out_dir)) == ["out.csv", "out.csv.manifest.json"]
+
+
+def test_failed_setup_leaves_no_temp_file(crawler_env, tmp_path, monkeypatch):
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    monkeypatch.setitem(sys.modules, "zstandard", None)  # 模拟未安装 zstandard
+    with pytest.raises(ImportError):
+        crawler_env.CsvStreamWriter(str(out_dir / "out.csv"), compression="zstd")
+
+    def broken(*args, **kwargs):
+        raise OSError("压缩流创建失败")
+
+    monkeypatch.setattr(crawler_env.gzip, "GzipFile", broken)
+    with pytest.raises(OSError):
+        crawler_env.CsvStreamWriter(str(out_dir / "out.csv"), compression="gzip")
+    assert os.listdir(out_dir) == []
+
+
+def test_overflow_writes_following_floors(crawler_env, tmp_path, monkeypatch):
+    monkeypatch.setattr(crawler_env, "CSV_REORDER_MAX_FLOORS", 2)
+    writer = crawler_env.CsvStreamWriter(str(tmp_path / "out.csv"))
+    for floor in (3, 4, 5):
+        writer.add(floor, floor_records(floor))
+    # 缓冲溢出时写出第 3 层，随后已连续的第 4、5 层也应立即写出，而不是继续占用缓冲
+    assert writer.written == 6
+    writer.add(2, floor_records(2))  # 迟到的楼层直接追加
+    writer.close("测试")
+    assert len(read_csv_records(str(tmp_path / "out.csv"))) == 8
+
+
+def test_plan_skips_floors_that_will_not_be_fetched(crawler_env, tmp_path):
+    writer = crawler_env.CsvStreamWriter(str(tmp_path / "out.csv"))
+    writer.add(1, floor_records(1))
+    writer.plan([21, 41])
+    writer.add(41, floor_records(41))
+    assert writer.written == 2
+    writer.add(21, floor_records(21))
+    assert writer.written == 6
+    writer.close("测试")
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [
+        "thread",
+        pytest.param(
+            "async", marks=pytest.mark.skipif(importlib.util.find_spec("aiohttp") is None, reason="未安装 aiohttp")
+        ),
+    ],
+)
+def test_crawl_publishes_floor_ordered_csv(crawler_env, standin, monkeypatch, engine):
+    crawler = crawler_env
+    monkeypatch.setattr(crawler, "CRAWL_ENGINE", engine)
+    monkeypatch.setattr(crawler, "FLOOR_STRIDE", "1")
+    # 随机延迟让楼层乱序完成
+    faults = forum_standin.Faults(latency=0.002, jitter=0.02, seed=1)
+    forum, url = standin(forum_fixtures.topic_posts(100, 2), faults=faults)
+    summary = crawler.crawl_post(url, report=False)
+    ids = [int(r["message_id"]) for r in read_csv_records(summary["output"])]
+    assert ids == sorted(ids)
+    assert {str(mid) for mid in ids} == expected_message_ids(forum)
+    assert not [name for name in os.listdir(crawler.INPUT_DIR) if name.endswith(".tmp")]
+
+
+def test_aborted_crawl_keeps_published_csv(crawler_env, standin, monkeypatch):
+    crawler = crawler_env
+    monkeypatch.setattr(crawler, "FLOOR_STRIDE", "1")
+    forum, url = standin(forum_fixtures.topic_posts(60, 2))
+    output = crawler.crawl_post(url, report=False)["output"]
+    with open(output, "rb") as f:
+        published = f.read()
+
+    add = crawler.CsvStreamWriter.add
+    added = []
+
+    def fail(self, floor, records):
+        added.append(floor)
+        if len(added) == 10:
+            raise RuntimeError("模拟写出中途失败")
+        add(self, floor, records)
+
+    monkeypatch.setattr(crawler.CsvStreamWriter, "add", fail)
+    with pytest.raises(RuntimeError):
+        crawler.crawl_post(url, report=False)
+    with open(output, "rb") as f:
+        assert f.read() == published
+    assert not [name for name in os.listdir(crawler.INPUT_DIR) if name.endswith(".tmp")]
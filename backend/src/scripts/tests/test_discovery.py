@@ -0,0 +1,49 @@
+# test_discovery.py
+# 楼层探测（_discovery_steps）：探测请求失败的楼层不能被当作空页 / 尾部。
+
+import pytest
+
+WINDOW = 20  # 每页显示的楼层数，与 Discourse 一致
+
+
+def page_ids(floor, floors):
+    """第 floor 层页面上的消息 ID：该层起的一屏楼层，超出楼层数时显示最后一屏"""
+    start = max(1, min(floor, floors - WINDOW + 1))
+    return {str(n) for n in range(start, min(start + WINDOW, floors + 1))}
+
+
+def discover(crawler, floors, fails=lambda floor, attempt: False):
+    """驱动探测生成器；fails(楼层, 第几次探测) 为真时该次探测按抓取失败（None）返回"""
+    attempts = {}
+    steps = crawler._discovery_steps()
+    try:
+        batch = next(steps)
+        while True:
+            results = {}
+            for floor in batch:
+                attempts[floor] = attempts.get(floor, 0) + 1
+                results[floor] = None if fails(floor, attempts[floor]) else page_ids(floor, floors)
+            batch = steps.send(results)
+    except StopIteration as stop:
+        return stop.value, attempts
+
+
+@pytest.mark.parametrize("floors", [37, 200, 1000])
+def test_discovery_without_failures(crawler_env, floors):
+    detected, _ = discover(crawler_env, floors)
+    assert detected == floors - WINDOW + 1
+
+
+@pytest.mark.parametrize("floors", [200, 1000])
+def test_transient_probe_failures_are_retried(crawler_env, floors):
+    detected, attempts = discover(crawler_env, floors, fails=lambda floor, attempt: floor > 1 and attempt == 1)
+    assert detected == floors - WINDOW + 1
+    assert all(n == 2 for floor, n in attempts.items() if floor > 1)
+
+
+@pytest.mark.parametrize("floors", [200, 1000])
+def test_persistent_probe_failures_are_not_the_tail(crawler_env, floors):
+    # 倍增序列上的 64、128 层始终抓取失败：不能据此把尾部判定在这两层之前
+    detected, attempts = discover(crawler_env, floors, fails=lambda floor, attempt: floor in (64, 128))
+    assert detected >= floors - WINDOW + 1
+    assert attempts[64] == crawler_env.DISCOVERY_PROBE_RETRIES + 1
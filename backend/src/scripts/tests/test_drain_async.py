@@ -0,0 +1,34 @@
+# test_drain_async.py
+# asyncio 调度循环（_drain_async）：任务异常按失败处理，退出时取消并等待剩余任务。
+
+import asyncio
+
+import pytest
+
+
+def test_failed_task_settles_as_none(crawler_env):
+    async def run(floor, attempt):
+        if floor == 2:
+            raise RuntimeError("boom")
+        return [floor]
+
+    settled = {}
+    asyncio.run(crawler_env._drain_async(crawler_env.RetryQueue([1, 2, 3]), run, settled.__setitem__, "测试"))
+    assert settled == {1: [1], 2: None, 3: [3]}
+
+
+def test_cancel_stops_and_awaits_remaining_tasks(crawler_env):
+    cleaned = []
+
+    async def run(floor, attempt):
+        if floor == 1:
+            await asyncio.sleep(0.01)
+            raise crawler_env.CrawlCancelled()
+        try:
+            await asyncio.sleep(60)
+        finally:
+            cleaned.append(floor)
+
+    with pytest.raises(crawler_env.CrawlCancelled):
+        asyncio.run(crawler_env._drain_async(crawler_env.RetryQueue([1, 2, 3]), run, lambda *_: None, "测试"))
+    assert sorted(cleaned) == [2, 3]
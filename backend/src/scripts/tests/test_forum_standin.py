@@ -0,0 +1,18 @@
+# test_forum_standin.py
+# 论坛替身的压测报告（run_load）：重复下载按每个 URL 首次之后的全部请求计，包括失败后的重试。
+
+import forum_fixtures
+import forum_standin
+
+
+def test_duplicate_downloads_count_failed_requests(crawler_env, standin, monkeypatch):
+    for name in ("CRAWL_ENGINE", "TRANSPORT", "FLOOR_STRIDE"):
+        monkeypatch.setattr(crawler_env, name, getattr(crawler_env, name))  # run_load 会改写，测试结束后还原
+    forum = forum_standin.StandinForum(
+        forum_fixtures.topic_posts(60, 2), faults=forum_standin.Faults(error_rate=0.2, seed=5)
+    )
+    report = forum_standin.run_load(forum, stride="1", rate=200.0, backoff=0.05)
+    assert report["missing_floors"] == 0
+    assert report["duplicate_downloads"] == sum(n - 1 for n in forum.fetches.values())
+    # 每个注入的 5xx 之后都要再请求一次同一个 URL
+    assert report["duplicate_downloads"] >= sum(report["injected"].values()) > 0
@@ -0,0 +1,128 @@
+# test_message_index.py
+# 跨帖子的已归档消息索引：先归档者优先、所属 CSV 不存在时不再算已归档、--message-index 默认关闭。
+
+import csv
+import os
+import threading
+
+from conftest import expected_message_ids
+
+import forum_fixtures
+from chat_store import read_csv_records
+from message_index import MessageIndex
+
+
+def write_csv(path, ids):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["message_id", "username", "channel_name", "content", "created_at"])
+        writer.writerows([mid, "alice", "c", "hi", "2025-08-01T00:00:00Z"] for mid in ids)
+
+
+def test_commit_keeps_first_owner(tmp_path):
+    index = MessageIndex(data_dir=str(tmp_path))
+    write_csv(tmp_path / "a.csv", ["1", "2"])
+    index.commit("a", ["1", "2"])
+    write_csv(tmp_path / "b.csv", ["2", "3"])
+    assert index.commit("b", ["2", "3"]) == 1
+    assert index.owner("2") == "a"
+    assert index.known_elsewhere("2", "b")
+    assert not index.known_elsewhere("2", "a")
+    assert not index.known_elsewhere("abc", "b")  # 非纯数字 ID 不进入索引
+
+    reloaded = MessageIndex(data_dir=str(tmp_path))
+    assert reloaded.load()
+    assert reloaded.counts() == {"a": 2, "b": 1}
+
+
+def test_entries_of_deleted_csv_are_dropped(tmp_path):
+    write_csv(tmp_path / "a.csv", ["1", "2"])
+    write_csv(tmp_path / "b.csv", ["3"])
+    index = MessageIndex(data_dir=str(tmp_path))
+    index.rebuild()
+    os.remove(tmp_path / "a.csv")
+    assert index.prune_missing() == 2
+    assert not index.known_elsewhere("1", "b")
+    assert index.prune_missing() == 0
+
+    # 已清理的结果写回了索引文件；之后重新归档这些消息的 CSV 成为新的所属
+    reloaded = MessageIndex(data_dir=str(tmp_path))
+    assert reloaded.load()
+    assert reloaded.counts() == {"b": 1}
+    write_csv(tmp_path / "c.csv", ["1", "2"])
+    assert reloaded.commit("c", ["1", "2"]) == 2
+    assert reloaded.owner("1") == "c"
+
+
+def test_owner_is_consistent_while_another_thread_commits(tmp_path):
+    # a 的消息 ID 是偶数；b 反复替换为长短不同、与 a 交错的奇数 ID，每次提交都重建 ids / owner_ids
+    index = MessageIndex(data_dir=str(tmp_path))
+    a_ids = [str(i) for i in range(0, 4000, 2)]
+    write_csv(tmp_path / "a.csv", a_ids)
+    write_csv(tmp_path / "b.csv", ["1"])
+    index.commit("a", a_ids)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not stop.is_set():
+                for mid in a_ids[::7]:
+                    owner = index.owner(mid)
+                    if owner != "a":
+                        errors.append((mid, owner))
+                        return
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    try:
+        for n in range(30):
+            index.commit("b", [str(i) for i in range(1, 4000 if n % 2 else 400, 2)])
+    finally:
+        stop.set()
+        for t in readers:
+            t.join()
+    assert not errors
+    assert index.counts() == {"a": 2000, "b": 2000}
+
+
+def overlapping_topics(standin):
+    """月度帖（1 ~ 40 层）与跨月帖：跨月帖的前 20 层与月度帖的 21 ~ 40 层是同一批消息"""
+    posts = forum_fixtures.topic_posts(60, 2)
+    monthly = standin(posts[:40], title="六度世界聊天区202507 总备份", topic_id=1)
+    ranged = [dict(p, post_number=p["post_number"] - 20) for p in posts[20:]]
+    return monthly, standin(ranged, title="六度世界聊天区202506-202507 总备份", topic_id=2)
+
+
+def crawl_ids(crawler, url):
+    return {r["message_id"] for r in read_csv_records(crawler.crawl_post(url, report=False)["output"])}
+
+
+def test_index_is_off_by_default(crawler_env, standin):
+    assert crawler_env.MESSAGE_INDEX_ENABLED is False
+    (_, monthly_url), (_, ranged_url) = overlapping_topics(standin)
+    assert len(crawl_ids(crawler_env, monthly_url) & crawl_ids(crawler_env, ranged_url)) == 40
+
+
+def test_crawl_skips_messages_archived_elsewhere(crawler_env, standin, monkeypatch):
+    crawler = crawler_env
+    monkeypatch.setattr(crawler, "MESSAGE_INDEX_ENABLED", True)
+    monkeypatch.setattr(crawler, "_MESSAGE_INDEXES", {})
+    (_, monthly_url), (ranged, ranged_url) = overlapping_topics(standin)
+
+    monthly_ids = crawl_ids(crawler, monthly_url)
+    ranged_ids = crawl_ids(crawler, ranged_url)
+    assert len(monthly_ids) == 80
+    assert not monthly_ids & ranged_ids
+    assert len(ranged_ids) == 40
+
+    # 重新抓取同一个帖子：它自己的消息不算已归档
+    assert crawl_ids(crawler, monthly_url) == monthly_ids
+
+    # 删除月度帖的 CSV 后，跨月帖重新抓取时写出全部消息
+    monthly_csv = crawler.output_path_for_title("六度世界聊天区202507 总备份")
+    os.remove(monthly_csv)
+    assert crawl_ids(crawler, ranged_url) == expected_message_ids(ranged)
@@ -0,0 +1,47 @@
+# test_parser_conformance.py
+# 解析后端一致性：每个后端解析 fixtures/pages 中的固定页面并经 CsvStreamWriter 写出，
+# 结果须与基线实现（可插拔解析后端之前的 bs4 整棵文档树）生成的 fixtures/golden 逐字节相同。
+# 固定页面与标准输出由 fixtures/make_golden.py 生成。
+
+import importlib.util
+import json
+import os
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+PAGES = sorted(name[: -len(".html")] for name in os.listdir(os.path.join(FIXTURES, "pages")))
+BACKENDS = [
+    "bs4",
+    "strainer",
+    pytest.param("lxml", marks=pytest.mark.skipif(importlib.util.find_spec("lxml") is None, reason="未安装 lxml")),
+    "auto",
+]
+
+
+def read_page(name):
+    with open(os.path.join(FIXTURES, "pages", name + ".html"), encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", PAGES)
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_csv_matches_baseline(crawler_env, tmp_path, backend, name):
+    records = crawler_env.parse_chat_transcripts(read_page(name), backend=backend)
+    writer = crawler_env.CsvStreamWriter(str(tmp_path / "out.csv"))
+    writer.add(1, records)
+    writer.close(name)
+    assert read_bytes(tmp_path / "out.csv") == read_bytes(os.path.join(FIXTURES, "golden", name + ".csv"))
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_title_matches_baseline(crawler_env, name):
+    with open(os.path.join(FIXTURES, "golden", "titles.json"), encoding="utf-8") as f:
+        expected = json.load(f)[name]
+    # 基线在 <title> 为空或含标签时得到 None（随后生成文件名时出错），现在回退为“未命名”
+    assert crawler_env.page_title(read_page(name)) == (expected if expected is not None else "未命名")
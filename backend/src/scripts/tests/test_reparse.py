@@ -0,0 +1,29 @@
+# test_reparse.py
+# 页面归档与离线重建（--archive / --reparse）：重建的 CSV 与抓取时写出的逐字节相同，且不发出任何请求。
+
+import os
+
+import pytest
+
+import forum_fixtures
+
+
+@pytest.mark.parametrize("transport, stride", [("html", "auto"), ("html", "1"), ("json", "auto")])
+def test_reparse_is_byte_identical(crawler_env, standin, monkeypatch, transport, stride):
+    crawler = crawler_env
+    monkeypatch.setattr(crawler, "ARCHIVE_PAGES", True)
+    monkeypatch.setattr(crawler, "TRANSPORT", transport)
+    monkeypatch.setattr(crawler, "FLOOR_STRIDE", stride)
+    monkeypatch.setattr(crawler, "PARSE_PROCESSES", 1)
+    forum, url = standin(forum_fixtures.topic_posts(90, 3, deleted=(17, 18)))
+
+    output = crawler.crawl_post(url, report=False)["output"]
+    with open(output, "rb") as f:
+        crawled = f.read()
+    os.remove(output)
+
+    forum.reset()
+    crawler.reparse_archives()
+    assert sum(forum.requests.values()) == 0
+    with open(output, "rb") as f:
+        assert f.read() == crawled
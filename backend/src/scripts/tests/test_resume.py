@@ -0,0 +1,59 @@
+# test_resume.py
+# 断点续抓（--resume）：中断后重新运行只抓尚未完成的楼层，输出与一次抓完相同，完成后删除断点日志。
+
+import importlib.util
+import os
+from urllib.parse import urlsplit
+
+import pytest
+from conftest import expected_message_ids
+
+import forum_fixtures
+from chat_store import read_csv_records
+
+ENGINES = [
+    "thread",
+    pytest.param("async", marks=pytest.mark.skipif(importlib.util.find_spec("aiohttp") is None, reason="未安装 aiohttp")),
+]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_resume_skips_journaled_floors(crawler_env, standin, monkeypatch, engine):
+    crawler = crawler_env
+    monkeypatch.setattr(crawler, "CRAWL_ENGINE", engine)
+    monkeypatch.setattr(crawler, "FLOOR_STRIDE", "1")
+    forum, url = standin(forum_fixtures.topic_posts(80, 3))
+
+    # 第一次运行：记录到第 20 个楼层时模拟 Ctrl+C
+    record_floor = crawler.CrawlJournal.record_floor
+    recorded = []
+
+    def interrupt(self, floor, records, window=None):
+        record_floor(self, floor, records, window)
+        recorded.append(floor)
+        if len(recorded) == 20:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(crawler.CrawlJournal, "record_floor", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        crawler.crawl_post(url, report=False)
+    monkeypatch.setattr(crawler.CrawlJournal, "record_floor", record_floor)
+
+    journal = crawler.CrawlJournal(url)
+    state = journal.load()
+    assert state is not None and state["max_floor"] is not None
+    assert sorted(state["floors"]) == sorted(recorded)
+    assert not [name for name in os.listdir(crawler.INPUT_DIR) if name.endswith(".csv")]
+
+    # 第二次运行：--resume，不再探测，也不再请求日志中已完成的楼层
+    monkeypatch.setattr(crawler, "RESUME", True)
+    forum.reset()
+    summary = crawler.crawl_post(url, report=False)
+
+    fetched = {urlsplit(crawler.floor_url(url, floor)).path for floor in state["floors"]}
+    assert not fetched & set(forum.downloads)
+    assert sum(forum.requests.values()) == state["max_floor"] - len(state["floors"])
+
+    rows = read_csv_records(summary["output"])
+    assert sorted(r["message_id"] for r in rows) == sorted(expected_message_ids(forum))
+    assert not os.path.exists(journal.path)
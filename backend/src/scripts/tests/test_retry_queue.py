@@ -0,0 +1,83 @@
+# test_retry_queue.py
+# 楼层重试调度（RetryQueue）：替身注入错误与截断响应时逐层抓取仍完整，反复失败的楼层请求 FLOOR_MAX_ATTEMPTS 次后记为缺失。
+
+import importlib.util
+from urllib.parse import urlsplit
+
+import pytest
+from conftest import expected_message_ids
+
+import forum_fixtures
+import forum_standin
+from chat_store import read_csv_records
+
+ENGINES = [
+    "thread",
+    pytest.param("async", marks=pytest.mark.skipif(importlib.util.find_spec("aiohttp") is None, reason="未安装 aiohttp")),
+]
+
+
+def _crawl(crawler, monkeypatch, engine, url):
+    monkeypatch.setattr(crawler, "CRAWL_ENGINE", engine)
+    monkeypatch.setattr(crawler, "FLOOR_STRIDE", "1")
+    return crawler.crawl_post(url, report=False)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_faults_are_retried_until_complete(crawler_env, standin, monkeypatch, engine):
+    faults = forum_standin.Faults(error_rate=0.15, truncate_rate=0.05, seed=7)
+    forum, url = standin(forum_fixtures.topic_posts(60, 3), faults=faults)
+
+    summary = _crawl(crawler_env, monkeypatch, engine, url)
+
+    assert sum(forum.injected.values()) > 0
+    assert summary["missing"] == 0
+    rows = read_csv_records(summary["output"])
+    assert sorted(r["message_id"] for r in rows) == sorted(expected_message_ids(forum))
+    floors = [path for path in forum.fetches if urlsplit(path).path.startswith("/t/topic/")]
+    assert max(forum.fetches[path] for path in floors) <= crawler_env.FLOOR_MAX_ATTEMPTS
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_failing_floor_is_exhausted_without_blocking_others(crawler_env, standin, monkeypatch, engine):
+    monkeypatch.setattr(crawler_env, "BACKOFF_MAX_DELAY", 0.2)  # 熔断冷却翻倍的上限，避免测试等待过久
+    bad_path = "/t/topic/1/7"
+    forum, url = standin(forum_fixtures.topic_posts(40, 3), faults=forum_standin.Faults(fail_paths=[bad_path]))
+    assert urlsplit(crawler_env.floor_url(url, 7)).path == bad_path
+
+    summary = _crawl(crawler_env, monkeypatch, engine, url)
+
+    assert forum.fetches[bad_path] == crawler_env.FLOOR_MAX_ATTEMPTS
+    assert summary["missing"] == 1
+    # 同一页的其他楼层抓到了坏楼层所在的整页消息，输出仍然完整
+    rows = read_csv_records(summary["output"])
+    assert sorted(r["message_id"] for r in rows) == sorted(expected_message_ids(forum))
+
+
+def test_session_is_borrowed_only_for_the_request(crawler_env, standin, monkeypatch):
+    pool = crawler_env.SessionPool(size=2)
+    monkeypatch.setattr(crawler_env, "SESSION_POOL", pool)
+    forum, url = standin(forum_fixtures.topic_posts(20, 3), faults=forum_standin.Faults(error_rate=1.0))
+
+    held_while_waiting = []
+
+    def borrowed():
+        return pool._created - pool._idle.qsize()
+
+    acquire = crawler_env.RATE_LIMITER.acquire
+    sleep = crawler_env.cancellable_sleep
+
+    def watched_acquire(*args, **kwargs):
+        held_while_waiting.append(borrowed())
+        return acquire(*args, **kwargs)
+
+    def watched_sleep(*args, **kwargs):
+        held_while_waiting.append(borrowed())
+        return sleep(*args, **kwargs)
+
+    monkeypatch.setattr(crawler_env.RATE_LIMITER, "acquire", watched_acquire)
+    monkeypatch.setattr(crawler_env, "cancellable_sleep", watched_sleep)
+
+    assert crawler_env.fetch_page(crawler_env.floor_url(url, 1)) is None
+    assert len(held_while_waiting) >= crawler_env.MAX_RETRIES
+    assert not any(held_while_waiting)
@@ -21,6 +21,7 @@ app.use(express.json());
 app.use('/api/available-dates', availableDatesRouter);
 app.use('/api', digestRouter);
 app.use('/api/crawler', crawlerRouter);
+app.use('/api/crawl', crawlerRouter); // 前端与 README 使用的路径
 
 // 确保关键目录存在
 const ensureDir = (dirPath) => {
@@ -1,6 +1,8 @@
 // backend/src/utils/csvLoader.js
 import fs from 'fs';
 import path from 'path';
+import { pipeline } from 'stream';
+import zlib from 'zlib';
 import csv from 'csv-parser';
 import dayjs from 'dayjs';
 import utc from 'dayjs/plugin/utc.js';
@@ -37,6 +39,47 @@ function parseToUtc(raw) {
     return d2.isValid() ? dayjs.utc(d2) : null;
 }
 
+/** 爬虫输出的 CSV：.csv，或 --compress 生成的 .csv.gz / .csv.zst（写入中的 .tmp 临时文件不算） */
+export function isCsvFile(name) {
+    return /\.csv(\.gz|\.zst)?$/i.test(name);
+}
+
+/**
+ * 打开 CSV 文件流，压缩文件自动解压（.zst 需要 Node 自带 zstd 支持，不支持时跳过该文件）。
+ * 解压流用 pipeline 接在文件流之后：文件读取出错（例如在 stat 与打开之间被发布替换或删除）时
+ * 错误转发到返回的流上，调用方的 'error' 处理照常触发。
+ */
+export function openCsvStream(filePath) {
+    const stream = fs.createReadStream(filePath);
+    const lower = filePath.toLowerCase();
+    const decompress = (decompressor) => pipeline(stream, decompressor, () => {});
+    if (lower.endsWith('.gz')) return decompress(zlib.createGunzip());
+    if (lower.endsWith('.zst')) {
+        if (typeof zlib.createZstdDecompress !== 'function') {
+            console.warn(`[csvLoader] 当前 Node 版本不支持 zstd，跳过 ${path.basename(filePath)}`);
+            stream.destroy();
+            return null;
+        }
+        return decompress(zlib.createZstdDecompress());
+    }
+    return stream;
+}
+
+/**
+ * 读取 CSV 旁边的清单（<文件名>.manifest.json，由爬虫或 csv_manifest.py 生成）。
+ * 只有文件大小与修改时间都和清单记录一致时才返回，否则视为过期返回 null。
+ */
+export function readFreshManifest(filePath) {
+    try {
+        const manifest = JSON.parse(fs.readFileSync(`${filePath}.manifest.json`, 'utf8'));
+        const stat = fs.statSync(filePath);
+        if (manifest.size !== stat.size || manifest.mtime_ms !== Math.floor(stat.mtimeMs)) return null;
+        return manifest;
+    } catch {
+        return null;
+    }
+}
+
 /**
  * @param {Object} options
  * @param {string} [options.channel]  包含匹配（仅当 CSV 有频道列时）
@@ -47,7 +90,7 @@ function parseToUtc(raw) {
 export async function loadChatRecords({ channel, user, from, to } = {}) {
     if (!fs.existsSync(DATA_DIR)) return [];
 
-    const files = fs.readdirSync(DATA_DIR).filter(f => f.toLowerCase().endsWith('.csv'));
+    const files = fs.readdirSync(DATA_DIR).filter(isCsvFile);
 
     const fromUtc = from ? dayjs.utc(from, 'YYYY-MM-DD', true).startOf('day') : null;
     const toUtc = to ? dayjs.utc(to, 'YYYY-MM-DD', true).endOf('day') : null;
@@ -56,8 +99,11 @@ export async function loadChatRecords({ channel, user, from, to } = {}) {
 
     for (const file of files) {
         const filePath = path.join(DATA_DIR, file);
+        const input = openCsvStream(filePath);
+        if (!input) continue;
         await new Promise((resolve, reject) => {
-            fs.createReadStream(filePath)
+            input
+                .on('error', reject)
                 .pipe(csv())
                 .on('data', (row) => {
                     try {
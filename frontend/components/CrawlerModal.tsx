@@ -1,14 +1,121 @@
 "use client";
 
-import { useState } from "react";
+import { useEffect, useRef, useState } from "react";
+
+// 爬虫进程输出的进度事件（extract_chat_from_forum.py --events jsonl）
+type CrawlEvent = {
+  type: string;
+  topic?: string | null;
+  stage?: string;
+  done?: number | boolean;
+  total?: number;
+  messages?: number;
+  eta_seconds?: number | null;
+  probes?: number;
+  highest_with_messages?: number;
+  round?: number;
+  missing?: number;
+  output?: string;
+  reason?: string;
+  status?: string;
+  position?: number;
+};
+
+function formatEta(seconds?: number | null) {
+  if (seconds == null) return "";
+  const m = Math.floor(seconds / 60);
+  const s = Math.round(seconds % 60);
+  return m ? `，预计剩余 ${m} 分 ${s} 秒` : `，预计剩余 ${s} 秒`;
+}
+
+function describe(e: CrawlEvent): string | null {
+  switch (e.type) {
+    case "discovery":
+      return e.done === true
+        ? "楼层探测完成"
+        : `正在探测楼层数：已探测 ${e.probes} 页，最远有消息的楼层 ${e.highest_with_messages}`;
+    case "progress": {
+      const total = e.total || 0;
+      const done = Number(e.done) || 0;
+      const pct = total ? Math.floor((done / total) * 100) : 100;
+      return `${e.stage} ${done}/${total}（${pct}%），已写出 ${e.messages} 条消息${formatEta(e.eta_seconds)}`;
+    }
+    case "supplement":
+      return `第 ${e.round} 轮补抓，缺失 ${e.missing} 个楼层`;
+    case "output":
+      return `✅ 已保存 ${e.output}（${e.messages} 条消息）`;
+    case "topic_failed":
+      return `❌ ${e.reason}`;
+    case "job_queued":
+      return e.position && e.position > 1 ? `排队中，前面还有 ${e.position - 1} 个任务` : null;
+    case "job_started":
+      return "爬虫已开始运行";
+    case "job_finished":
+      if (e.status === "finished") return "✅ 爬取完成";
+      if (e.status === "cancelled") return "⏹️ 已停止，再次爬取同一链接会从断点继续";
+      return "❌ 爬取失败" + (e.reason ? `：${e.reason}` : "");
+    default:
+      return null;
+  }
+}
 
 export default function CrawlerModal({ open, onClose }: { open: boolean; onClose: () => void }) {
   const [url, setUrl] = useState("");
   const [loading, setLoading] = useState(false);
   const [message, setMessage] = useState("");
+  const [progress, setProgress] = useState("");
+  const [jobId, setJobId] = useState<string | null>(null);
+  // 用户停止过的帖子链接：只有再次爬取这个链接时才从断点继续，
+  // 其他情况都重新探测楼层，不会沿用旧断点日志中的最大楼层而漏掉之后新增的楼层
+  const [stoppedUrl, setStoppedUrl] = useState<string | null>(null);
+  const jobUrlRef = useRef<string | null>(null);
+  const sourceRef = useRef<EventSource | null>(null);
+
+  useEffect(() => () => sourceRef.current?.close(), []);
+
+  const follow = (id: string) => {
+    sourceRef.current?.close();
+    setJobId(id);
+    const source = new EventSource(`/api/crawl/jobs/${id}/events`);
+    sourceRef.current = source;
+    const onEvent = (ev: MessageEvent) => {
+      const e: CrawlEvent = JSON.parse(ev.data);
+      const text = describe(e);
+      if (!text) return;
+      if (e.type === "output" || e.type === "topic_failed") setMessage(text);
+      else setProgress(text);
+      if (e.type === "job_finished") {
+        setStoppedUrl(e.status === "cancelled" ? jobUrlRef.current : null);
+        source.close();
+        setLoading(false);
+        setJobId(null);
+      }
+    };
+    const types = ["job_queued", "job_started", "discovery", "progress", "supplement", "output", "topic_failed", "job_finished"];
+    for (const type of types) {
+      source.addEventListener(type, onEvent as EventListener);
+    }
+    source.onerror = () => {
+      source.close();
+      setLoading(false);
+      setJobId(null);
+    };
+  };
+
+  // 停止正在进行的任务：已抓取的楼层保存在断点日志中，再次爬取同一链接时带 resume 继续
+  const handleStop = async () => {
+    if (!jobId) return;
+    try {
+      await fetch(`/api/crawl/jobs/${jobId}/cancel`, { method: "POST" });
+      setProgress("正在停止...");
+    } catch (err) {
+      setMessage("❌ 请求失败：" + err);
+    }
+  };
 
   const handleCrawl = async () => {
-    if (!url.trim()) {
+    const target = url.trim();
+    if (!target) {
       setMessage("请输入要抓取的帖子链接");
       return;
     }
@@ -19,11 +126,16 @@ export default function CrawlerModal({ open, onClose }: { open: boolean; onClose
       const res = await fetch("/api/crawl", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ url }),
+        body: JSON.stringify({ url: target, resume: target === stoppedUrl }),
       });
       const data = await res.json();
-      if (data.ok) setMessage("✅ 爬虫已启动，请等待 CSV 文件生成");
-      else setMessage("❌ 启动失败：" + data.error);
+      if (data.ok) {
+        jobUrlRef.current = target;
+        setStoppedUrl(null);
+        setMessage("✅ 任务已提交，请等待 CSV 文件生成");
+        setProgress("");
+        if (data.jobId) return follow(data.jobId); // 进程结束时恢复按钮
+      } else setMessage("❌ 启动失败：" + data.error);
     } catch (err) {
       setMessage("❌ 请求失败：" + err);
     }
@@ -45,11 +157,17 @@ export default function CrawlerModal({ open, onClose }: { open: boolean; onClose
         />
         <div className="flex justify-end space-x-3">
           <button onClick={onClose} className="px-4 py-2 bg-gray-200 rounded-lg">取消</button>
+          {jobId && (
+            <button onClick={handleStop} className="px-4 py-2 bg-gray-200 rounded-lg">
+              停止爬取
+            </button>
+          )}
           <button onClick={handleCrawl} disabled={loading} className="px-4 py-2 bg-blue-600 text-white rounded-lg">
             {loading ? "执行中..." : "开始爬取"}
           </button>
         </div>
         {message && <p className="mt-3 text-sm text-gray-600">{message}</p>}
+        {progress && <p className="mt-1 text-sm text-gray-500">{progress}</p>}
       </div>
     </div>
   );